@@ -1,30 +1,61 @@
 import streamlit as st
+import logging
 import sys
 import os
-from pathlib import Path
-import requests
-from PIL import Image
-from io import BytesIO
 import time
+from pathlib import Path
 
 # Add project root to Python path
 project_root = str(Path(__file__).parent.parent)
 sys.path.append(project_root)
 
 from chatbot.bot import ChatSession
+from chatbot.retriver.prompts import ERROR_RESPONSE
+from utils.config import Config
+from utils.image_cache import get_image_cache
+from utils.logging import setup_logging
+from utils.tracing import span
+
+# Queued JSON logging; repeated calls on Streamlit reruns are no-ops
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # Initialize session state for chat history
 if 'chat_session' not in st.session_state:
     st.session_state.chat_session = ChatSession()
 if 'messages' not in st.session_state:
     st.session_state.messages = []
+# Older turns the user has expanded, and how many product cards each message shows
+if 'expanded_turns' not in st.session_state:
+    st.session_state.expanded_turns = set()
+if 'cards_shown' not in st.session_state:
+    st.session_state.cards_shown = {}
+if 'summaries_shown' not in st.session_state:
+    st.session_state.summaries_shown = Config.HISTORY_SUMMARY_PAGE
 
 def clear_chat_history():
     """Clear the chat history and reset the chat session"""
     st.session_state.messages = []
+    st.session_state.expanded_turns = set()
+    st.session_state.cards_shown = {}
+    st.session_state.summaries_shown = Config.HISTORY_SUMMARY_PAGE
     st.session_state.chat_session = ChatSession()
     st.rerun()
 
+def toggle_turn(index):
+    st.session_state.expanded_turns ^= {index}
+
+def show_earlier_turns():
+    st.session_state.summaries_shown += Config.HISTORY_SUMMARY_PAGE
+
+def show_more_cards(index):
+    shown = st.session_state.cards_shown.get(index, Config.PRODUCT_CARDS_PER_PAGE)
+    st.session_state.cards_shown[index] = shown + Config.PRODUCT_CARDS_PER_PAGE
+
+def shorten(text, width=160):
+    text = " ".join(str(text).split())
+    return text if len(text) <= width else text[:width - 1].rstrip() + "…"
+
 # Page config
 st.set_page_config(
     page_title="Cheese Expert Assistant",
@@ -44,19 +75,21 @@ st.markdown("Ask me anything about cheese products!")
 # Chat container
 chat_container = st.container()
 
+# Product images are served from a local thumbnail cache shared by all sessions
+image_cache = get_image_cache()
+
 def display_product_details(product):
     """Display product details in a structured format"""
     col1, col2 = st.columns([0.4, 0.6])
     
     with col1:
         if "image_url" in product and product["image_url"] != "N/A":
-            try:
-                img_response = requests.get(product["image_url"])
-                if img_response.status_code == 200:
-                    image = Image.open(BytesIO(img_response.content))
-                    st.image(image, use_container_width=True)
-            except Exception as e:
-                st.error(f"Error loading image: {str(e)}")
+            # Cached thumbnails are read from disk; a miss waits for its prefetch or downloads it once
+            thumbnail = image_cache.thumbnail(product["image_url"])
+            if thumbnail:
+                st.image(thumbnail, use_container_width=True)
+            else:
+                st.caption("Image unavailable")
     
     with col2:
         # Product details
@@ -82,24 +115,83 @@ def display_product_details(product):
         if "description" in product and product["description"]:
             with st.expander("Product Description"):
                 st.write(product["description"])
-        
 
+def display_products(products, index):
+    """Product cards for the message at index, a page at a time"""
+    shown = st.session_state.cards_shown.get(index, Config.PRODUCT_CARDS_PER_PAGE)
+    st.markdown("---")
+    st.markdown("### Suggested Products")
+    for product in products[:shown]:
+        display_product_details(product)
+        st.markdown("---")
+    remaining = len(products) - shown
+    if remaining > 0:
+        st.button(
+            f"Show {min(remaining, Config.PRODUCT_CARDS_PER_PAGE)} more products ({remaining} not shown)",
+            key=f"more_cards_{index}", on_click=show_more_cards, args=(index,)
+        )
+
+def display_turn_summary(messages, index):
+    """One line for an older question and its answer; expanding it renders the turn in full"""
+    question = messages[index]["content"]
+    reply = messages[index + 1] if index + 1 < len(messages) else {}
+    products = len(reply.get("context") or [])
+    with st.container(border=True):
+        col_text, col_button = st.columns([0.85, 0.15])
+        col_text.markdown(
+            f"**{shorten(question, 100)}**  \n{shorten(reply.get('content', ''))}"
+            + (f" · {products} products" if products else "")
+        )
+        col_button.button("Expand", key=f"expand_{index}", on_click=toggle_turn, args=(index,))
+
+def display_history(messages):
+    """
+    Render the chat history: the last Config.HISTORY_FULL_TURNS turns in full,
+    the summaries_shown turns before them as summaries unless expanded, and
+    nothing of earlier turns but a button, so page time does not grow with
+    the length of the conversation.
+    """
+    questions = [i for i, message in enumerate(messages) if message["role"] == "user"]
+    full_turns = Config.HISTORY_FULL_TURNS
+    # Index of the first message rendered in full (0 renders every turn)
+    full_from = questions[-full_turns] if full_turns and len(questions) > full_turns else 0
+    older = [i for i in questions if i < full_from]
+    hidden = older[:-st.session_state.summaries_shown] if st.session_state.summaries_shown else []
+    if hidden:
+        st.button(
+            f"Show {min(len(hidden), Config.HISTORY_SUMMARY_PAGE)} earlier questions ({len(hidden)} hidden)",
+            key="show_earlier", on_click=show_earlier_turns
+        )
+    turn_start = 0
+    for i, message in enumerate(messages):
+        if message["role"] == "user":
+            turn_start = i
+        if hidden and turn_start <= hidden[-1]:
+            continue
+        if turn_start < full_from and turn_start not in st.session_state.expanded_turns:
+            if i == turn_start:
+                display_turn_summary(messages, i)
+            continue
 
-# Display chat history
-with chat_container:
-    for message in st.session_state.messages:
         if message["role"] == "user":
+            if turn_start < full_from:
+                st.button("Collapse", key=f"collapse_{i}", on_click=toggle_turn, args=(i,))
             st.chat_message("user").write(message["content"])
         else:
             with st.chat_message("assistant"):
                 st.write(message["content"])
                 # Display product details if available
                 if "context" in message and message["context"]:
-                    st.markdown("---")
-                    st.markdown("### Suggested Products")
-                    for product in message["context"]:
-                        display_product_details(product)
-                        st.markdown("---")
+                    display_products(message["context"], i)
+
+
+
+# Display chat history
+with chat_container:
+    render_start = time.perf_counter()
+    with span('app.render_history', messages=len(st.session_state.messages)):
+        display_history(st.session_state.messages)
+    st.session_state.history_render_ms = (time.perf_counter() - render_start) * 1000
 
 # Input area
 st.markdown("---")  # Add a separator
@@ -115,28 +207,32 @@ if user_input:
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
         full_response = ""
+        response = None
         
-        # Get bot response with streaming
-        response = st.session_state.chat_session.ask(user_input)
+        # Render model tokens as they arrive
+        try:
+            for event in st.session_state.chat_session.ask_stream(user_input):
+                if event["type"] == "context":
+                    # Start downloading the first page of card images while the answer streams
+                    image_cache.prefetch_products(event["context"][:Config.PRODUCT_CARDS_PER_PAGE])
+                elif event["type"] == "chunk":
+                    full_response += event["content"]
+                    message_placeholder.write(full_response + "▌")
+                elif event["type"] == "final":
+                    response = event
+        except Exception as e:
+            # ask_stream answers upstream failures itself; this covers retrieval errors before the answer
+            logger.error(f"Error answering question: {str(e)}")
+            full_response = full_response or ERROR_RESPONSE
+            response = {"answer": full_response, "context": []}
         
-        # Stream the response
         if isinstance(response, dict) and "answer" in response:
-            answer = response["answer"]
-            for chunk in answer.split():
-                full_response += chunk + " "
-                message_placeholder.write(full_response + "▌")
-                time.sleep(0.05)  # Add a small delay for visual effect
-            
             # Display the final response
             message_placeholder.write(full_response)
             
-            # Display product details if available
+            # Display product details if available; the message is stored at this index below
             if "context" in response and response["context"]:
-                st.markdown("---")
-                st.markdown("### Suggested Products")
-                for product in response["context"]:
-                    display_product_details(product)
-                    st.markdown("---")
+                display_products(response["context"], len(st.session_state.messages))
 
             # Add bot response to chat history
             st.session_state.messages.append({
@@ -145,4 +241,9 @@ if user_input:
                 "context": response.get("context", [])
             })
         else:
-            st.error("Error: Unexpected response format from chatbot")
\ No newline at end of file
+            st.error("Error: Unexpected response format from chatbot")
+
+st.sidebar.caption(
+    f"History rendered in {st.session_state.history_render_ms:.0f} ms "
+    f"({len(st.session_state.messages)} messages)"
+)
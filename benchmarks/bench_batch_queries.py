@@ -0,0 +1,137 @@
+"""
+Throughput of VectorStore.query_products_batch against one-at-a-time query_products.
+
+A synthetic local index is written to a temporary directory and the OpenAI
+client is replaced by a fake that sleeps a fixed latency per embedding
+request, so the numbers show what batching saves in round trips. With
+--remote-latency-ms the index is wrapped in a stand-in that sleeps per query
+like a hosted Pinecone index, exercising the concurrent search path instead
+of the matrix-matrix one. Query texts are unique and the embedding cache is
+kept in memory, so every run starts cold.
+
+Usage:
+    python benchmarks/bench_batch_queries.py --queries 2000 --rows 100000 --latency-ms 50
+    python benchmarks/bench_batch_queries.py --queries 500 --remote-latency-ms 30
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+
+def fake_embedding(text: str, dimension: int) -> List[float]:
+    seed = int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).standard_normal(dimension).astype(np.float32).tolist()
+
+
+class FakeOpenAI:
+    """Just enough of OpenAI for embeddings, with a fixed latency per request"""
+
+    def __init__(self, latency: float, dimension: int):
+        self.latency = latency
+        self.dimension = dimension
+        self.requests = 0
+        self.embeddings = SimpleNamespace(create=self._embed)
+
+    def _embed(self, model, input, **kwargs):
+        self.requests += 1
+        time.sleep(self.latency)
+        texts = [input] if isinstance(input, str) else input
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=fake_embedding(text, self.dimension)) for i, text in enumerate(texts)
+        ])
+
+    def close(self):
+        pass
+
+
+class RemoteIndex:
+    """Wraps the local index behind a per-query sleep, like a hosted index reached over the network"""
+
+    def __init__(self, index, latency: float):
+        self.index = index
+        self.latency = latency
+
+    def query(self, **kwargs):
+        time.sleep(self.latency)
+        return self.index.query(**kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--latency-ms", type=float, default=50, help="fake embedding request latency")
+    parser.add_argument("--remote-latency-ms", type=float, default=0, help="per-query index latency; 0 keeps the local index")
+    parser.add_argument("--serial-sample", type=int, default=100, help="serial queries to time (extrapolated)")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench-batch-")
+    os.environ.update({
+        'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'benchmark'),
+        'VECTOR_BACKEND': 'local',
+        'LOCAL_INDEX_PATH': str(Path(tmp) / "index.npz"),
+        'EMBEDDING_CACHE_PATH': '',
+        'EMBEDDING_CACHE_MEMORY_ITEMS': str(args.queries * 2 + args.serial_sample),
+    })
+    from chatbot.retriver.local_index import LocalVectorIndex
+    rng = np.random.default_rng(0)
+    brands = ['Galbani', 'Boar\'s Head', 'Cello', 'Other']
+    LocalVectorIndex.from_arrays(
+        [str(i) for i in range(args.rows)],
+        rng.standard_normal((args.rows, args.dim), dtype=np.float32),
+        [{'brand': brands[i % len(brands)], 'price_each': float(i % 100)} for i in range(args.rows)]
+    ).save(os.environ['LOCAL_INDEX_PATH'])
+
+    from chatbot.retriver.data_retriver import VectorStore
+    store = VectorStore()
+    store.client = FakeOpenAI(args.latency_ms / 1000, args.dim)
+    if args.remote_latency_ms:
+        store.index = RemoteIndex(store.index, args.remote_latency_ms / 1000)
+
+    queries = [f"query {i} about cheese" for i in range(args.queries)]
+    filters = [{'brand': brands[i % len(brands)]} if i % 2 else None for i in range(args.queries)]
+
+    # Serial baseline on a sample; query_products prints every match, so silence stdout
+    sample = [f"serial {i} about cheese" for i in range(min(args.serial_sample, args.queries))]
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        start = time.perf_counter()
+        for query, filter_dict in zip(sample, filters):
+            store.query_products(query, top_k=args.top_k, filter_dict=filter_dict)
+        serial_s = (time.perf_counter() - start) / len(sample) * args.queries
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    requests_before = store.client.requests
+    start = time.perf_counter()
+    results = 0
+    for result in store.query_products_batch(queries, filters, top_k=args.top_k, batch_size=args.batch_size):
+        results += len(result['products'])
+    batch_s = time.perf_counter() - start
+
+    mode = f"remote index ({args.remote_latency_ms:g} ms/query)" if args.remote_latency_ms else "local index"
+    print(f"{args.queries} queries, {args.rows:,} x {args.dim} {mode}, embedding latency {args.latency_ms:g} ms")
+    print(f"serial (extrapolated from {len(sample)}): {serial_s:8.2f} s  {args.queries / serial_s:8.1f} q/s")
+    print(f"batched (batch {args.batch_size}):          {batch_s:8.2f} s  {args.queries / batch_s:8.1f} q/s  "
+          f"{store.client.requests - requests_before} embedding requests, {results} products")
+    print(f"speedup: {serial_s / batch_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
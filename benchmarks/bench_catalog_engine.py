@@ -0,0 +1,97 @@
+"""
+Latency of the columnar catalog engine on a large synthetic catalog.
+
+Builds a ColumnarCatalog with random prices, weights and dictionary-encoded
+brand / type / form columns, then times the query shapes ChatSession routes to
+it: unfiltered and filtered top-k, min/max, range, count and group-by.
+
+Usage:
+    python benchmarks/bench_catalog_engine.py --rows 1000000 --repeat 20
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+from chatbot.retriver.catalog_engine import ColumnarCatalog
+
+
+def synthetic_catalog(rows: int, brands: int, types: int, forms: int, seed: int = 0) -> ColumnarCatalog:
+    rng = np.random.default_rng(seed)
+    lb_per_each = rng.choice([0.5, 1.0, 1.5, 2.0, 5.0, 6.0, 10.0, 20.0, 30.0], size=rows)
+    price_per_lb = rng.lognormal(mean=1.5, sigma=0.5, size=rows).round(2)
+    numeric = {
+        'price_each': (price_per_lb * lb_per_each).round(2),
+        'price_per_lb': price_per_lb,
+        'lb_per_each': lb_per_each,
+    }
+    # A few percent of listings have no price, as in the scraped catalog
+    numeric['price_each'][rng.random(rows) < 0.02] = np.nan
+    codes = {
+        'brand': rng.zipf(1.5, size=rows) % brands,
+        'cheese_type': rng.integers(0, types, size=rows),
+        'cheese_form': rng.integers(0, forms, size=rows),
+    }
+    categories = {
+        'brand': [f"Brand {i}" for i in range(brands)],
+        'cheese_type': [f"Cheese type {i}" for i in range(types)],
+        'cheese_form': [f"Form {i}" for i in range(forms)],
+    }
+    ids = np.arange(rows).astype(str)
+    return ColumnarCatalog(ids, numeric, rng.random(rows) < 0.1, codes, categories)
+
+
+def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2], samples[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--brands", type=int, default=500)
+    parser.add_argument("--types", type=int, default=20_000)
+    parser.add_argument("--forms", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    catalog = synthetic_catalog(args.rows, args.brands, args.types, args.forms)
+    print(f"Built {len(catalog):,} rows in {time.perf_counter() - start:.2f} s")
+
+    brand_filter = {'brand': 'Brand 3'}
+    combined_filter = {"$and": [
+        {'cheese_form': {"$in": ['Form 1', 'Form 2', 'Form 3']}},
+        {'price_each': {"$lt": 40}},
+        {'lb_per_each': {"$gte": 5}},
+    ]}
+    queries = [
+        ("top_k(price_each, 3)", lambda: catalog.top_k('price_each', 3)),
+        ("top_k(price_per_lb, 3, asc, brand)", lambda: catalog.top_k('price_per_lb', 3, True, brand_filter)),
+        ("max(lb_per_each, $and filter)", lambda: catalog.max('lb_per_each', combined_filter)),
+        ("range(price_each, 10..20, limit 20)", lambda: catalog.range('price_each', 10, 20, limit=20)),
+        ("count($and filter)", lambda: catalog.count(combined_filter)),
+        ("aggregate(mean price_each, brand)", lambda: catalog.aggregate('price_each', 'mean', brand_filter)),
+        ("group_by(brand, count)", lambda: catalog.group_by('brand')),
+        ("group_by(brand, mean price_each)", lambda: catalog.group_by('brand', 'price_each', 'mean')),
+        ("group_by(cheese_form, min price_per_lb)", lambda: catalog.group_by('cheese_form', 'price_per_lb', 'min')),
+    ]
+    print(f"{'query':<42} {'p50 ms':>9} {'max ms':>9}")
+    for name, fn in queries:
+        p50, worst = timed(fn, args.repeat)
+        print(f"{name:<42} {p50 * 1000:>9.2f} {worst * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
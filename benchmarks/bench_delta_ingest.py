@@ -0,0 +1,146 @@
+"""
+Delta ingestion: what a catalog re-run sends with the content-hash manifest vs a full re-ingest.
+
+Starts the fake OpenAI and Pinecone servers from fake_services.py with an
+empty index and syncs --items products (see bench_ingest.py) through
+PineconeIngestor.sync. It then edits the catalog: new prices on --price-share
+of the products, new descriptions on --text-share, removes --remove-share
+and adds --add-share new ones. It prints the dry-run plan and syncs the
+edited catalog, then syncs it once more (which should send nothing), and
+finally re-ingests it in full for comparison.
+
+For each run it reports the texts embedded, vectors upserted, metadata
+updates and deletes, plus the requests per route and the wall time. It then
+checks the fake index against the edited catalog: the same IDs, the new
+prices, and the new descriptions. Exits 1 if any check fails.
+
+Usage:
+    python benchmarks/bench_delta_ingest.py --items 2000 --price-share 0.2
+"""
+import argparse
+import contextlib
+import copy
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+from bench_ingest import make_items
+
+
+def edit_catalog(items: list, args) -> list:
+    rng = random.Random(args.seed)
+    edited = copy.deepcopy(items)
+    for item in rng.sample(edited, int(len(edited) * args.price_share)):
+        item['metadata']['price_each'] = round(float(item['metadata'].get('price_each') or 1) * 1.1 + 0.01, 2)
+    for item in rng.sample(edited, int(len(edited) * args.text_share)):
+        item['description'] = f"{item['description']} Now aged twelve months."
+    removed = set(rng.sample([item['id'] for item in edited], int(len(edited) * args.remove_share)))
+    edited = [item for item in edited if item['id'] not in removed]
+    for i in range(int(len(items) * args.add_share)):
+        item = copy.deepcopy(items[i])
+        item['id'] = f"added-{i}"
+        item['description'] = f"{item['description']} (new listing {i})"
+        edited.append(item)
+    return edited
+
+
+def timed_sync(ingestor, products, manifest, servers, label: str, **kwargs) -> dict:
+    from utils.embedding_cache import get_embedding_cache
+    get_embedding_cache().clear()
+    before = sum((Counter(server.requests) for server in servers), Counter())
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = ingestor.sync(products, manifest, **kwargs)
+    seconds = time.perf_counter() - start
+    sent = sum((Counter(server.requests) for server in servers), Counter()) - before
+    ingest = summary.get('ingest', {})
+    print(f"{label:<12} {ingest.get('items', 0):>8} {ingest.get('stored', 0):>8} {summary['updated']:>8} "
+          f"{summary['deleted']:>8} {sent['embeddings']:>6} {sent['upsert']:>7} {sent['update']:>7} {sent['delete']:>7} "
+          f"{seconds:>8.2f}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--price-share", type=float, default=0.1)
+    parser.add_argument("--text-share", type=float, default=0.05)
+    parser.add_argument("--remove-share", type=float, default=0.03)
+    parser.add_argument("--add-share", type=float, default=0.02)
+    parser.add_argument("--embedding-ms", type=float, default=20)
+    parser.add_argument("--write-ms", type=float, default=10, help="fake upsert, update and delete latency")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Settings are read when utils.config is first imported, so the environment goes first
+    tmp = Path(tempfile.mkdtemp(prefix="bench-delta-"))
+    os.environ.update({
+        'OPENAI_API_KEY': 'fake-key',
+        'PINECONE_API_KEY': 'fake-key',
+        'VECTOR_BACKEND': 'pinecone',
+        'EMBEDDING_CACHE_PATH': '',
+        'CATALOG_VERSION_PATH': str(tmp / "catalog_version"),
+        'BM25_INDEX_PATH': str(tmp / "bm25_index.npz"),
+    })
+    logging.basicConfig(level=logging.CRITICAL)
+    from fake_services import FakeOpenAIServer, FakePineconeServer, LatencyModel
+    from utils.config import Config
+    from chatbot.retriver.local_index import LocalVectorIndex
+    from data_processing.pinecone.manifest import IngestManifest
+
+    writes = {route: args.write_ms for route in ('upsert', 'update', 'delete')}
+    openai_server = FakeOpenAIServer(LatencyModel({'embeddings': args.embedding_ms})).start()
+    pinecone_server = FakePineconeServer(LocalVectorIndex(Config.VECTOR_DIMENSION), LatencyModel(writes)).start()
+    servers = (openai_server, pinecone_server)
+    Config.OPENAI_BASE_URL = openai_server.base_url
+    Config.PINECONE_HOST = pinecone_server.url
+    from data_processing.pinecone.pinecone import PineconeIngestor
+    ingestor = PineconeIngestor()
+
+    items = make_items(Config.CATALOG_PATH, args.items)
+    edited = edit_catalog(items, args)
+    manifest = IngestManifest(str(tmp / "manifest.json"))
+
+    print(f"{'run':<12} {'embedded':>8} {'upserted':>8} {'updated':>8} {'deleted':>8} {'embed':>6} {'upsert':>7} "
+          f"{'update':>7} {'delete':>7} {'seconds':>8}")
+    timed_sync(ingestor, items, manifest, servers, 'initial')
+    plan = IngestManifest(manifest.path).diff(edited)
+    delta = timed_sync(ingestor, edited, IngestManifest(manifest.path), servers, 'delta')
+    again = timed_sync(ingestor, edited, IngestManifest(manifest.path), servers, 'unchanged')
+    timed_sync(ingestor, edited, IngestManifest(manifest.path), servers, 'full', full=True)
+    print(f"\n{plan.describe(limit=5)}\n")
+
+    index = pinecone_server.index
+    stored = index.fetch([item['id'] for item in edited])
+    checks = {
+        'same ids as the catalog': len(index) == len(edited) and len(stored) == len(edited),
+        'prices updated': all(
+            stored[item['id']].metadata.get('price_each') == item['metadata'].get('price_each') for item in edited
+        ),
+        'descriptions updated': all(
+            stored[item['id']].metadata.get('description') == item['description'] for item in edited
+        ),
+        'plan carried out': delta['plan'] == plan.summary() and delta['updated'] == len(plan.updated)
+                            and delta['deleted'] == len(plan.removed),
+        'nothing sent for an unchanged catalog': not again['ingest']['items'] and not again['updated'] and not again['deleted'],
+    }
+    for name, ok in checks.items():
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+
+    openai_server.stop()
+    pinecone_server.stop()
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Streamlit page time as the chat history grows: full re-render vs progressive history.
+
+Runs app.py headless with streamlit.testing.v1.AppTest on synthetic
+conversations of each --turns length (every answer with --products product
+cards) and reruns the page --runs times, as Streamlit does on every
+interaction. "full" renders every turn and card, as the app did before
+(HISTORY_FULL_TURNS=0, one page of all cards); "progressive" uses the
+configured HISTORY_FULL_TURNS, HISTORY_SUMMARY_PAGE and PRODUCT_CARDS_PER_PAGE.
+Reports the app's own history render time (history_render_ms), the rerun
+wall time and the number of elements sent to the browser.
+
+Card images are "N/A" so the numbers cover rendering only; see
+bench_image_cache.py for image loading. Exits 1 if the progressive history
+render time at the longest conversation exceeds --max-growth times that at
+the shortest.
+
+Usage:
+    python benchmarks/bench_history_render.py --turns 5 20 80 --products 12
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+APP_PATH = str(Path(project_root) / "app.py")
+ELEMENT_TYPES = ("markdown", "button", "expander", "image", "caption", "chat_message")
+
+
+def conversation(turns: int, products: int) -> list:
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"Question {turn}: which cheeses would you suggest for a platter?"})
+        messages.append({
+            "role": "assistant",
+            "content": "Here are some products that fit. " * 20,
+            "context": [
+                {
+                    "name": f"Cheese {turn}-{k}", "cheese_type": "Cheddar", "brand": "Brand", "cheese_form": "Block",
+                    "price_each": 12.5, "lb_per_each": 2.0, "image_url": "N/A",
+                    "source_url": "https://example.com/product", "description": "A mild cheddar. " * 10
+                }
+                for k in range(products)
+            ]
+        })
+    return messages
+
+
+def measure(turns: int, products: int, runs: int) -> dict:
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(APP_PATH, default_timeout=120)
+    app.session_state.messages = conversation(turns, products)
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    renders, walls = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        app.run()
+        walls.append((time.perf_counter() - start) * 1000)
+        renders.append(app.session_state.history_render_ms)
+    elements = sum(len(getattr(app, name)) for name in ELEMENT_TYPES)
+    return {'render': float(np.median(renders)), 'wall': float(np.median(walls)), 'elements': elements}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[5, 10, 20, 40, 80])
+    parser.add_argument("--products", type=int, default=12, help="product cards per answer")
+    parser.add_argument("--runs", type=int, default=5, help="reruns per conversation")
+    parser.add_argument("--max-growth", type=float, default=2.0)
+    args = parser.parse_args()
+
+    # Settings are read when utils.config is first imported, so the environment goes first
+    os.environ.setdefault('OPENAI_API_KEY', 'fake-key')
+    os.environ.setdefault('PINECONE_API_KEY', 'fake-key')
+    os.environ.update({'IMAGE_CACHE_DIR': tempfile.mkdtemp(prefix="history-render-"), 'TRACE_PATH': ''})
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    from utils.config import Config
+    progressive = {
+        'HISTORY_FULL_TURNS': Config.HISTORY_FULL_TURNS,
+        'PRODUCT_CARDS_PER_PAGE': Config.PRODUCT_CARDS_PER_PAGE,
+        'HISTORY_SUMMARY_PAGE': Config.HISTORY_SUMMARY_PAGE
+    }
+    modes = {
+        'full': {'HISTORY_FULL_TURNS': 0, 'PRODUCT_CARDS_PER_PAGE': args.products, 'HISTORY_SUMMARY_PAGE': 0},
+        'progressive': progressive
+    }
+
+    print(f"{args.products} product cards per answer; progressive: {progressive}")
+    print(f"{'mode':<12} {'turns':>6} {'history ms':>11} {'rerun ms':>9} {'elements':>9}")
+    results = {}
+    for mode, settings in modes.items():
+        for name, value in settings.items():
+            setattr(Config, name, value)
+        for turns in args.turns:
+            result = results[mode, turns] = measure(turns, args.products, args.runs)
+            print(f"{mode:<12} {turns:>6} {result['render']:>11.1f} {result['wall']:>9.1f} {result['elements']:>9}")
+
+    shortest, longest = results['progressive', min(args.turns)], results['progressive', max(args.turns)]
+    growth = longest['render'] / max(shortest['render'], 1e-6)
+    print(f"\nprogressive history render grew {growth:.2f}x from {min(args.turns)} to {max(args.turns)} turns")
+    sys.exit(1 if growth > args.max_growth else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Product card image latency: uncached per-card downloads vs the thumbnail cache.
+
+Serves --images synthetic product photos from a local HTTP server that adds
+--latency-ms to every response, then times rendering one answer's worth of
+cards (--cards images) three ways:
+
+    direct      a requests.get per card plus decoding the full image, as the
+                app did before the cache
+    prefetched  ImageCache.prefetch_products when retrieval returns, then a
+                thumbnail() per card (what app.py does while the answer streams;
+                the wait before rendering is the --stream-ms of answer tokens)
+    warm        thumbnail() per card once cached, as on every Streamlit rerun
+
+Exits 1 if the warm pass sent any request to the image server.
+
+Usage:
+    python benchmarks/bench_image_cache.py --cards 8 --latency-ms 150
+"""
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import requests
+from PIL import Image
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+from utils.image_cache import ImageCache
+
+
+def make_images(count: int, size: int, seed: int) -> dict:
+    """Noisy JPEGs about the size of a scraped product photo"""
+    rng = np.random.default_rng(seed)
+    images = {}
+    for i in range(count):
+        pixels = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+        buffer = BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+        images[f"/images/{i}.jpg"] = buffer.getvalue()
+    return images
+
+
+class ImageServer:
+    def __init__(self, images: dict, latency_ms: float):
+        self.images = images
+        self.latency = latency_ms / 1000
+        self.requests: Counter = Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.requests[self.path] += 1
+                time.sleep(server.latency)
+                body = server.images.get(self.path)
+                self.send_response(200 if body else 404)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(body or b'')))
+                self.end_headers()
+                self.wfile.write(body or b'')
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self) -> "ImageServer":
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+def render_direct(urls):
+    for url in urls:
+        response = requests.get(url)
+        if response.status_code == 200:
+            Image.open(BytesIO(response.content)).load()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=64, help="distinct images on the server")
+    parser.add_argument("--cards", type=int, default=8, help="product cards per answer")
+    parser.add_argument("--answers", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=150, help="image server latency per request")
+    parser.add_argument("--stream-ms", type=float, default=0, help="answer streaming time between prefetch and rendering")
+    parser.add_argument("--size", type=int, default=1200, help="source image edge in pixels")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = ImageServer(make_images(args.images, args.size, args.seed), args.latency_ms).start()
+    cache = ImageCache(root=tempfile.mkdtemp(prefix="image-cache-"))
+    rng = random.Random(args.seed)
+    answers = [
+        [{'image_url': f"{server.url}/images/{i}.jpg"} for i in rng.sample(range(args.images), args.cards)]
+        for _ in range(args.answers)
+    ]
+
+    timings = {'direct': [], 'prefetched': [], 'warm': []}
+    for products in answers:
+        urls = [product['image_url'] for product in products]
+        start = time.perf_counter()
+        render_direct(urls)
+        timings['direct'].append((time.perf_counter() - start) * 1000)
+
+    for products in answers:
+        start = time.perf_counter()
+        cache.prefetch_products(products)
+        time.sleep(args.stream_ms / 1000)
+        for product in products:
+            cache.thumbnail(product['image_url'])
+        timings['prefetched'].append((time.perf_counter() - start) * 1000)
+
+    sent_before = sum(server.requests.values())
+    for products in answers:
+        start = time.perf_counter()
+        for product in products:
+            cache.thumbnail(product['image_url'])
+        timings['warm'].append((time.perf_counter() - start) * 1000)
+    warm_requests = sum(server.requests.values()) - sent_before
+
+    print(f"{args.cards} cards per answer, {args.answers} answers, {args.latency_ms:.0f} ms per image request")
+    for name, values in timings.items():
+        p50, p95 = np.percentile(values, (50, 95))
+        print(f"  {name:<11} p50 {p50:8.1f}  p95 {p95:8.1f} ms per answer")
+    print(f"  warm pass sent {warm_requests} requests; cache {cache.stats()}")
+
+    cache.close()
+    server.stop()
+    sys.exit(1 if warm_requests else 0)
+
+
+if __name__ == "__main__":
+    main()
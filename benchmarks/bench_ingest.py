@@ -0,0 +1,131 @@
+"""
+Ingestion throughput: one embedding and one upsert request per item vs the batched pipeline.
+
+Starts the fake OpenAI and Pinecone servers from fake_services.py and
+ingests --items products (the processed catalog repeated with distinct ids
+and descriptions) through PineconeIngestor.ingest_data three times:
+
+    serial      batches of one and one worker per stage, i.e. 2 x N
+                sequential round trips as before the pipeline
+    pipelined   the configured INGEST_* batch sizes and workers
+    faults      pipelined, with --error-rate of embedding and upsert requests
+                answered 503 and upstream retries off, so failed batches
+                fall back to retrying their items one at a time
+
+The fakes charge a fixed latency per request whatever its size, so the
+speedup shown is the round trips saved. Exits 1 if a run without faults
+did not store every item, or the faults run lost items without retrying.
+
+Usage:
+    python benchmarks/bench_ingest.py --items 1000 --embedding-ms 80 --upsert-ms 40
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+
+def make_items(catalog_path: str, count: int) -> list:
+    with open(catalog_path, 'r', encoding='utf-8') as f:
+        catalog = json.load(f)
+    items = []
+    for i in range(count):
+        product = dict(catalog[i % len(catalog)])
+        product['metadata'] = dict(product['metadata'])
+        product['id'] = f"{product['id']}-{i}"
+        product['description'] = f"{product['description']} (lot {i})"
+        items.append(product)
+    return items
+
+
+def run(ingestor, items: list, label: str, **settings) -> dict:
+    from utils.config import Config
+    from utils.embedding_cache import get_embedding_cache
+    defaults = {name: getattr(Config, name) for name in settings}
+    for name, value in settings.items():
+        setattr(Config, name, value)
+    get_embedding_cache().clear()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = ingestor.ingest_data(iter(items))
+    finally:
+        for name, value in defaults.items():
+            setattr(Config, name, value)
+    print(f"{label:<10} {summary['stored']:>6}/{summary['items']:<6} {summary['seconds']:>8.2f} "
+          f"{summary['items_per_sec']:>9.1f} {summary['tokens_per_sec']:>10.0f} "
+          f"{summary['embedding_requests']:>6} {summary['upsert_requests']:>7} {summary['retried']:>7} {summary['failed']:>6}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=400)
+    parser.add_argument("--embedding-ms", type=float, default=20, help="fake embedding request latency")
+    parser.add_argument("--upsert-ms", type=float, default=15, help="fake Pinecone upsert latency")
+    parser.add_argument("--error-rate", type=float, default=0.2, help="share of requests answered 503 in the faults run")
+    parser.add_argument("--skip-serial", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Settings are read when utils.config is first imported, so the environment goes first
+    tmp = Path(tempfile.mkdtemp(prefix="bench-ingest-"))
+    os.environ.update({
+        'OPENAI_API_KEY': 'fake-key',
+        'PINECONE_API_KEY': 'fake-key',
+        'VECTOR_BACKEND': 'pinecone',
+        'EMBEDDING_CACHE_PATH': '',
+        'CATALOG_VERSION_PATH': str(tmp / "catalog_version"),
+        'BM25_INDEX_PATH': str(tmp / "bm25_index.npz"),
+    })
+    logging.basicConfig(level=logging.CRITICAL)
+    from fake_services import FakeOpenAIServer, FakePineconeServer, FaultModel, LatencyModel
+
+    openai_server = FakeOpenAIServer(LatencyModel({'embeddings': args.embedding_ms})).start()
+    pinecone_server = FakePineconeServer.from_catalog(latency=LatencyModel({'upsert': args.upsert_ms})).start()
+    from utils.config import Config
+    from utils.resilience import get_upstream
+    Config.OPENAI_BASE_URL = openai_server.base_url
+    Config.PINECONE_HOST = pinecone_server.url
+    from data_processing.pinecone.pinecone import PineconeIngestor
+    ingestor = PineconeIngestor()
+    items = make_items(Config.CATALOG_PATH, args.items)
+
+    print(f"{args.items} items, {args.embedding_ms:.0f} ms per embedding request, {args.upsert_ms:.0f} ms per upsert")
+    print(f"{'run':<10} {'stored':>13} {'seconds':>8} {'items/s':>9} {'tokens/s':>10} {'embed':>6} {'upsert':>7} "
+          f"{'retried':>7} {'failed':>6}")
+    ok = True
+    if not args.skip_serial:
+        serial = run(ingestor, items, 'serial', INGEST_EMBED_BATCH=1, INGEST_UPSERT_BATCH=1,
+                     INGEST_EMBED_WORKERS=1, INGEST_UPSERT_WORKERS=1)
+        ok &= serial['stored'] == args.items
+    pipelined = run(ingestor, items, 'pipelined')
+    ok &= pipelined['stored'] == args.items
+
+    faults = {'default': {'error': args.error_rate}}
+    openai_server.faults = FaultModel(faults, seed=args.seed)
+    pinecone_server.faults = FaultModel(faults, seed=args.seed + 1)
+    attempts = {name: get_upstream(name).max_attempts for name in ('openai', 'pinecone')}
+    for name in attempts:
+        get_upstream(name).max_attempts = 1
+    # Smaller batches so several of them meet a fault
+    faulty = run(ingestor, items, 'faults', INGEST_EMBED_BATCH=32, INGEST_UPSERT_BATCH=25)
+    for name, value in attempts.items():
+        get_upstream(name).max_attempts = value
+    ok &= faulty['stored'] + faulty['failed'] == args.items and faulty['retried'] > 0
+
+    openai_server.stop()
+    pinecone_server.stop()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Recall and latency of LocalVectorIndex against a brute-force reference.
+
+Usage:
+    python benchmarks/bench_local_index.py --sizes 1000 100000 1000000 --dim 256
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+from chatbot.retriver.local_index import LocalVectorIndex
+
+
+def brute_force_top_k(vectors: np.ndarray, query: np.ndarray, top_k: int, mask: np.ndarray = None) -> np.ndarray:
+    """Reference search: float64 cosine over every row and a full sort"""
+    vectors = vectors.astype(np.float64)
+    scores = vectors @ query.astype(np.float64)
+    scores /= np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    if mask is not None:
+        scores[~mask] = -np.inf
+    order = np.argsort(-scores, kind="stable")
+    return order[:top_k] if mask is None else [i for i in order[:top_k] if mask[i]]
+
+
+def run(size: int, dim: int, num_queries: int, top_k: int, seed: int):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((size, dim), dtype=np.float32)
+    prices = np.round(rng.uniform(1, 100, size), 2)
+    ids = [str(i) for i in range(size)]
+    metadata = [{'price_each': float(p), 'brand': 'Galbani' if i % 7 == 0 else 'Other'} for i, p in enumerate(prices)]
+
+    start = time.perf_counter()
+    index = LocalVectorIndex.from_arrays(ids, vectors, metadata)
+    build_s = time.perf_counter() - start
+
+    queries = rng.standard_normal((num_queries, dim), dtype=np.float32)
+    filter_dict = {"$and": [{"brand": "Galbani"}, {"price_each": {"$lt": 50}}]}
+    filter_mask = np.array([m['brand'] == 'Galbani' and m['price_each'] < 50 for m in metadata])
+
+    results = {}
+    for label, flt, mask in (("unfiltered", None, None), ("filtered", filter_dict, filter_mask)):
+        # Warm the metadata column cache so it is not billed to the first query
+        index.query(queries[0], top_k=top_k, filter=flt)
+
+        local_times, ref_times, recalls = [], [], []
+        for query in queries:
+            start = time.perf_counter()
+            response = index.query(query, top_k=top_k, filter=flt)
+            local_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            expected = brute_force_top_k(vectors, query, top_k, mask)
+            ref_times.append(time.perf_counter() - start)
+
+            expected_ids = {str(i) for i in expected}
+            found_ids = {match.id for match in response.matches}
+            recalls.append(len(expected_ids & found_ids) / max(len(expected_ids), 1))
+
+        results[label] = (np.mean(recalls), np.median(local_times), np.percentile(local_times, 95), np.median(ref_times))
+
+    print(f"\nN={size:,} dim={dim} (build {build_s * 1000:.1f} ms, {index.matrix.nbytes / 2**20:.1f} MiB)")
+    print(f"{'mode':<12}{'recall@' + str(top_k):>10}{'local p50':>14}{'local p95':>14}{'brute p50':>14}")
+    for label, (recall, p50, p95, ref_p50) in results.items():
+        print(f"{label:<12}{recall:>10.4f}{p50 * 1000:>11.3f} ms{p95 * 1000:>11.3f} ms{ref_p50 * 1000:>11.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=256, help="vector dimension (1536 at 1M rows needs ~6 GiB)")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.dim, args.queries, args.top_k, args.seed)
+
+
+if __name__ == "__main__":
+    main()
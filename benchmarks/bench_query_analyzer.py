@@ -0,0 +1,90 @@
+"""
+Hit rate, agreement and latency of the catalog query analyzer over a labelled query set.
+
+Each line of the query file is a JSON object with the user "query", the expected
+"is_cheese_question" and the "filter_fields" the LLM filter stage would constrain.
+A query is a hit when the analyzer is confident enough to skip both LLM calls.
+
+Usage:
+    python benchmarks/bench_query_analyzer.py --queries benchmarks/data/sample_queries.jsonl
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+from utils.config import Config
+from chatbot.retriver.query_analyzer import QueryAnalyzer
+
+
+def filter_fields(filter_dict: Optional[Dict[str, Any]]) -> Set[str]:
+    """Metadata fields constrained by a Pinecone filter"""
+    if not filter_dict:
+        return set()
+    fields = set()
+    for key, value in filter_dict.items():
+        if key in ("$and", "$or"):
+            for clause in value:
+                fields |= filter_fields(clause)
+        else:
+            fields.add(key)
+    return fields
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=str(Path(__file__).parent / "data" / "sample_queries.jsonl"))
+    parser.add_argument("--catalog", default=Config.CATALOG_PATH)
+    parser.add_argument("--threshold", type=float, default=Config.QUERY_ANALYZER_MIN_CONFIDENCE)
+    parser.add_argument("--repeat", type=int, default=200, help="timed passes over the query set")
+    parser.add_argument("--verbose", action="store_true", help="print every query with its analysis")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    analyzer = QueryAnalyzer.from_catalog(args.catalog)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    hits = class_agree = fields_agree = 0
+    for record in records:
+        analysis = analyzer.analyze(record['query'])
+        hit = analysis.confidence >= args.threshold
+        same_class = analysis.is_cheese_question == record['is_cheese_question']
+        same_fields = filter_fields(analysis.filter_dict) == set(record['filter_fields'])
+        if hit:
+            hits += 1
+            class_agree += same_class
+            fields_agree += same_class and same_fields
+        if args.verbose:
+            mark = "HIT " if hit else "llm "
+            print(f"{mark}{analysis.confidence:.2f} class={analysis.is_cheese_question} "
+                  f"fields={sorted(filter_fields(analysis.filter_dict))} | {record['query']}")
+
+    timings = []
+    for _ in range(args.repeat):
+        for record in records:
+            start = time.perf_counter()
+            analyzer.analyze(record['query'])
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    total = len(records)
+    print(f"Queries: {total} (threshold {args.threshold}, analyzer built in {build_ms:.1f} ms)")
+    print(f"Fast-path hit rate: {hits / total:.1%} ({hits}/{total}), LLM calls saved: {2 * hits}")
+    if hits:
+        print(f"Classification agreement on hits: {class_agree / hits:.1%}")
+        print(f"Classification + filter field agreement on hits: {fields_agree / hits:.1%}")
+    print(f"Latency per query: p50 {timings[len(timings) // 2] * 1e6:.1f} us, "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1e6:.1f} us, max {timings[-1] * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Resumable jobs: what re-running an interrupted processing or ingestion run costs with the job journal.
+
+Starts the fake OpenAI and Pinecone servers from fake_services.py, writes
+--items scraped products (see bench_streaming_pipeline.py) and runs the real
+command-line entry points against them as subprocesses, killing each with
+SIGKILL part way, as a crash or an OOM kill would:
+
+    describe    python data_processing/process_data.py, killed once half of
+                the descriptions were requested, then run again to the end.
+                The first product is poisoned: the fake answers its
+                description request with a 400 every time, so it is
+                quarantined after JOB_MAX_ATTEMPTS (2 here) runs and a third
+                run no longer asks for it.
+    ingest      python -m data_processing.pinecone.pinecone, killed once half
+                of the upserts were sent, then run again to the end.
+
+While the first describe run is going, python -m utils.job_journal prints
+its progress from the journal. Each re-run is compared against what a run
+without the journal sends (every product again). Exits 1 if a re-run
+repeated more than the work in flight at the kill, the poisoned product
+was not quarantined, or the index does not end up holding every product.
+
+Usage:
+    python benchmarks/bench_resume.py --items 200 --description-ms 40
+"""
+import argparse
+import logging
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+from bench_streaming_pipeline import make_raw
+
+POISON = "Poisoned Test Cheese"
+
+
+def start(args: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, *args], cwd=project_root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def wait_until(process: subprocess.Popen, reached, timeout: float = 120) -> bool:
+    """Poll until reached() is true; False if the process exited or the timeout passed first"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        if reached():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def kill_when(process: subprocess.Popen, reached, timeout: float = 120) -> bool:
+    """SIGKILL the process once reached() is true; False if it exited first"""
+    if not wait_until(process, reached, timeout):
+        return False
+    os.kill(process.pid, signal.SIGKILL)
+    process.wait()
+    return True
+
+
+def progress(env: dict) -> str:
+    out = subprocess.run(
+        [sys.executable, '-m', 'utils.job_journal', '--path', env['JOB_JOURNAL_PATH']],
+        cwd=project_root, env=env, capture_output=True, text=True, timeout=60
+    )
+    return out.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=120)
+    parser.add_argument("--description-ms", type=float, default=40, help="fake chat (description) request latency")
+    parser.add_argument("--embedding-ms", type=float, default=20, help="fake embedding request latency")
+    parser.add_argument("--upsert-ms", type=float, default=40, help="fake Pinecone upsert latency")
+    parser.add_argument("--scrape", default=str(Path(project_root) / "data_processing" / "database" / "cheese_products.json"))
+    args = parser.parse_args()
+
+    # Settings are read when utils.config is first imported, so the environment goes first
+    tmp = Path(tempfile.mkdtemp(prefix="bench-resume-"))
+    os.environ.update({
+        'OPENAI_API_KEY': 'fake-key',
+        'PINECONE_API_KEY': 'fake-key',
+        'VECTOR_BACKEND': 'pinecone',
+        'EMBEDDING_CACHE_PATH': '',
+        'CATALOG_VERSION_PATH': str(tmp / "catalog_version"),
+        'BM25_INDEX_PATH': str(tmp / "bm25_index.npz"),
+        'JOB_JOURNAL_PATH': str(tmp / "jobs.sqlite3"),
+        'JOB_MAX_ATTEMPTS': '2',
+        # Small batches and one worker per stage, so the ingest run is interrupted between upserts
+        'INGEST_EMBED_BATCH': '10',
+        'INGEST_UPSERT_BATCH': '10',
+        'INGEST_EMBED_WORKERS': '1',
+        'INGEST_UPSERT_WORKERS': '1',
+    })
+    logging.basicConfig(level=logging.CRITICAL)
+    from fake_services import FakeOpenAIServer, FakePineconeServer, LatencyModel
+    from utils.config import Config
+    from utils.jsonl import read_records, write_jsonl
+    from utils.job_journal import JobJournal, quarantined_items
+    from chatbot.retriver.local_index import LocalVectorIndex
+    from data_processing.process_data import iter_mapped
+
+    openai_server = FakeOpenAIServer(
+        LatencyModel({'chat': args.description_ms, 'embeddings': args.embedding_ms}), poison=POISON
+    ).start()
+    pinecone_server = FakePineconeServer(LocalVectorIndex(Config.VECTOR_DIMENSION), LatencyModel({'upsert': args.upsert_ms})).start()
+    env = {**os.environ, 'OPENAI_BASE_URL': openai_server.base_url, 'PINECONE_HOST': pinecone_server.url}
+
+    raw = make_raw(args.scrape, args.items)
+    raw[0] = {**raw[0], 'cheese_type': POISON}
+    raw_path, processed_path = str(tmp / "cheese_products.jsonl"), str(tmp / "processed.jsonl")
+    write_jsonl(raw, raw_path)
+    poison_key = JobJournal.key(next(iter_mapped(iter(raw[:1]))))
+    n = args.items
+    describe = ['data_processing/process_data.py', '--input', raw_path, '--output', processed_path]
+    ingest = ['-m', 'data_processing.pinecone.pinecone', '--input', processed_path, '--manifest', str(tmp / "manifest.json")]
+
+    def chat_requests() -> int:
+        return openai_server.requests['chat']
+
+    print(f"{n} products, {args.description_ms:.0f} ms per description, {args.upsert_ms:.0f} ms per upsert of 10")
+    print(f"{'run':<30} {'requests':>9} {'without journal':>16}")
+
+    # Describe: killed half way, resumed, then a fresh run with the poisoned product quarantined
+    process = start(describe, env)
+    wait_until(process, lambda: chat_requests() >= n // 4)
+    in_flight = progress(env)
+    killed = kill_when(process, lambda: chat_requests() >= n // 2)
+    sent = chat_requests()
+    print(f"{'describe, killed':<30} {sent:>9} {n:>16}")
+    print(f"  progress while running: {in_flight}")
+    openai_server.requests.clear()
+    start(describe, env).wait()
+    resumed_chat = chat_requests()
+    print(f"{'describe, resumed':<30} {resumed_chat:>9} {n:>16}")
+    openai_server.requests.clear()
+    start(describe, env).wait()
+    fresh_chat = chat_requests()
+    print(f"{'describe, next run':<30} {fresh_chat:>9} {n:>16}")
+    described = list(read_records(processed_path))
+
+    # Ingest: killed half way and resumed
+    batches = -(-len(described) // 10)
+    process = start(ingest, env)
+    ingest_killed = kill_when(process, lambda: pinecone_server.requests['upsert'] >= batches // 2)
+    first_texts, upserts_before = openai_server.embedded_texts, pinecone_server.requests['upsert']
+    print(f"{'ingest, killed (texts)':<30} {first_texts:>9} {len(described):>16}")
+    start(ingest, env).wait()
+    resumed_texts = openai_server.embedded_texts - first_texts
+    print(f"{'ingest, resumed (texts)':<30} {resumed_texts:>9} {len(described):>16}")
+    print()
+    print(progress(env))
+
+    conn = sqlite3.connect(env['JOB_JOURNAL_PATH'])
+    quarantined = quarantined_items(conn, 'describe')
+    conn.close()
+    # At most the descriptions in flight at the kill (2 x workers) are requested again, plus the poisoned retry
+    redone = resumed_chat - (n - sent)
+    stored = pinecone_server.index.fetch([item['id'] for item in described])
+    checks = {
+        'describe run was interrupted': killed,
+        'resumed describe run repeated only work in flight': 0 <= redone <= 2 * Config.DESCRIPTION_WORKERS + 1,
+        'poisoned product quarantined': poison_key in quarantined,
+        'quarantined product no longer requested': fresh_chat == n - 1 and len(described) == n - 1,
+        'ingest run was interrupted': ingest_killed and upserts_before < batches,
+        'resumed ingest re-embedded only unstored products': resumed_texts <= len(described) - 10 * (upserts_before - 1),
+        'index holds every described product': len(stored) == len(described) == len(pinecone_server.index),
+    }
+    for name, ok in checks.items():
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+
+    openai_server.stop()
+    pinecone_server.stop()
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
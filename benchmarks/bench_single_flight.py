@@ -0,0 +1,119 @@
+"""
+Upstream requests saved by single-flight coalescing when many sessions ask the same question at once.
+
+Starts the fake OpenAI and Pinecone servers from fake_services.py and, for
+each round, releases --sessions threads together on the same question
+through VectorStore.get_relevant_products, once with coalescing off and
+once on, on the sequential and the concurrent (asyncio) path. The catalog
+analyzer is turned off so every request goes through classification and
+filter generation. Reports upstream requests per route, the saved counts
+from SingleFlight.stats() and the wall time per round.
+
+Usage:
+    python benchmarks/bench_single_flight.py --sessions 32 --rounds 5 --chat-ms 300
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+QUESTIONS = [
+    "Which mozzarella would you recommend for pizza?",
+    "Do you have any aged cheddar on promotion?",
+    "What is a good cheese for a party platter?",
+]
+
+
+def run_round(store, question: str, sessions: int) -> float:
+    """Release `sessions` threads on the same question together; returns the wall time in ms"""
+    barrier = threading.Barrier(sessions)
+    errors = []
+
+    def ask():
+        barrier.wait()
+        try:
+            store.get_relevant_products(question, generate=False)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=ask) for _ in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=32, help="concurrent sessions asking the same question")
+    parser.add_argument("--rounds", type=int, default=3, help="distinct questions per run")
+    parser.add_argument("--chat-ms", type=float, default=200)
+    parser.add_argument("--embedding-ms", type=float, default=40)
+    parser.add_argument("--query-ms", type=float, default=30)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="single-flight-"))
+    os.environ.update({
+        'OPENAI_API_KEY': 'fake-key',
+        'PINECONE_API_KEY': 'fake-key',
+        'VECTOR_BACKEND': 'pinecone',
+        'EMBEDDING_CACHE_PATH': '',
+        'CATALOG_VERSION_PATH': str(tmp / "catalog_version"),
+        'QUERY_ANALYZER_MIN_CONFIDENCE': '2',
+    })
+    from fake_services import FakeOpenAIServer, FakePineconeServer, LatencyModel
+
+    openai_server = FakeOpenAIServer(LatencyModel({'chat': args.chat_ms, 'embeddings': args.embedding_ms})).start()
+    pinecone_server = FakePineconeServer.from_catalog(latency=LatencyModel({'default': args.query_ms})).start()
+    from utils.config import Config
+    from utils.embedding_cache import get_embedding_cache
+    from utils.single_flight import get_single_flight
+    from chatbot.retriver.data_retriver import VectorStore
+    Config.OPENAI_BASE_URL = openai_server.base_url
+    Config.PINECONE_HOST = pinecone_server.url
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        store = VectorStore()
+    flights = get_single_flight()
+
+    questions = (QUESTIONS * args.rounds)[:args.rounds]
+    print(f"{args.sessions} sessions per question, {len(questions)} questions")
+    print(f"{'path':<12} {'coalescing':<11} {'wall p50 ms':>12} {'chat':>6} {'embed':>6} {'query':>6}  saved")
+    for concurrent in (False, True):
+        Config.CONCURRENT_STAGES = concurrent
+        for enabled in (False, True):
+            flights.enabled = enabled
+            flights.leaders.clear()
+            flights.shared.clear()
+            before = Counter(openai_server.requests) + Counter(pinecone_server.requests)
+            walls = []
+            for i, question in enumerate(questions):
+                get_embedding_cache().clear()
+                # Distinct text per run, so no run benefits from state another one left behind
+                walls.append(run_round(store, f"{question} ({int(concurrent)}{int(enabled)}{i})", args.sessions))
+            sent = Counter(openai_server.requests) + Counter(pinecone_server.requests) - before
+            saved = {call: stats['saved'] for call, stats in flights.stats().items()}
+            print(f"{'concurrent' if concurrent else 'sequential':<12} {'on' if enabled else 'off':<11} "
+                  f"{np.percentile(walls, 50):>12.1f} {sent['chat']:>6} {sent['embeddings']:>6} {sent['query']:>6}  {saved}")
+
+    store.close()
+    openai_server.stop()
+    pinecone_server.stop()
+
+
+if __name__ == "__main__":
+    main()
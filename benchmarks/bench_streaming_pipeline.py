@@ -0,0 +1,205 @@
+"""
+Streaming pipeline: scrape -> process -> ingest one stage at a time vs as one stream.
+
+Starts the fake OpenAI and Pinecone servers from fake_services.py and runs
+--items scraped products (the scrape in data_processing/database, repeated
+with distinct image URLs, so distinct IDs) from a JSONL file into an empty
+index twice:
+
+    staged      each stage reads all of its input before the next starts, as
+                the standalone scripts do: map the products, describe all
+                of them, write the processed file, then sync it
+    streaming   data_processing.pipeline.run_pipeline, where a record moves
+                on as soon as its stage is done with it
+
+Both generate DESCRIPTION_WORKERS descriptions at a time, after a short
+unmeasured warm-up run. For each run it reports the wall time, the time
+until the first vector was upserted, how many descriptions had been requested
+by then, and the peak traced Python memory. Exits 1 if a run did not store
+every product, the two processed files differ in their IDs, or streaming
+sent its first upsert only after every description was requested, i.e. did
+not overlap the stages. The last check needs enough products that describing
+them outlasts one embedding batch linger; smaller --items are refused.
+
+Usage:
+    python benchmarks/bench_streaming_pipeline.py --items 400 --description-ms 60
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+
+def make_raw(scrape_path: str, count: int) -> list:
+    from utils.jsonl import read_records
+    scraped = [p for p in read_records(scrape_path) if p.get('cheese_type') != 'N/A']
+    products = []
+    for i in range(count):
+        product = dict(scraped[i % len(scraped)])
+        product['image_url'] = f"{product['image_url']}&lot={i}"
+        products.append(product)
+    return products
+
+
+class FirstUpsert:
+    """Watches a fake Pinecone server for its first upsert request, noting how many descriptions preceded it"""
+
+    def __init__(self, server, openai_server):
+        self.server = server
+        self.openai_server = openai_server
+        self.start = time.perf_counter()
+        self.at = None
+        self.descriptions = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        while not self._stop.is_set():
+            if self.server.requests['upsert']:
+                self.descriptions = self.openai_server.requests['chat']
+                self.at = time.perf_counter() - self.start
+                return
+            time.sleep(0.002)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def run(label: str, pipeline, pinecone_server, openai_server, dimension: int) -> dict:
+    from chatbot.retriver.local_index import LocalVectorIndex
+    from utils.embedding_cache import get_embedding_cache
+    get_embedding_cache().clear()
+    pinecone_server.index = LocalVectorIndex(dimension)
+    pinecone_server.requests.clear()
+    openai_server.requests.clear()
+    tracemalloc.start()
+    watcher = FirstUpsert(pinecone_server, openai_server)
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary, described = pipeline()
+    seconds = time.perf_counter() - watcher.start
+    watcher.stop()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {
+        'seconds': seconds,
+        'first_upsert': watcher.at,
+        'described_before_upsert': watcher.descriptions,
+        'described': described,
+        'peak_mb': peak / 1e6,
+        'stored': summary['ingest']['stored'],
+        'stored_in_index': len(pinecone_server.index),
+    }
+    first = f"{result['first_upsert']:.2f}" if result['first_upsert'] is not None else "-"
+    done = f"{described:.2f}" if described is not None else "-"
+    before = watcher.descriptions if watcher.descriptions is not None else "-"
+    print(f"{label:<10} {result['stored']:>7} {result['seconds']:>8.2f} {first:>12} {before:>9} {done:>10} "
+          f"{result['peak_mb']:>8.1f}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--description-ms", type=float, default=40, help="fake chat (description) request latency")
+    parser.add_argument("--embedding-ms", type=float, default=20, help="fake embedding request latency")
+    parser.add_argument("--upsert-ms", type=float, default=15, help="fake Pinecone upsert latency")
+    parser.add_argument("--scrape", default=str(Path(project_root) / "data_processing" / "database" / "cheese_products.json"))
+    args = parser.parse_args()
+
+    # Settings are read when utils.config is first imported, so the environment goes first
+    tmp = Path(tempfile.mkdtemp(prefix="bench-stream-"))
+    os.environ.update({
+        'OPENAI_API_KEY': 'fake-key',
+        'PINECONE_API_KEY': 'fake-key',
+        'VECTOR_BACKEND': 'pinecone',
+        'EMBEDDING_CACHE_PATH': '',
+        'CATALOG_VERSION_PATH': str(tmp / "catalog_version"),
+        'BM25_INDEX_PATH': str(tmp / "bm25_index.npz"),
+        'INGEST_BATCH_LINGER_SECONDS': '0.25',
+    })
+    logging.basicConfig(level=logging.CRITICAL)
+    from fake_services import FakeOpenAIServer, FakePineconeServer, LatencyModel
+    from utils.config import Config
+    from chatbot.retriver.local_index import LocalVectorIndex
+    from utils.jsonl import read_records, write_jsonl
+
+    openai_server = FakeOpenAIServer(LatencyModel({'chat': args.description_ms, 'embeddings': args.embedding_ms})).start()
+    pinecone_server = FakePineconeServer(LocalVectorIndex(Config.VECTOR_DIMENSION), LatencyModel({'upsert': args.upsert_ms})).start()
+    Config.OPENAI_BASE_URL = openai_server.base_url
+    Config.PINECONE_HOST = pinecone_server.url
+    from data_processing.process_data import DataProcessor, iter_mapped
+    from data_processing.pinecone.manifest import IngestManifest
+    from data_processing.pinecone.pinecone import PineconeIngestor
+    from data_processing.pipeline import run_pipeline
+
+    # Describing must outlast the first batch's linger (twice over) for the overlap check to be meaningful
+    batch_ms = Config.INGEST_BATCH_LINGER_SECONDS * 1000 + args.embedding_ms + args.upsert_ms
+    min_items = int(2 * Config.DESCRIPTION_WORKERS * batch_ms / args.description_ms) + 1
+    if args.items < min_items:
+        parser.error(f"--items must be at least {min_items} with these latencies")
+
+    raw_path = str(tmp / "cheese_products.jsonl")
+    write_jsonl(make_raw(args.scrape, args.items), raw_path)
+
+    def staged():
+        start = time.perf_counter()
+        mapped = list(iter_mapped(read_records(raw_path)))
+        processed = DataProcessor().process_data(mapped)
+        described = time.perf_counter() - start
+        write_jsonl(processed, str(tmp / "staged.jsonl"))
+        summary = PineconeIngestor().sync(list(read_records(str(tmp / "staged.jsonl"))), IngestManifest(str(tmp / "staged-manifest.json")))
+        return summary, described
+
+    def streaming():
+        summary = run_pipeline(
+            read_records(raw_path),
+            processed_out=str(tmp / "streaming.jsonl"),
+            manifest=IngestManifest(str(tmp / "streaming-manifest.json"))
+        )
+        return summary, None
+
+    # Warm up clients, connections and lazy imports so neither measured run pays for them
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_pipeline(iter(make_raw(args.scrape, 8)), manifest=IngestManifest(str(tmp / "warmup-manifest.json")))
+
+    print(f"{args.items} products, {Config.DESCRIPTION_WORKERS} description workers, {args.description_ms:.0f} ms per "
+          f"description, {args.embedding_ms:.0f} ms per embedding request, {args.upsert_ms:.0f} ms per upsert")
+    print(f"{'run':<10} {'stored':>7} {'seconds':>8} {'first upsert':>12} {'requested':>9} {'described':>10} {'peak MB':>8}")
+    staged_run = run('staged', staged, pinecone_server, openai_server, Config.VECTOR_DIMENSION)
+    streaming_run = run('streaming', streaming, pinecone_server, openai_server, Config.VECTOR_DIMENSION)
+
+    def ids(name: str) -> set:
+        return {item['id'] for item in read_records(str(tmp / name))}
+
+    checks = {
+        'staged stored every product': staged_run['stored'] == args.items == staged_run['stored_in_index'],
+        'streaming stored every product': streaming_run['stored'] == args.items == streaming_run['stored_in_index'],
+        'same processed products': ids("staged.jsonl") == ids("streaming.jsonl"),
+        'streaming upserts while descriptions are still being requested': (
+            streaming_run['described_before_upsert'] is not None and streaming_run['described_before_upsert'] < args.items
+        ),
+    }
+    print()
+    for name, ok in checks.items():
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+
+    openai_server.stop()
+    pinecone_server.stop()
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
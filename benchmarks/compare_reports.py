@@ -0,0 +1,69 @@
+"""
+Compare two stage_latency.py reports stage by stage.
+
+Prints old -> new p50/p95/p99 in ms with the relative change for every
+stage present in either report, and flags p50 changes beyond --threshold;
+the exit status is 1 when any stage is flagged.
+
+Usage:
+    python benchmarks/compare_reports.py baseline.json candidate.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+PERCENTILES = ("p50", "p95", "p99")
+
+
+def change(old, new) -> str:
+    if old is None or new is None:
+        return "   n/a"
+    if old == 0:
+        return "   new" if new else "    0%"
+    return f"{(new - old) / old:+6.0%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative p50 change to flag")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="ignore stages whose p50 stays below this")
+    args = parser.parse_args()
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, 'r', encoding='utf-8') as f:
+        candidate = json.load(f)
+    print(f"baseline {baseline['meta']['commit']} ({baseline['meta']['created']}) -> "
+          f"candidate {candidate['meta']['commit']} ({candidate['meta']['created']})")
+    if baseline['meta'].get('latency_ms') != candidate['meta'].get('latency_ms'):
+        print("warning: the reports were run with different injected latencies")
+
+    flagged = 0
+    for scenario in sorted(set(baseline['scenarios']) | set(candidate['scenarios'])):
+        old_stages = baseline['scenarios'].get(scenario, {}).get('stages', {})
+        new_stages = candidate['scenarios'].get(scenario, {}).get('stages', {})
+        if not old_stages and not new_stages:
+            continue
+        print(f"\n{scenario}")
+        print(f"  {'stage':<22}" + "".join(f" {p + ' old':>9} {p + ' new':>9} {'chg':>6}" for p in PERCENTILES))
+        for stage in sorted(set(old_stages) | set(new_stages)):
+            old, new = old_stages.get(stage, {}), new_stages.get(stage, {})
+            cells = []
+            for p in PERCENTILES:
+                o, n = old.get(p), new.get(p)
+                cells.append(f" {o if o is not None else '-':>9} {n if n is not None else '-':>9} {change(o, n)}")
+            o, n = old.get('p50'), new.get('p50')
+            mark = ""
+            if o and n is not None and max(o, n) >= args.min_ms and abs(n - o) / o > args.threshold:
+                mark = "  <-"
+                flagged += 1
+            print(f"  {stage:<22}" + "".join(cells) + mark)
+
+    print(f"\n{flagged} stage(s) changed p50 by more than {args.threshold:.0%}")
+    sys.exit(1 if flagged else 0)
+
+
+if __name__ == "__main__":
+    main()
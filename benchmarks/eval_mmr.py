@@ -0,0 +1,116 @@
+"""
+Prompt-token reduction and coverage of the MMR reranker against the plain top-k.
+
+Each query retrieves the plain TOP_K_RESULTS matches from the local index,
+and MMRReranker.evaluate compares them with the diversified top-n: packed
+table and verbose context tokens, distinct brand/form pairs and mean pairwise
+similarity, plus rerank latency.
+
+Queries are either logged questions embedded with the OpenAI API (--queries,
+needs OPENAI_API_KEY) or, offline, the stored vectors of catalog products
+("more like this" queries, --self-queries N).
+
+Without a saved local index at --index, one is built from --catalog with the
+hashed bag-of-words embeddings of fake_services.py, which score products
+sharing name words as similar; --queries are then embedded the same way.
+
+Usage:
+    python benchmarks/eval_mmr.py --self-queries 70 --top-n 8 --lambdas 0.5 0.7 0.9 1.0
+    python benchmarks/eval_mmr.py --queries benchmarks/data/sample_queries.jsonl
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from statistics import mean, median
+
+import numpy as np
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+from utils.config import Config
+from utils.jsonl import read_records
+from chatbot.retriver.local_index import LocalVectorIndex
+from chatbot.retriver.mmr import MMRReranker
+from fake_services import hash_embedding
+
+
+def hashed_embeddings(texts, dimension: int):
+    return [hash_embedding(text, dimension) for text in texts]
+
+
+def load_index(args) -> LocalVectorIndex:
+    if Path(args.index).exists():
+        return LocalVectorIndex.load(args.index)
+    print(f"No local index at {args.index}; indexing {args.catalog} with hashed embeddings")
+    return LocalVectorIndex.from_catalog(
+        list(read_records(args.catalog)), lambda texts: hashed_embeddings(texts, Config.VECTOR_DIMENSION), Config.VECTOR_DIMENSION
+    )
+
+
+def load_queries(args, index: LocalVectorIndex):
+    if args.queries:
+        with open(args.queries, 'r', encoding='utf-8') as f:
+            texts = [json.loads(line)['query'] for line in f if line.strip()]
+        if not Path(args.index).exists():
+            return hashed_embeddings(texts, index.dimension)
+        from chatbot.resources import get_vector_store
+        return get_vector_store().get_embeddings(texts)
+    rng = np.random.default_rng(args.seed)
+    rows = rng.choice(len(index), size=min(args.self_queries, len(index)), replace=False)
+    return [index.matrix[row].tolist() for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default=Config.LOCAL_INDEX_PATH)
+    parser.add_argument("--catalog", default=Config.CATALOG_PATH, help="indexed with hashed embeddings when --index does not exist")
+    parser.add_argument("--queries", help="JSONL file with a 'query' field per line")
+    parser.add_argument("--self-queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=Config.TOP_K_RESULTS)
+    parser.add_argument("--top-n", type=int, default=Config.MMR_TOP_N)
+    parser.add_argument("--lambdas", type=float, nargs="+", default=[Config.MMR_LAMBDA])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    index = load_index(args)
+    embeddings = [e for e in load_queries(args, index) if e]
+    candidates = []
+    for embedding in embeddings:
+        response = index.query(embedding, top_k=args.top_k, include_metadata=True)
+        products = [{'id': m.id, 'score': m.score, **m.metadata} for m in response.matches]
+        candidates.append((products, index.vectors([p['id'] for p in products])))
+    print(f"{len(embeddings)} queries, top-{args.top_k} -> MMR top-{args.top_n} over {len(index)} vectors")
+
+    print(f"{'lambda':>6} {'plain tok':>10} {'mmr tok':>8} {'saved':>7} {'verbose saved':>14} "
+          f"{'pairs plain/mmr':>16} {'sim plain/mmr':>14} {'p50 ms':>7} {'max ms':>7}")
+    for lambda_mult in args.lambdas:
+        reranker = MMRReranker(top_n=args.top_n, lambda_mult=lambda_mult)
+        reports = [
+            reranker.evaluate(embedding, products, vectors)
+            for embedding, (products, vectors) in zip(embeddings, candidates)
+        ]
+        plain_tokens = sum(r['plain_tokens'] for r in reports)
+        mmr_tokens = sum(r['mmr_tokens'] for r in reports)
+        plain_verbose = sum(r['plain_verbose_tokens'] for r in reports)
+        mmr_verbose = sum(r['mmr_verbose_tokens'] for r in reports)
+        similarity = [
+            (r['plain_coverage']['mean_pairwise_similarity'], r['mmr_coverage']['mean_pairwise_similarity'])
+            for r in reports if r['mmr_coverage']['mean_pairwise_similarity'] is not None
+        ]
+        latencies = [r['rerank_ms'] for r in reports]
+        print(
+            f"{lambda_mult:>6.2f} {plain_tokens:>10} {mmr_tokens:>8} "
+            f"{1 - mmr_tokens / max(plain_tokens, 1):>7.1%} {1 - mmr_verbose / max(plain_verbose, 1):>14.1%} "
+            f"{mean(r['plain_coverage']['brand_form_pairs'] for r in reports):>7.1f}/"
+            f"{mean(r['mmr_coverage']['brand_form_pairs'] for r in reports):<8.1f} "
+            f"{mean(s[0] for s in similarity) if similarity else float('nan'):>6.3f}/"
+            f"{mean(s[1] for s in similarity) if similarity else float('nan'):<7.3f} "
+            f"{median(latencies):>7.3f} {max(latencies):>7.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
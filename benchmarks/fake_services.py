@@ -0,0 +1,486 @@
+"""
+In-process HTTP stand-ins for the OpenAI and Pinecone endpoints the chatbot calls.
+
+FakeOpenAIServer answers /v1/embeddings and /v1/chat/completions (including
+tool calls and streaming) and FakePineconeServer answers the data-plane
+routes (/query, /vectors/fetch, /vectors/upsert, /vectors/update, /vectors/delete,
+/describe_index_stats) from a LocalVectorIndex. Both are real HTTP servers on
+127.0.0.1, so the official clients, their connection pools and JSON
+handling are exercised unchanged; point them at the fakes with
+OPENAI_BASE_URL and PINECONE_HOST.
+
+Every route sleeps an injected latency (a fixed base per route plus seeded
+lognormal jitter) before answering. Embeddings are deterministic hashed
+bags of words, so texts sharing words land near each other and retrieval
+over the fake index behaves plausibly.
+
+A FaultModel makes a seeded fraction of each route's requests fail the way
+the real services do under load: 429 with Retry-After, 503, or a stall long
+enough to trip client deadlines. FakeOpenAIServer's poison pattern makes
+chat requests whose text matches it fail with a 400 every time, like a
+record the API can never handle.
+
+Usage as a standalone server for manual testing:
+    python benchmarks/fake_services.py --openai-port 8100 --pinecone-port 8101 --chat-ms 400 --embedding-ms 60
+"""
+import argparse
+import base64
+import contextlib
+import hashlib
+import json
+import re
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+from utils.config import Config
+from utils.jsonl import read_records
+from chatbot.retriver.local_index import LocalVectorIndex
+from chatbot.retriver.prompts import FILTER_SYSTEM_MESSAGE
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_NOT_CHEESE_RE = re.compile(r"\b(hello|hi|hey|thanks|thank you|weather|joke|who are you)\b")
+
+
+def hash_embedding(text: str, dimension: int = Config.VECTOR_DIMENSION) -> List[float]:
+    """Deterministic unit vector: each word adds a hashed, signed unit to one dimension"""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in _WORD_RE.findall(text.lower()):
+        digest = int(hashlib.blake2b(word.encode('utf-8'), digest_size=8).hexdigest(), 16)
+        vector[digest % dimension] += 1.0 if (digest >> 32) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+class LatencyModel:
+    """Per-route sleep: base milliseconds times a lognormal jitter factor with median 1"""
+
+    def __init__(self, base_ms: Optional[Dict[str, float]] = None, jitter: float = 0.0, seed: int = 0):
+        self.base_ms = dict(base_ms or {})
+        self.jitter = jitter
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, route: str) -> float:
+        base = self.base_ms.get(route, self.base_ms.get('default', 0.0))
+        if base <= 0:
+            return 0.0
+        if self.jitter <= 0:
+            return base / 1000
+        with self._lock:
+            factor = float(self._rng.lognormal(0.0, self.jitter))
+        return base * factor / 1000
+
+    def sleep(self, route: str):
+        delay = self.delay(route)
+        if delay:
+            time.sleep(delay)
+
+
+class FaultModel:
+    """
+    Per-route injected failures, drawn from a seeded generator.
+
+    rates maps a route name (or 'default') to {kind: probability} with kinds
+    'throttle' (429 with a Retry-After of retry_after seconds), 'error' (503)
+    and 'stall' (stall_ms of extra sleep before a normal answer).
+    """
+
+    KINDS = ('throttle', 'error', 'stall')
+
+    def __init__(
+        self,
+        rates: Optional[Dict[str, Dict[str, float]]] = None,
+        retry_after: float = 0.05,
+        stall_ms: float = 2000,
+        seed: int = 0
+    ):
+        self.rates = dict(rates or {})
+        self.retry_after = retry_after
+        self.stall_ms = stall_ms
+        self.injected: Counter = Counter()
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def draw(self, route: str) -> Optional[str]:
+        """The fault to inject into this request, or None"""
+        rates = self.rates.get(route, self.rates.get('default'))
+        if not rates:
+            return None
+        with self._lock:
+            roll = float(self._rng.random())
+            for kind in self.KINDS:
+                roll -= rates.get(kind, 0.0)
+                if roll < 0:
+                    self.injected[f"{route}:{kind}"] += 1
+                    return kind
+        return None
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients cancelling speculative calls drop their connections mid-response
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class _FakeService:
+    """ThreadingHTTPServer on a background thread with a (method, path) -> handler table"""
+
+    def __init__(self, latency: Optional[LatencyModel] = None, port: int = 0, faults: Optional[FaultModel] = None):
+        self.latency = latency or LatencyModel()
+        self.faults = faults or FaultModel()
+        self.requests: Counter = Counter()
+        self._routes: Dict[Tuple[str, str], Tuple[str, Callable]] = {}
+        self._server = _QuietHTTPServer(('127.0.0.1', port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self, method: str, path: str, name: str, handler: Callable):
+        self._routes[(method, path)] = (name, handler)
+
+    def start(self) -> "_FakeService":
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler_class(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out as separate writes; without this Nagle adds ~40 ms per response
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, format, *args):
+                pass
+
+            def _dispatch(self, method: str):
+                parsed = urlparse(self.path)
+                entry = service._routes.get((method, parsed.path))
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                if entry is None:
+                    self._send(404, {'error': {'message': f"No fake route for {method} {parsed.path}"}})
+                    return
+                name, handler = entry
+                service.requests[name] += 1
+                service.latency.sleep(name)
+                fault = service.faults.draw(name)
+                if fault == 'throttle':
+                    retry_after = f"{service.faults.retry_after:g}"
+                    self._send(429, {'error': {'message': "Rate limit reached (injected)", 'code': 'rate_limit_exceeded'}},
+                               {'Retry-After': retry_after, 'Retry-After-Ms': str(int(service.faults.retry_after * 1000))})
+                    return
+                if fault == 'error':
+                    self._send(503, {'error': {'message': "Service unavailable (injected)", 'code': 'unavailable'}})
+                    return
+                if fault == 'stall':
+                    time.sleep(service.faults.stall_ms / 1000)
+                result = handler(body, parse_qs(parsed.query))
+                if isinstance(result, tuple) and result and result[0] == 'stream':
+                    self._stream(result[1])
+                elif isinstance(result, tuple) and result and result[0] == 'status':
+                    self._send(result[1], result[2])
+                else:
+                    self._send(200, result)
+
+            def _send(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, events):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for event in list(events) + ['[DONE]']:
+                    payload = event if isinstance(event, str) else json.dumps(event)
+                    chunk = f"data: {payload}\n\n".encode('utf-8')
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode('ascii') + chunk + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+        return Handler
+
+
+class FakeOpenAIServer(_FakeService):
+    """
+    OpenAI stand-in. Point clients at url + "/v1".
+
+    Latency routes: 'embeddings' and 'chat' (classification, filter, answer
+    and product description calls alike; for a streamed answer it is the
+    wait before the first token). 'token_ms' in the latency base map spaces
+    out streamed tokens. embedded_texts counts the texts embedded.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        dimension: int = Config.VECTOR_DIMENSION,
+        port: int = 0,
+        faults: Optional[FaultModel] = None,
+        poison: Optional[str] = None
+    ):
+        super().__init__(latency, port, faults)
+        self.dimension = dimension
+        self.poison = re.compile(poison) if poison else None
+        self.embedded_texts = 0
+        self._count_lock = threading.Lock()
+        self.route('POST', '/v1/embeddings', 'embeddings', self._embeddings)
+        self.route('POST', '/v1/chat/completions', 'chat', self._chat)
+
+    @property
+    def base_url(self) -> str:
+        return self.url + "/v1"
+
+    def _embeddings(self, body, query):
+        texts = body['input'] if isinstance(body['input'], list) else [body['input']]
+        tokens = sum(len(_WORD_RE.findall(str(text))) for text in texts)
+        vectors = [hash_embedding(str(text), self.dimension) for text in texts]
+        with self._count_lock:
+            self.embedded_texts += len(texts)
+        if body.get('encoding_format') == 'base64':
+            # What the SDK asks for by default: little-endian float32, as the real endpoint sends it
+            vectors = [base64.b64encode(np.asarray(vector, dtype='<f4').tobytes()).decode('ascii') for vector in vectors]
+        return {
+            'object': 'list',
+            'model': body.get('model', Config.EMBEDDING_MODEL),
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': vector}
+                for i, vector in enumerate(vectors)
+            ],
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        }
+
+    def _chat(self, body, query):
+        messages = body.get('messages', [])
+        last = messages[-1]['content'] if messages else ''
+        if isinstance(last, list):
+            # Image requests send text and image parts; only the text is read
+            last = ' '.join(part.get('text', '') for part in last if part.get('type') == 'text')
+        if self.poison and self.poison.search(last):
+            return 'status', 400, {'error': {'message': "Unprocessable request (poisoned)", 'code': 'invalid_request'}}
+        message: Dict[str, Any] = {'role': 'assistant', 'content': None}
+        if body.get('tools'):
+            is_cheese = 0 if _NOT_CHEESE_RE.search(last.lower()) else 1
+            message['tool_calls'] = [{
+                'id': 'call_fake',
+                'type': 'function',
+                'function': {
+                    'name': body['tools'][0]['function']['name'],
+                    'arguments': json.dumps({'is_cheese_question': is_cheese})
+                }
+            }]
+            finish_reason = 'tool_calls'
+        elif messages and str(messages[0].get('content', '')).startswith(FILTER_SYSTEM_MESSAGE):
+            message['content'] = '{}'
+            finish_reason = 'stop'
+        else:
+            message['content'] = self._answer(last)
+            finish_reason = 'stop'
+
+        if body.get('stream'):
+            return 'stream', self._stream_events(body, message['content'] or '')
+        return {
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', Config.OPENAI_MODEL),
+            'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+            'usage': {'prompt_tokens': len(last) // 4, 'completion_tokens': 40, 'total_tokens': len(last) // 4 + 40}
+        }
+
+    def _stream_events(self, body, content: str):
+        token_delay = self.latency.base_ms.get('token_ms', 0.0) / 1000
+        for i, word in enumerate(content.split(' ')):
+            if token_delay:
+                time.sleep(token_delay)
+            yield {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', Config.OPENAI_MODEL),
+                'choices': [{'index': 0, 'delta': {'content': word if i == 0 else ' ' + word}, 'finish_reason': None}]
+            }
+
+    @staticmethod
+    def _answer(prompt: str) -> str:
+        described = re.search(r"- cheese type: (.+)", prompt)
+        if described:
+            brand = re.search(r"- brand: (.+)", prompt)
+            return (f"{described.group(1).strip()} by {brand.group(1).strip() if brand else 'an unknown maker'}: "
+                    f"a well-balanced cheese with a clean finish, suited to slicing, melting and cheese boards.")
+        products = re.findall(r"^\d+ \| ([^|]+) \|", prompt, flags=re.MULTILINE)
+        if products:
+            return "Here are some options: " + "; ".join(p.strip() for p in products[:3]) + "."
+        return "I can help you find cheese in our catalog."
+
+
+class FakePineconeServer(_FakeService):
+    """
+    Pinecone data-plane stand-in backed by a LocalVectorIndex. Use url as PINECONE_HOST.
+
+    Latency routes: 'query', 'fetch', 'upsert', 'update', 'delete' and 'stats'.
+    """
+
+    def __init__(
+        self,
+        index: LocalVectorIndex,
+        latency: Optional[LatencyModel] = None,
+        port: int = 0,
+        faults: Optional[FaultModel] = None
+    ):
+        super().__init__(latency, port, faults)
+        self.index = index
+        self._index_lock = threading.Lock()
+        self.route('POST', '/query', 'query', self._query)
+        self.route('GET', '/vectors/fetch', 'fetch', self._fetch)
+        self.route('POST', '/vectors/upsert', 'upsert', self._upsert)
+        self.route('POST', '/vectors/update', 'update', self._update)
+        self.route('POST', '/vectors/delete', 'delete', self._delete)
+        self.route('POST', '/describe_index_stats', 'stats', self._stats)
+
+    @classmethod
+    def from_catalog(
+        cls,
+        catalog_path: str = Config.CATALOG_PATH,
+        latency: Optional[LatencyModel] = None,
+        dimension: int = Config.VECTOR_DIMENSION,
+        port: int = 0,
+        faults: Optional[FaultModel] = None
+    ) -> "FakePineconeServer":
+        """Index the processed catalog with the same hashed embeddings the fake OpenAI server returns"""
+        index = LocalVectorIndex.from_catalog(
+            list(read_records(catalog_path)), lambda texts: [hash_embedding(text, dimension) for text in texts], dimension
+        )
+        return cls(index, latency, port, faults)
+
+    def _query(self, body, query):
+        with self._index_lock:
+            response = self.index.query(
+                vector=body['vector'],
+                top_k=body.get('topK', 10),
+                include_metadata=body.get('includeMetadata', False),
+                include_values=body.get('includeValues', False),
+                filter=body.get('filter')
+            )
+        return {
+            'matches': [
+                {'id': m.id, 'score': m.score, 'values': m.values, 'metadata': m.metadata or None}
+                for m in response.matches
+            ],
+            'namespace': body.get('namespace', ''),
+            'usage': {'readUnits': 1}
+        }
+
+    def _fetch(self, body, query):
+        with self._index_lock:
+            found = self.index.fetch(query.get('ids', []))
+        return {
+            'vectors': {vid: {'id': vid, 'values': m.values, 'metadata': m.metadata} for vid, m in found.items()},
+            'namespace': query.get('namespace', [''])[0],
+            'usage': {'readUnits': 1}
+        }
+
+    def _upsert(self, body, query):
+        vectors = body.get('vectors', [])
+        with self._index_lock:
+            self.index.upsert(vectors=vectors)
+        return {'upsertedCount': len(vectors)}
+
+    def _update(self, body, query):
+        with self._index_lock:
+            # Like Pinecone, updating an unknown ID is not an error
+            with contextlib.suppress(KeyError):
+                self.index.update(body['id'], body.get('setMetadata') or {})
+        return {}
+
+    def _delete(self, body, query):
+        with self._index_lock:
+            self.index.delete(body.get('ids', []))
+        return {}
+
+    def _stats(self, body, query):
+        count = len(self.index)
+        return {
+            'namespaces': {'': {'vectorCount': count}},
+            'dimension': self.index.dimension,
+            'indexFullness': 0.0,
+            'totalVectorCount': count
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--openai-port", type=int, default=8100)
+    parser.add_argument("--pinecone-port", type=int, default=8101)
+    parser.add_argument("--chat-ms", type=float, default=0)
+    parser.add_argument("--embedding-ms", type=float, default=0)
+    parser.add_argument("--query-ms", type=float, default=0)
+    parser.add_argument("--jitter", type=float, default=0.0, help="lognormal sigma of the latency factor")
+    args = parser.parse_args()
+
+    openai_server = FakeOpenAIServer(
+        LatencyModel({'chat': args.chat_ms, 'embeddings': args.embedding_ms}, args.jitter), port=args.openai_port
+    ).start()
+    pinecone_server = FakePineconeServer.from_catalog(
+        latency=LatencyModel({'default': args.query_ms}, args.jitter), port=args.pinecone_port
+    ).start()
+    print(f"OPENAI_BASE_URL={openai_server.base_url}")
+    print(f"PINECONE_HOST={pinecone_server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        openai_server.stop()
+        pinecone_server.stop()
+
+
+if __name__ == "__main__":
+    main()
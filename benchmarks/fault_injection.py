@@ -0,0 +1,249 @@
+"""
+Resilience checks for the upstream call layer against fault-injecting stand-ins.
+
+Starts the fake OpenAI and Pinecone servers from fake_services.py with a
+FaultModel, points the real clients at them and runs each scenario. Every
+scenario prints what it measured and whether it met its expectation; the
+exit status is 1 when any did not.
+
+Scenarios:
+    retries    ChatSession.ask with a share of 429 (with Retry-After) and 503
+               answers on every route, with and without retries
+    hedging    VectorStore.query_by_vector with a share of stalled Pinecone
+               queries, with and without hedged requests (tail latency)
+    deadline   every chat completion stalls; ask must give up at the chat
+               deadline rather than wait for the server
+    breaker    OpenAI answers 503 to everything; once the circuit opens calls
+               fail without reaching the server, and it closes again after
+               the outage once BREAKER_RESET_SECONDS have passed
+
+Usage:
+    python benchmarks/fault_injection.py
+    python benchmarks/fault_injection.py --scenarios hedging --stall-rate 0.1 --stall-ms 800 --hedge-ms 60
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+SCENARIOS = ["retries", "hedging", "deadline", "breaker"]
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "no samples"
+    p50, p95, p99 = np.percentile(np.asarray(values), (50, 95, 99))
+    return f"p50 {p50:7.1f}  p95 {p95:7.1f}  p99 {p99:7.1f} ms"
+
+
+def counter_total(prefix: str) -> float:
+    from utils.tracing import get_tracer
+    counters = get_tracer().metrics.snapshot()['counters']
+    return sum(value for name, value in counters.items() if name.startswith(prefix))
+
+
+def reset_upstreams(**overrides):
+    """Fresh circuits and the configured policy on the shared upstreams, with overrides applied"""
+    from utils.config import Config
+    from utils.resilience import CircuitBreaker, get_upstream, parse_deadlines
+    for name in ('openai', 'pinecone'):
+        upstream = get_upstream(name)
+        upstream.breaker = CircuitBreaker(name)
+        upstream.deadlines = parse_deadlines(Config.UPSTREAM_DEADLINES)
+        upstream.max_attempts = Config.UPSTREAM_MAX_ATTEMPTS
+        upstream.default_deadline = Config.UPSTREAM_DEFAULT_DEADLINE
+        upstream.hedge_after = Config.UPSTREAM_HEDGE_MS / 1000
+        for key, value in overrides.items():
+            setattr(upstream, key, value)
+
+
+def timed_asks(queries: List[str]) -> Dict[str, list]:
+    from chatbot.bot import ChatSession
+    from utils.embedding_cache import get_embedding_cache
+    get_embedding_cache().clear()
+    walls, errors = [], []
+    for query in queries:
+        start = time.perf_counter()
+        try:
+            ChatSession().ask(query)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+        walls.append((time.perf_counter() - start) * 1000)
+    return {'walls': walls, 'errors': errors}
+
+
+def run_retries(args, queries, openai_server, pinecone_server) -> bool:
+    from fake_services import FaultModel
+    rates = {'throttle': args.throttle_rate, 'error': args.error_rate}
+    openai_server.faults = FaultModel({'default': rates}, retry_after=args.retry_after, seed=args.seed)
+    pinecone_server.faults = FaultModel({'default': rates}, retry_after=args.retry_after, seed=args.seed + 1)
+
+    reset_upstreams(max_attempts=1)
+    without = timed_asks(queries)
+    reset_upstreams()
+    retries_before = counter_total('upstream_retries_total')
+    with_retries = timed_asks(queries)
+    retries = counter_total('upstream_retries_total') - retries_before
+
+    print(f"  no retries    {len(without['errors']):3d}/{len(queries)} failed   {percentiles(without['walls'])}")
+    print(f"  with retries  {len(with_retries['errors']):3d}/{len(queries)} failed   {percentiles(with_retries['walls'])}")
+    print(f"  {int(retries)} retries; injected {dict(openai_server.faults.injected) | dict(pinecone_server.faults.injected)}")
+    openai_server.faults = FaultModel()
+    pinecone_server.faults = FaultModel()
+    return len(with_retries['errors']) < max(1, len(without['errors']))
+
+
+def run_hedging(args, queries, openai_server, pinecone_server) -> bool:
+    from fake_services import FaultModel, hash_embedding
+    from chatbot.resources import get_vector_store
+    store = get_vector_store()
+    embeddings = [hash_embedding(query) for query in queries] * args.repeat
+
+    def measure(hedge_after: float) -> List[float]:
+        pinecone_server.faults = FaultModel({'query': {'stall': args.stall_rate}}, stall_ms=args.stall_ms, seed=args.seed)
+        reset_upstreams(hedge_after=hedge_after)
+        walls = []
+        for embedding in embeddings:
+            start = time.perf_counter()
+            store.query_by_vector(embedding)
+            walls.append((time.perf_counter() - start) * 1000)
+        return walls
+
+    plain = measure(0)
+    hedges_before = counter_total('upstream_hedges_total')
+    hedged = measure(args.hedge_ms / 1000)
+    hedges = counter_total('upstream_hedges_total') - hedges_before
+    pinecone_server.faults = FaultModel()
+
+    print(f"  no hedging    {percentiles(plain)}")
+    print(f"  hedged        {percentiles(hedged)}   ({int(hedges)} hedges for {len(embeddings)} queries)")
+    return np.percentile(hedged, 99) < np.percentile(plain, 99)
+
+
+def run_deadline(args, queries, openai_server, pinecone_server) -> bool:
+    from fake_services import FaultModel
+    from utils.resilience import get_upstream
+    openai_server.faults = FaultModel({'chat': {'stall': 1.0}}, stall_ms=args.deadline_ms * 4)
+    reset_upstreams()
+    # Every chat stage (classification, filter, answer, ...) gets the short deadline
+    get_upstream('openai').deadlines = {'embedding': 5.0}
+    get_upstream('openai').default_deadline = args.deadline_ms / 1000
+    result = timed_asks(queries[:3])
+    openai_server.faults = FaultModel()
+
+    print(f"  deadline {args.deadline_ms:.0f} ms, server stalls {args.deadline_ms * 4:.0f} ms")
+    print(f"  {len(result['errors'])}/3 asks failed   {percentiles(result['walls'])}")
+    if result['errors']:
+        print(f"  e.g. {result['errors'][0]}")
+    # Allow the attempts' connection setup and the error path some slack over the deadline itself
+    return len(result['errors']) == 3 and max(result['walls']) < args.deadline_ms * 1.5 + 100
+
+
+def run_breaker(args, queries, openai_server, pinecone_server) -> bool:
+    from fake_services import FaultModel
+    from utils.resilience import CircuitBreaker, get_upstream
+    openai_server.faults = FaultModel({'default': {'error': 1.0}})
+    reset_upstreams()
+    upstream = get_upstream('openai')
+    upstream.breaker = CircuitBreaker('openai', reset_timeout=args.breaker_reset_ms / 1000)
+
+    sent_before = sum(openai_server.requests.values())
+    outage = timed_asks(queries)
+    sent = sum(openai_server.requests.values()) - sent_before
+    state_during = upstream.breaker.state
+    rejected = sum(1 for error in outage['errors'] if error.startswith('CircuitOpenError'))
+
+    openai_server.faults = FaultModel()
+    time.sleep(args.breaker_reset_ms / 1000)
+    recovered = timed_asks(queries[:3])
+
+    print(f"  outage: {len(outage['errors'])}/{len(queries)} asks failed, {rejected} rejected by the open circuit, "
+          f"{sent} requests reached the server; circuit {state_during}")
+    print(f"  after reset: {len(recovered['errors'])}/3 failed; circuit {upstream.breaker.state}")
+    return state_during == CircuitBreaker.OPEN and rejected > 0 and not recovered['errors'] \
+        and upstream.breaker.state == CircuitBreaker.CLOSED
+
+
+RUNNERS: Dict[str, Callable] = {
+    'retries': run_retries,
+    'hedging': run_hedging,
+    'deadline': run_deadline,
+    'breaker': run_breaker,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--queries", default=str(Path(__file__).parent / "data" / "sample_queries.jsonl"))
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the query file in the hedging scenario")
+    parser.add_argument("--chat-ms", type=float, default=20, help="fake chat completion latency")
+    parser.add_argument("--embedding-ms", type=float, default=5)
+    parser.add_argument("--query-ms", type=float, default=5, help="fake Pinecone query latency")
+    parser.add_argument("--throttle-rate", type=float, default=0.1, help="share of requests answered 429")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="share of requests answered 503")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--stall-rate", type=float, default=0.05, help="share of Pinecone queries stalled when hedging")
+    parser.add_argument("--stall-ms", type=float, default=500)
+    parser.add_argument("--hedge-ms", type=float, default=40, help="hedge delay for the hedged run")
+    parser.add_argument("--deadline-ms", type=float, default=300, help="chat deadline in the deadline scenario")
+    parser.add_argument("--breaker-reset-ms", type=float, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's warnings and errors")
+    args = parser.parse_args()
+
+    # Settings are read when utils.config is first imported, so the environment goes first
+    tmp = Path(tempfile.mkdtemp(prefix="fault-injection-"))
+    os.environ.update({
+        'OPENAI_API_KEY': 'fake-key',
+        'PINECONE_API_KEY': 'fake-key',
+        'VECTOR_BACKEND': 'pinecone',
+        'EMBEDDING_CACHE_PATH': '',
+        'ANSWER_CACHE_ENABLED': 'false',
+        'CATALOG_VERSION_PATH': str(tmp / "catalog_version"),
+        'BM25_INDEX_PATH': str(tmp / "bm25_index.npz"),
+        'TRACING_ENABLED': 'true',
+        'TRACE_PATH': '',
+    })
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.CRITICAL)
+    from fake_services import FakeOpenAIServer, FakePineconeServer, LatencyModel
+
+    openai_server = FakeOpenAIServer(LatencyModel({'chat': args.chat_ms, 'embeddings': args.embedding_ms})).start()
+    pinecone_server = FakePineconeServer.from_catalog(latency=LatencyModel({'default': args.query_ms})).start()
+    from utils.config import Config
+    Config.OPENAI_BASE_URL = openai_server.base_url
+    Config.PINECONE_HOST = pinecone_server.url
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        queries = [json.loads(line)['query'] for line in f if line.strip()]
+
+    failed = []
+    for scenario in args.scenarios:
+        print(f"\n{scenario}")
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            # Shared resources and the tokenizer load on first use; keep that out of the numbers
+            timed_asks(queries[:1])
+        ok = RUNNERS[scenario](args, queries, openai_server, pinecone_server)
+        print(f"  -> {'ok' if ok else 'FAILED'}")
+        if not ok:
+            failed.append(scenario)
+
+    openai_server.stop()
+    pinecone_server.stop()
+    print(f"\n{len(args.scenarios) - len(failed)}/{len(args.scenarios)} scenarios met expectations")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Load test for AsyncVectorStore against in-process fakes on a single event loop.
+
+The fake OpenAI client and vector index sleep for a configurable latency per
+call instead of doing network I/O, so the numbers isolate how well one event
+loop overlaps in-flight requests. Each request runs the full LLM path
+(classification, filter generation, embedding, vector query, generation);
+query texts are unique so the embedding cache never short-circuits a call.
+
+Usage:
+    python benchmarks/load_async_store.py --concurrency 1 4 16 64 --requests 256 --latency-ms 50
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+# Random fake embeddings score near 0, far below the default CONTEXT_MIN_SCORE; settings are read
+# when utils.config is first imported, so keep every match in the context
+os.environ.setdefault('CONTEXT_MIN_SCORE', '-1')
+
+from utils.config import Config
+from utils.embedding_cache import EmbeddingCache
+from chatbot.retriver.local_index import LocalVectorIndex
+from chatbot.retriver.async_store import AsyncVectorStore
+from chatbot.retriver.prompts import FILTER_SYSTEM_MESSAGE
+
+
+def fake_embedding(text: str, dimension: int) -> List[float]:
+    seed = int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).standard_normal(dimension).astype(np.float32).tolist()
+
+
+class FakeAsyncOpenAI:
+    """Just enough of AsyncOpenAI for the retrieval pipeline, with a fixed latency per call"""
+
+    def __init__(self, latency: float, dimension: int):
+        self.latency = latency
+        self.dimension = dimension
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.embeddings = SimpleNamespace(create=self._embed)
+
+    async def _chat(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if kwargs.get('tools'):
+            arguments = json.dumps({'is_cheese_question': 1})
+            message = SimpleNamespace(content=None, tool_calls=[SimpleNamespace(function=SimpleNamespace(arguments=arguments))])
+        elif kwargs['messages'][0]['content'].startswith(FILTER_SYSTEM_MESSAGE):
+            message = SimpleNamespace(content='{"price_each": {"$lt": 100}}')
+        else:
+            message = SimpleNamespace(content="Here are some cheeses.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def _embed(self, model: str, input, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        texts = [input] if isinstance(input, str) else input
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=fake_embedding(text, self.dimension)) for i, text in enumerate(texts)
+        ])
+
+    async def close(self):
+        pass
+
+
+class FakeAsyncIndex:
+    """LocalVectorIndex behind an awaitable query with network-like latency, standing in for IndexAsyncio"""
+
+    def __init__(self, index: LocalVectorIndex, latency: float):
+        self.index = index
+        self.latency = latency
+
+    async def query(self, timeout=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self.index.query(**kwargs)
+
+
+async def run_level(store: AsyncVectorStore, concurrency: int, requests: int, run_id: str) -> List[float]:
+    """Issue `requests` pipeline calls with at most `concurrency` in flight; returns per-request latencies"""
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with gate:
+            start = time.perf_counter()
+            result = await store.aget_relevant_products(f"[{run_id}-{i}] Which mozzarella would you recommend?")
+            latencies.append(time.perf_counter() - start)
+            assert result['context'], "fake pipeline returned no products"
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+
+async def main_async(args):
+    with open(args.catalog, 'r', encoding='utf-8') as f:
+        products = json.load(f)
+    index = LocalVectorIndex.from_catalog(
+        products, lambda texts: [fake_embedding(t, args.dim) for t in texts], args.dim
+    )
+    latency = args.latency_ms / 1000
+    # Five upstream calls per request; the embedding and vector query sit on the critical path
+    # behind the classifier, so one request takes about three round trips end to end.
+    print(f"Catalog: {len(index)} products, fake upstream latency {args.latency_ms:.0f} ms per call")
+    print(f"{'concurrency':>11} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'calls':>7}")
+
+    baseline = None
+    for concurrency in args.concurrency:
+        client = FakeAsyncOpenAI(latency, args.dim)
+        store = AsyncVectorStore(
+            client=client,
+            index=FakeAsyncIndex(index, latency),
+            max_concurrency=concurrency * 3
+        )
+        store.embedding_cache = EmbeddingCache(path="", memory_items=0)
+        start = time.perf_counter()
+        latencies = await run_level(store, concurrency, args.requests, f"c{concurrency}")
+        elapsed = time.perf_counter() - start
+        await store.aclose()
+
+        latencies.sort()
+        throughput = args.requests / elapsed
+        baseline = baseline or throughput
+        print(f"{concurrency:>11} {throughput:>9.1f} {latencies[len(latencies) // 2] * 1000:>8.1f} "
+              f"{latencies[int(len(latencies) * 0.95)] * 1000:>8.1f} {client.calls:>7}  "
+              f"({throughput / baseline:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog", default=Config.CATALOG_PATH)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=256, help="requests per concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--dim", type=int, default=Config.VECTOR_DIMENSION)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
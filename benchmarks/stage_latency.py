@@ -0,0 +1,293 @@
+"""
+End-to-end stage latency of ChatSession and HybridSearch against local stand-ins.
+
+Starts the fake OpenAI and Pinecone HTTP servers from fake_services.py with
+the injected latencies below, points the real clients at them through
+OPENAI_BASE_URL / PINECONE_HOST, drives each scenario over the sample
+queries and writes p50/p95/p99 per stage to a JSON report. Reports from two
+commits can be compared with compare_reports.py.
+
+Scenarios:
+    chat_session             ChatSession.ask, stages run one after another
+    chat_session_concurrent  ChatSession.ask with CONCURRENT_STAGES on
+    chat_session_stream      ChatSession.ask_stream (adds answer_first_token)
+    conversation             multi-turn ChatSession.ask, exercising memory and query rewriting
+    hybrid_search            HybridSearch.search with a catalog-backed MySQL stand-in
+                             (needs mysql-connector-python importable; skipped otherwise)
+
+Usage:
+    python benchmarks/stage_latency.py --output report.json
+    python benchmarks/stage_latency.py --scenarios chat_session hybrid_search --chat-ms 600 --jitter 0.3 --repeat 3
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+SCENARIOS = ["chat_session", "chat_session_concurrent", "chat_session_stream", "conversation", "hybrid_search"]
+PERCENTILES = (50, 95, 99)
+CONVERSATION = [
+    "What mozzarella do you have?",
+    "Which of those are shredded?",
+    "How about from Galbani?",
+    "Is there anything similar but cheaper?",
+]
+
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    """Per-stage count, mean, max and percentiles in ms"""
+    summary = {}
+    for stage, values in sorted(samples.items()):
+        if not values:
+            continue
+        values = np.asarray(values, dtype=np.float64)
+        summary[stage] = {
+            'count': int(len(values)),
+            'mean': round(float(values.mean()), 2),
+            'max': round(float(values.max()), 2),
+            **{f"p{p}": round(float(np.percentile(values, p)), 2) for p in PERCENTILES}
+        }
+    return summary
+
+
+class CatalogMySQLHandler:
+    """The MySQLHandler lookups HybridSearch uses, answered from the processed catalog after a fixed delay"""
+
+    def __init__(self, catalog_path: str, latency_ms: float):
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            self.rows = [{'id': item['id'], **item['metadata'], 'description': item['description']} for item in json.load(f)]
+        self.delay = latency_ms / 1000
+
+    def _select(self, predicate: Callable[[Dict[str, Any]], bool], key=None, limit: int = None) -> List[Dict[str, Any]]:
+        time.sleep(self.delay)
+        rows = [row for row in self.rows if predicate(row)]
+        if key is not None:
+            rows.sort(key=key)
+        return rows[:limit] if limit else rows
+
+    def get_most_expensive_cheese(self, limit: int = 5):
+        return self._select(lambda row: row.get('price_each'), key=lambda row: -row['price_each'], limit=limit)
+
+    def get_cheese_by_price_range(self, min_price: float, max_price: float):
+        return self._select(lambda row: row.get('price_each') is not None and min_price <= row['price_each'] <= max_price,
+                            key=lambda row: row['price_each'])
+
+    def get_cheese_by_location(self, location: str):
+        return self._select(lambda row: location.lower() in str(row.get('location', '')).lower())
+
+    def get_cheese_by_type(self, cheese_type: str):
+        return self._select(lambda row: cheese_type.lower() in str(row.get('cheese_type', '')).lower())
+
+
+def run_chat_session(queries: List[str], samples, errors: List[str], stream: bool = False):
+    from chatbot.bot import ChatSession
+    for query in queries:
+        session = ChatSession()
+        start = time.perf_counter()
+        try:
+            if stream:
+                result = None
+                for event in session.ask_stream(query):
+                    if event['type'] == 'final':
+                        result = event
+            else:
+                result = session.ask(query)
+        except Exception as e:
+            errors.append(f"{query}: {e}")
+            continue
+        record(samples, result['timings'], start)
+
+
+def run_conversation(repeat: int, samples, errors: List[str]):
+    from chatbot.bot import ChatSession
+    for _ in range(repeat):
+        session = ChatSession()
+        for query in CONVERSATION:
+            start = time.perf_counter()
+            try:
+                result = session.ask(query)
+            except Exception as e:
+                errors.append(f"{query}: {e}")
+                break
+            record(samples, result['timings'], start)
+
+
+def run_hybrid_search(
+    queries: List[str],
+    samples,
+    errors: List[str],
+    mysql_latency_ms: float,
+    real_mysql: bool,
+    warmup: int
+):
+    sys.path.append(str(Path(project_root) / "data_processing" / "mysql"))
+    try:
+        import hybrid_search
+    except ImportError as e:
+        return f"skipped: {e}"
+    from utils.config import Config
+    if not real_mysql:
+        hybrid_search.MySQLHandler = lambda **kwargs: CatalogMySQLHandler(Config.CATALOG_PATH, mysql_latency_ms)
+    searcher = hybrid_search.HybridSearch()
+    for query in queries[:warmup]:
+        searcher.search(query)
+    for query in queries:
+        start = time.perf_counter()
+        result = searcher.search(query)
+        if 'error' in result:
+            errors.append(f"{query}: {result['error']}")
+            continue
+        stages = {key[:-3] if key.endswith('_ms') else key: value
+                  for key, value in result['metrics'].items() if key.endswith('_ms')}
+        record(samples, stages, start)
+    return None
+
+
+def record(samples, timings: Dict[str, float], start: float):
+    samples['wall'].append((time.perf_counter() - start) * 1000)
+    for stage, value in timings.items():
+        samples[stage].append(value)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=project_root,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--queries", default=str(Path(__file__).parent / "data" / "sample_queries.jsonl"))
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the query file per scenario")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed queries before each scenario")
+    parser.add_argument("--chat-ms", type=float, default=300, help="fake chat completion latency")
+    parser.add_argument("--stream-first-token-ms", type=float, default=None,
+                        help="latency before the first streamed token (defaults to --chat-ms)")
+    parser.add_argument("--token-ms", type=float, default=5, help="gap between streamed tokens")
+    parser.add_argument("--embedding-ms", type=float, default=50)
+    parser.add_argument("--query-ms", type=float, default=30, help="fake Pinecone query latency")
+    parser.add_argument("--mysql-ms", type=float, default=5, help="MySQL stand-in latency for hybrid_search")
+    parser.add_argument("--real-mysql", action="store_true", help="use the MySQL server from the MYSQL_* settings")
+    parser.add_argument("--jitter", type=float, default=0.2, help="lognormal sigma of every injected latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache on")
+    parser.add_argument("--output", default="stage_latency_report.json")
+    args = parser.parse_args()
+
+    # Settings are read when utils.config is first imported, so the environment goes first
+    tmp = Path(tempfile.mkdtemp(prefix="stage-latency-"))
+    os.environ.update({
+        'OPENAI_API_KEY': 'fake-key',
+        'PINECONE_API_KEY': 'fake-key',
+        'VECTOR_BACKEND': 'pinecone',
+        'EMBEDDING_CACHE_PATH': '',
+        'ANSWER_CACHE_ENABLED': 'true' if args.answer_cache else 'false',
+        'CATALOG_VERSION_PATH': str(tmp / "catalog_version"),
+        'BM25_INDEX_PATH': str(tmp / "bm25_index.npz"),
+    })
+    from fake_services import FakeOpenAIServer, FakePineconeServer, LatencyModel
+
+    openai_latency = LatencyModel({
+        'chat': args.chat_ms,
+        'embeddings': args.embedding_ms,
+        'token_ms': args.token_ms,
+    }, args.jitter, args.seed)
+    pinecone_latency = LatencyModel({'default': args.query_ms}, args.jitter, args.seed + 1)
+    openai_server = FakeOpenAIServer(openai_latency).start()
+    pinecone_server = FakePineconeServer.from_catalog(latency=pinecone_latency).start()
+    # fake_services has already imported utils.config, so point the loaded settings at the fakes directly
+    from utils.config import Config
+    from utils.embedding_cache import get_embedding_cache
+    Config.OPENAI_BASE_URL = openai_server.base_url
+    Config.PINECONE_HOST = pinecone_server.url
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        queries = [json.loads(line)['query'] for line in f if line.strip()] * args.repeat
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'queries': len(queries),
+            'latency_ms': {
+                'chat': args.chat_ms, 'embeddings': args.embedding_ms, 'token': args.token_ms,
+                'pinecone_query': args.query_ms, 'mysql': args.mysql_ms, 'jitter_sigma': args.jitter
+            },
+            'answer_cache': args.answer_cache
+        },
+        'scenarios': {}
+    }
+
+    for scenario in args.scenarios:
+        samples: Dict[str, List[float]] = defaultdict(list)
+        errors: List[str] = []
+        before_openai, before_pinecone = dict(openai_server.requests), dict(pinecone_server.requests)
+        Config.CONCURRENT_STAGES = scenario == "chat_session_concurrent"
+        openai_latency.base_ms['chat'] = args.chat_ms
+        if scenario == "chat_session_stream" and args.stream_first_token_ms is not None:
+            openai_latency.base_ms['chat'] = args.stream_first_token_ms
+
+        # Every scenario starts with cold embeddings; the pipeline's progress prints are silenced
+        get_embedding_cache().clear()
+        start = time.perf_counter()
+        skipped = None
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            if scenario == "conversation":
+                run_conversation(args.repeat, samples, errors)
+            elif scenario == "hybrid_search":
+                skipped = run_hybrid_search(queries, samples, errors, args.mysql_ms, args.real_mysql, args.warmup)
+            else:
+                stream = scenario == "chat_session_stream"
+                # Shared resources and the async store are built on first use; keep that out of the numbers
+                run_chat_session(queries[:args.warmup], defaultdict(list), [], stream)
+                start = time.perf_counter()
+                run_chat_session(queries, samples, errors, stream)
+        elapsed = time.perf_counter() - start
+
+        if skipped:
+            report['scenarios'][scenario] = {'skipped': skipped}
+            print(f"{scenario}: {skipped}")
+            continue
+        report['scenarios'][scenario] = {
+            'requests': len(samples['wall']),
+            'errors': errors,
+            'elapsed_s': round(elapsed, 2),
+            'upstream_requests': {
+                'openai': {k: v - before_openai.get(k, 0) for k, v in openai_server.requests.items()},
+                'pinecone': {k: v - before_pinecone.get(k, 0) for k, v in pinecone_server.requests.items()}
+            },
+            'stages': summarize(samples)
+        }
+        print(f"\n{scenario}: {len(samples['wall'])} requests in {elapsed:.1f} s, {len(errors)} errors")
+        print(f"  {'stage':<24} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for stage, stats in report['scenarios'][scenario]['stages'].items():
+            print(f"  {stage:<24} {stats['p50']:>9.1f} {stats['p95']:>9.1f} {stats['p99']:>9.1f}")
+
+    openai_server.stop()
+    pinecone_server.stop()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import json
+import logging
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from utils.config import Config
+from utils.tracing import count
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """
+    Cache of recent answers looked up by question embedding.
+
+    Entries live in a fixed-size ring buffer: normalized question embeddings in
+    one float32 matrix plus parallel arrays for expiry, catalog version and
+    filter signature. A lookup is one matrix-vector product; the best entry
+    that is unexpired, stamped with the current catalog version, has the same
+    filter signature and clears the similarity threshold is returned.
+    """
+
+    def __init__(
+        self,
+        threshold: float = Config.ANSWER_CACHE_THRESHOLD,
+        ttl_seconds: int = Config.ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int = Config.ANSWER_CACHE_MAX_ENTRIES,
+        dimension: int = Config.VECTOR_DIMENSION
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._embeddings = np.zeros((max_entries, dimension), dtype=np.float32)
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._versions = np.full(max_entries, None, dtype=object)
+        self._signatures = np.full(max_entries, None, dtype=object)
+        self._payloads: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._next = 0
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def filter_signature(*filters: Optional[Dict[str, Any]]) -> str:
+        """Canonical string for the metadata filters a question implies"""
+        return json.dumps([f or {} for f in filters], sort_keys=True)
+
+    def lookup(self, embedding: List[float], signature: str, catalog_version: str) -> Optional[Dict[str, Any]]:
+        """Return the cached {'answer', 'context', 'question', 'similarity'} for a near-identical question"""
+        query = _normalize(embedding)
+        if query is None:
+            return None
+
+        with self._lock:
+            if self._size == 0:
+                self.misses += 1
+                count('cache_lookups_total', cache='answer', result='miss')
+                return None
+            scores = self._embeddings[:self._size] @ query
+            valid = (
+                (self._expires_at[:self._size] > time.time())
+                & (self._versions[:self._size] == catalog_version)
+                & (self._signatures[:self._size] == signature)
+            )
+            scores = np.where(valid, scores, -np.inf)
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                count('cache_lookups_total', cache='answer', result='miss')
+                return None
+            self.hits += 1
+            count('cache_lookups_total', cache='answer', result='hit')
+            payload = dict(self._payloads[best])
+
+        payload['similarity'] = similarity
+        logger.info("Answer cache hit (similarity %.3f) for cached question: %s", similarity, payload['question'])
+        return payload
+
+    def store(
+        self,
+        embedding: List[float],
+        signature: str,
+        catalog_version: str,
+        question: str,
+        answer: str,
+        context: List[Dict[str, Any]]
+    ):
+        """Add an answer, overwriting the oldest entry once the buffer is full"""
+        vector = _normalize(embedding)
+        if vector is None:
+            return
+        with self._lock:
+            pos = self._next
+            self._embeddings[pos] = vector
+            self._expires_at[pos] = time.time() + self.ttl_seconds
+            self._versions[pos] = catalog_version
+            self._signatures[pos] = signature
+            self._payloads[pos] = {'question': question, 'answer': answer, 'context': context}
+            self._next = (pos + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': self._size
+            }
+
+    def clear(self):
+        with self._lock:
+            self._expires_at[:] = 0
+            self._size = 0
+            self._next = 0
+
+
+def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+    if not embedding:
+        return None
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else None
+
+
+_shared_cache: Optional[SemanticAnswerCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Process-wide answer cache shared by all chat sessions"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = SemanticAnswerCache()
+        return _shared_cache
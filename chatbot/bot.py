@@ -1,9 +1,23 @@
 import sys
 import os
 from chatbot.retriver.data_retriver import VectorStore
+from chatbot.resources import get_vector_store, get_catalog
+from chatbot.memory import ConversationMemory
+from chatbot.retriver.context_builder import build_context
+from chatbot.retriver.catalog_engine import CatalogAnswer, plan_catalog_query, execute
+from chatbot.retriver.prompts import ERROR_RESPONSE, stage_timer
+from chatbot.answer_cache import get_answer_cache, SemanticAnswerCache
+from utils.catalog_version import get_catalog_version
+from utils.config import Config
+from utils.logging import log_context, new_request_id, setup_logging
+from utils.resilience import get_upstream
+from utils.tracing import record_usage, span
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import logging
-from typing import List, Dict, Any, Optional
+import time
+import uuid
+from dataclasses import asdict
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 
 logger = logging.getLogger(__name__)
 
@@ -11,46 +25,141 @@ class ChatSession:
     """
     Maintains chat history and handles RAG-based QA for a single user session.
     """
-    def __init__(self):
-        self.history: List[Dict[str, str]] = []  # Each entry: {"role": "user"/"assistant", "content": str}
-        self.vector_store = VectorStore()
+    def __init__(self, vector_store: Optional[VectorStore] = None):
+        # Recent turns verbatim plus a rolling summary of older ones, within Config.MEMORY_MAX_TOKENS
+        self.memory = ConversationMemory(client=vector_store.client if vector_store else None)
+        # Clients and the index handle are process-wide; a session only owns its history
+        self._vector_store = vector_store
+        self.answer_cache = get_answer_cache()
+        # Stamped with a fresh request_id on every log record of a turn
+        self.session_id = uuid.uuid4().hex[:16]
 
-    def add_to_history(self, role: str, content: str):
-        self.history.append({"role": role, "content": content})
+    @property
+    def vector_store(self) -> VectorStore:
+        return self._vector_store or get_vector_store()
+
+    @property
+    def history(self) -> List[Dict[str, str]]:
+        """Messages still held verbatim; older ones live in self.memory.summary"""
+        return self.memory.messages()
+
+    def add_to_history(self, role: str, content: str, background: bool = False):
+        self.memory.add(role, content, background)
 
     def get_history_str(self) -> str:
         """
         Returns the chat history as a formatted string for prompt context.
         """
-        return "\n".join(
-            [f"{entry['role'].capitalize()}: {entry['content']}" for entry in self.history]
-        )
+        return self.memory.render()
 
     def refine_query(self, user_question: str) -> str:
         """
-        Optionally refines the user question using chat history.
+        Rewrites a follow-up question into a standalone retrieval query using the chat history.
         """
-        if not self.history:
-            return user_question
-        # Simple concatenation; can be replaced with more advanced context-aware refinement
-        return f"Given the previous conversation: {self.get_history_str()}\nUser's new question: {user_question}"
+        return self.memory.standalone_query(user_question)
 
-    def ask(self, user_question: str, filter_dict: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def answer_cache_key(
+        self,
+        user_question: str,
+        filter_dict: Optional[Dict[str, Any]] = None
+    ) -> Optional[Tuple[List[float], str, str]]:
         """
-        Handles a user question, retrieves context, and generates an answer.
+        (question embedding, filter signature, catalog version) used to look up and store cached answers.
+
+        The signature includes the catalog plan, so questions that embed alike
+        but ask the opposite ("cheapest" vs "most expensive mozzarella") or a
+        different column never share an answer.
+        """
+        embedding = self.vector_store.get_embedding(user_question)
+        if not embedding:
+            return None
+        analyzer = self.vector_store.query_analyzer
+        implied_filter = analyzer.analyze(user_question).filter_dict if analyzer is not None else None
+        plan = None
+        if Config.CATALOG_ENGINE_ENABLED and analyzer is not None:
+            catalog_query = plan_catalog_query(user_question, analyzer)
+            plan = asdict(catalog_query) if catalog_query is not None else None
+        signature = SemanticAnswerCache.filter_signature(implied_filter, filter_dict, plan)
+        return embedding, signature, get_catalog_version()
+
+    def query_catalog(
+        self,
+        question: str,
+        filter_dict: Optional[Dict[str, Any]],
+        timings: Dict[str, float]
+    ) -> Optional[CatalogAnswer]:
+        """Exact answer from the columnar catalog for superlative, aggregate and bare numeric questions, else None"""
+        analyzer = self.vector_store.query_analyzer
+        if not Config.CATALOG_ENGINE_ENABLED or analyzer is None:
+            return None
+        plan = plan_catalog_query(question, analyzer)
+        if plan is None:
+            return None
+        if filter_dict:
+            plan.filter_dict = {"$and": [plan.filter_dict, filter_dict]} if plan.filter_dict else filter_dict
+        try:
+            with stage_timer(timings, 'catalog_query'):
+                answer = execute(get_catalog(), plan)
+        except Exception as e:
+            logger.error(f"Error querying the columnar catalog: {str(e)}")
+            return None
+        logger.info("Catalog engine answered '%s': %s (%d matches)", question, plan.description, answer.total_matches)
+        return answer
+
+    def _prepare(self, user_question: str, filter_dict: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Shared front half of ask/ask_stream: answer-cache lookup, retrieval and prompt assembly.
+
+        Returns either {'cached': {...}} or the chat messages plus the context,
+        timings and cache key needed to finish the turn.
         """
-        # Add user question to history
+        timings: Dict[str, float] = {}
+
+        # Opening questions do not depend on history, so their answers can be shared across sessions
+        cache_key = None
+        if Config.ANSWER_CACHE_ENABLED and not self.history:
+            with stage_timer(timings, 'answer_cache'):
+                cache_key = self.answer_cache_key(user_question, filter_dict)
+                cached = self.answer_cache.lookup(*cache_key) if cache_key else None
+            if cached:
+                self.add_to_history("user", user_question)
+                self.add_to_history("assistant", cached['answer'])
+                return {'cached': cached}
+
+        # Refine the question with history, then add it to history
+        with stage_timer(timings, 'refine'):
+            refined_question = self.refine_query(user_question)
         self.add_to_history("user", user_question)
         context_products = []
-        # Refine the question with history
-        refined_question = self.refine_query(user_question)
-
-        # Retrieve relevant context from vector DB
-        result = self.vector_store.get_relevant_products(
-            query=refined_question,
-            filter_dict=filter_dict
-        )
-        if result.get('response') == "this is not a question about cheese, general question":
+        context_stats = {}
+
+        # Superlative and aggregate questions are answered exactly from the catalog columns;
+        # everything else retrieves context from the vector DB. The answer itself is written below
+        catalog_answer = self.query_catalog(refined_question, filter_dict, timings)
+        result = {}
+        if catalog_answer is None:
+            result = self.vector_store.get_relevant_products(
+                query=refined_question,
+                filter_dict=filter_dict,
+                generate=False
+            )
+            retrieval_timings = dict(result.get('timings', {}))
+            # The retriever's own total covers only its stages; keep it apart from the session's
+            if 'total' in retrieval_timings:
+                timings['retrieval'] = retrieval_timings.pop('total')
+            timings.update(retrieval_timings)
+
+        if catalog_answer is not None:
+            context_products = catalog_answer.rows
+            prompt = (
+                "You are a helpful cheese expert assistant. The context below is the exact result of a lookup over the full product catalog for the user's question; "
+                "rely on its ordering and numbers, and cite the specific products you reference.\n\n"
+                f"Chat History:\n{self.get_history_str()}\n\n"
+                f"Context:\n{catalog_answer.to_context()}\n\n"
+                f"User Question: {user_question}\n\n"
+                "Please answer based on the lookup result above:"
+            )
+        elif result.get('response') == "this is not a question about cheese, general question":
             prompt = (
                 "The user's question now is one that is difficult to answer accurately with a chatbot using the Pinecone vector database. For example, it may be a greeting that is not related to the exact information about cheese, or it may be a question that is difficult to answer accurately with a semantic search using the vector database, such as the most expensive or softest product, or the heaviest product."
                 "Also, it may be a question about a different field that cannot be considered a question from a user using this chatbot to know about cheese. Therefore, you should consider the previous conversation history and give an accurate answer. If it is a content that is connected to a previous conversation, you should consider the context and give an accurate answer."
@@ -63,14 +172,11 @@ class ChatSession:
                 "Please answer kindly."
             )
         else:
-            # Extract context products from the result
-            context_products = result.get('context', [])
-
-            # Build the RAG prompt
-            context_str = "\n".join([
-                f"Description: {prod.get('description', '')}\n"
-                for prod in context_products if isinstance(prod, dict)
-            ])
+            # Keep the relevant, distinct products and pack them into a compact table
+            packed = build_context(result.get('context', []))
+            context_products = packed.products
+            context_stats = packed.stats()
+            context_str = packed.text
 
             prompt = (
                 "You are a helpful cheese expert assistant. Use the following product information and the chat history to answer the user's question. "
@@ -81,29 +187,138 @@ class ChatSession:
                 "Please provide a detailed answer based on the product information above:"
             )
 
+        return {
+            'request': {
+                "model": self.vector_store.client.model if hasattr(self.vector_store.client, 'model') else "gpt-4",
+                "messages": [
+                    {"role": "system", "content": "You are a helpful cheese expert assistant."},
+                    {"role": "user", "content": prompt}
+                ],
+                "temperature": 0.7,
+                "max_tokens": 500
+            },
+            'context': context_products,
+            'timings': timings,
+            'context_stats': context_stats,
+            'cache_key': cache_key
+        }
 
-        response = self.vector_store.client.chat.completions.create(
-            model=self.vector_store.client.model if hasattr(self.vector_store.client, 'model') else "gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful cheese expert assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-        answer = response.choices[0].message.content
-
-
-        self.add_to_history("assistant", answer)
+    def _finish(
+        self, user_question: str, prepared: Dict[str, Any], answer: str, background: bool = False
+    ) -> Dict[str, Any]:
+        # A background compaction is not waited for: the turns are snapshotted before it starts
+        history = self.history + [{"role": "assistant", "content": answer}] if background else None
+        self.add_to_history("assistant", answer, background)
+        if prepared['cache_key']:
+            self.answer_cache.store(*prepared['cache_key'], user_question, answer, prepared['context'])
 
         return {
             "answer": answer,
-            "context": context_products,
-            "history": self.history
+            "context": prepared['context'],
+            "history": history if background else self.history,
+            "timings": prepared['timings'],
+            "context_stats": prepared['context_stats'],
+            "cached": False
+        }
+
+    def _cached_result(self, cached: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "answer": cached['answer'],
+            "context": cached['context'],
+            "history": self.history,
+            "timings": {},
+            "context_stats": {},
+            "cached": True
         }
 
+    def ask(self, user_question: str, filter_dict: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Handles a user question, retrieves context, and generates an answer.
+        """
+        with log_context(session_id=self.session_id, request_id=new_request_id()), \
+                span('chat.ask', history_messages=len(self.history)) as ask_span:
+            prepared = self._prepare(user_question, filter_dict)
+            if 'cached' in prepared:
+                ask_span.set(cached=True)
+                return self._cached_result(prepared['cached'])
+
+            with stage_timer(prepared['timings'], 'answer'):
+                with span('openai.chat', operation='answer'):
+                    response = get_upstream('openai').call(
+                        'answer', self.vector_store.client.chat.completions.create, **prepared['request']
+                    )
+                    record_usage('answer', response)
+            answer = response.choices[0].message.content
+
+            ask_span.set(cached=False, context_products=len(prepared['context']))
+            return self._finish(user_question, prepared, answer)
+
+    def ask_stream(self, user_question: str, filter_dict: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of ask.
+
+        Yields a {'type': 'context', 'context': [...]} event with the retrieved
+        products as soon as retrieval is done, {'type': 'chunk', 'content': str}
+        events as tokens arrive from the model, then a single {'type': 'final', ...}
+        event carrying the same fields ask() returns (answer, context, history,
+        timings, context_stats, cached). If the answer request fails, including
+        an open circuit or a passed deadline, the final event carries what was
+        streamed so far (or ERROR_RESPONSE) with error=True, and that answer is
+        recorded in the history but not cached.
+        """
+        # The log context and span are opened and closed around each step rather than held
+        # across yields, since the consumer may resume this generator from another context
+        ids = {'session_id': self.session_id, 'request_id': new_request_id()}
+        with log_context(**ids), span('chat.ask', history_messages=len(self.history), stream=True) as ask_span:
+            prepared = self._prepare(user_question, filter_dict)
+            ask_span.set(cached='cached' in prepared)
+        if 'cached' in prepared:
+            result = self._cached_result(prepared['cached'])
+            yield {'type': 'context', 'context': result['context']}
+            yield {'type': 'chunk', 'content': result['answer']}
+            yield {'type': 'final', **result}
+            return
+        yield {'type': 'context', 'context': prepared['context']}
+
+        start = time.perf_counter()
+        parts = []
+        try:
+            # Covers the request up to the response headers; the 'answer' timing covers the whole stream
+            with log_context(**ids), span('openai.chat', operation='answer', stream=True):
+                # Retried only until the response starts; the deadline bounds each read of the stream
+                stream = get_upstream('openai').call(
+                    'answer', self.vector_store.client.chat.completions.create, **prepared['request'], stream=True
+                )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    if not parts:
+                        prepared['timings']['answer_first_token'] = round((time.perf_counter() - start) * 1000, 2)
+                    parts.append(content)
+                    yield {'type': 'chunk', 'content': content}
+        except Exception as e:
+            with log_context(**ids):
+                logger.error(f"Error streaming answer: {str(e)}")
+                if not parts:
+                    parts.append(ERROR_RESPONSE)
+                    yield {'type': 'chunk', 'content': ERROR_RESPONSE}
+                # Answered like any other turn so the question is not left without a reply, but never cached
+                prepared['cache_key'] = None
+                result = self._finish(user_question, prepared, ''.join(parts), background=True)
+            yield {'type': 'final', **result, 'error': True}
+            return
+        prepared['timings']['answer'] = round((time.perf_counter() - start) * 1000, 2)
+
+        with log_context(**ids):
+            # History compaction runs in the background, so 'final' is not held up by the summary call
+            result = self._finish(user_question, prepared, ''.join(parts), background=True)
+        yield {'type': 'final', **result}
+
 
 if __name__ == "__main__":
+    setup_logging()
     session = ChatSession()
     print("Welcome to the Cheese RAG ChatBot!")
     while True:
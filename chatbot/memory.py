@@ -0,0 +1,200 @@
+import contextvars
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+
+from utils.config import Config
+from utils.tokens import count_tokens, truncate_tokens
+from utils.resilience import get_upstream
+from utils.tracing import record_usage, span
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a customer and a cheese shop assistant.
+Update the summary with the new messages below. Keep the products, brands, prices, constraints and preferences the
+customer mentioned, and drop small talk. Answer with the updated summary only, in at most {max_tokens} tokens.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+REWRITE_PROMPT = """Rewrite the customer's latest message as a standalone search query for a cheese product catalog.
+Resolve pronouns and references such as "those", "it" or "cheaper ones" using the conversation, and keep every
+constraint (brand, type, form, price, weight). If the message is already standalone, or is not about cheese
+(for example a greeting), return it unchanged. Answer with the query only.
+
+{history}
+
+Latest message: {question}"""
+
+
+class ConversationMemory:
+    """
+    Token-budgeted chat history for one session.
+
+    The most recent exchanges are kept verbatim as long as they, plus the
+    summary, fit in max_tokens and number at most recent_turns user/assistant
+    pairs. Older messages are folded into a rolling summary with one LLM call
+    per compaction, so prompt size stays flat however long the conversation
+    runs. If summarization fails, the folded messages are appended to the
+    summary as plain text and trimmed to summary_max_tokens instead.
+    Streaming answers compact in a background thread, so the summary call
+    never holds up the end of a reply; the next add() or render() waits for it.
+    """
+
+    def __init__(
+        self,
+        client: Optional[Any] = None,
+        max_tokens: int = Config.MEMORY_MAX_TOKENS,
+        recent_turns: int = Config.MEMORY_RECENT_TURNS,
+        summary_max_tokens: int = Config.MEMORY_SUMMARY_MAX_TOKENS,
+        model: str = Config.OPENAI_MODEL
+    ):
+        self.client = client
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self.summary_max_tokens = summary_max_tokens
+        self.model = model
+        self.turns: List[Dict[str, str]] = []  # Each entry: {"role": "user"/"assistant", "content": str}
+        self._turn_tokens: List[int] = []
+        self.summary = ""
+        self.summarized_messages = 0
+        self._compaction: Optional[threading.Thread] = None
+
+    @property
+    def _client(self) -> Any:
+        if self.client is not None:
+            return self.client
+        # Sessions stay cheap to create: borrow the shared OpenAI client only when a call is needed
+        from chatbot.resources import get_vector_store
+        return get_vector_store().client
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def add(self, role: str, content: str, background: bool = False):
+        self._wait()
+        self.turns.append({"role": role, "content": content})
+        self._turn_tokens.append(count_tokens(_format_turn(self.turns[-1]), self.model))
+        # Compact once the exchange is complete so a question is never separated from its answer
+        if role == "assistant":
+            if background:
+                # Carries the log context and trace span of the turn into the thread
+                self._compaction = threading.Thread(
+                    target=contextvars.copy_context().run, args=(self.compact,), name="memory-compaction", daemon=True
+                )
+                self._compaction.start()
+            else:
+                self.compact()
+
+    def _wait(self):
+        """Let a background compaction finish before the turns are read or changed"""
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Copy of the verbatim turns once any background compaction has finished"""
+        self._wait()
+        return list(self.turns)
+
+    def token_count(self) -> int:
+        """Tokens render() will occupy in the prompt"""
+        self._wait()
+        return count_tokens(self.summary, self.model) + sum(self._turn_tokens)
+
+    def compact(self):
+        """Fold the oldest verbatim messages into the summary until the window fits the budget"""
+        fold = 0
+        summary_tokens = count_tokens(self.summary, self.model)
+        kept_tokens = sum(self._turn_tokens)
+        max_messages = 2 * self.recent_turns
+        # Always keep the latest exchange verbatim
+        while len(self.turns) - fold > 2 and (
+            len(self.turns) - fold > max_messages or summary_tokens + kept_tokens > self.max_tokens
+        ):
+            kept_tokens -= self._turn_tokens[fold]
+            fold += 1
+        if not fold:
+            return
+
+        folded = self.turns[:fold]
+        self.turns = self.turns[fold:]
+        self._turn_tokens = self._turn_tokens[fold:]
+        self.summary = self._summarize(folded)
+        self.summarized_messages += fold
+        logger.info(
+            f"Folded {fold} messages into the conversation summary "
+            f"({count_tokens(self.summary, self.model)} summary tokens, {len(self.turns)} verbatim messages)"
+        )
+
+    def _summarize(self, messages: List[Dict[str, str]]) -> str:
+        transcript = "\n".join(_format_turn(turn) for turn in messages)
+        try:
+            with span('openai.chat', operation='summary', messages=len(messages)):
+                response = get_upstream('openai').call(
+                    'summary',
+                    self._client.chat.completions.create,
+                    model=self.model,
+                    messages=[{"role": "user", "content": SUMMARY_PROMPT.format(
+                        max_tokens=self.summary_max_tokens,
+                        summary=self.summary or "(empty)",
+                        messages=truncate_tokens(transcript, self.max_tokens, self.model)
+                    )}],
+                    temperature=0,
+                    max_tokens=self.summary_max_tokens
+                )
+                record_usage('summary', response)
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            logger.error(f"Error summarizing conversation: {str(e)}")
+            return truncate_tokens(f"{self.summary}\n{transcript}".strip(), self.summary_max_tokens, self.model)
+
+    def render(self) -> str:
+        """Summary plus verbatim recent messages, formatted for the answer prompt"""
+        self._wait()
+        lines = []
+        if self.summary:
+            lines.append(f"Summary of earlier conversation: {self.summary}")
+        lines.extend(_format_turn(turn) for turn in self.turns)
+        return "\n".join(lines)
+
+    def standalone_query(self, question: str) -> str:
+        """
+        Rewrite a follow-up question into a self-contained retrieval query.
+
+        Returns the question unchanged for the first message of a session, or
+        when the rewrite call fails.
+        """
+        if not self.turns and not self.summary:
+            return question
+        try:
+            with span('openai.chat', operation='rewrite'):
+                response = get_upstream('openai').call(
+                    'rewrite',
+                    self._client.chat.completions.create,
+                    model=self.model,
+                    messages=[{"role": "user", "content": REWRITE_PROMPT.format(history=self.render(), question=question)}],
+                    temperature=0,
+                    max_tokens=100
+                )
+                record_usage('rewrite', response)
+            rewritten = response.choices[0].message.content.strip().strip('"')
+        except Exception as e:
+            logger.error(f"Error rewriting query: {str(e)}")
+            return question
+        logger.info("Rewrote follow-up question '%s' as '%s'", question, rewritten)
+        return rewritten or question
+
+    def clear(self):
+        self._wait()
+        self.turns = []
+        self._turn_tokens = []
+        self.summary = ""
+        self.summarized_messages = 0
+
+
+def _format_turn(turn: Dict[str, str]) -> str:
+    return f"{turn['role'].capitalize()}: {turn['content']}"
@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    factory: Callable[[], Any]
+    health_check: Optional[Callable[[Any], bool]] = None
+    value: Any = None
+    created: bool = False
+    checked_at: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ResourceRegistry:
+    """
+    Process-wide registry of expensive objects shared by every chat session.
+
+    Each resource is built by its factory on first use, under a per-resource
+    lock so concurrent sessions never build it twice. A resource with a health
+    check is re-checked lazily, at most once every check_interval seconds and
+    only when it is requested; a failed check rebuilds it, so existing
+    sessions pick up the replacement on their next call. The replaced
+    instance is closed close_grace seconds later, since sessions that fetched
+    it before the swap may still be in the middle of a request on it.
+    """
+
+    def __init__(
+        self,
+        check_interval: float = Config.RESOURCE_HEALTH_CHECK_SECONDS,
+        close_grace: float = Config.RESOURCE_CLOSE_GRACE_SECONDS
+    ):
+        self.check_interval = check_interval
+        self.close_grace = close_grace
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        health_check: Optional[Callable[[Any], bool]] = None
+    ):
+        """Declare how to build a resource; replaces a previous registration of the same name"""
+        with self._lock:
+            self._entries[name] = _Entry(factory=factory, health_check=health_check)
+
+    def get(self, name: str) -> Any:
+        """Return the shared instance, building or health-checking it if due"""
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Unknown resource '{name}'")
+
+        if entry.created and (entry.health_check is None or time.monotonic() - entry.checked_at < self.check_interval):
+            return entry.value
+
+        with entry.lock:
+            if not entry.created:
+                start = time.perf_counter()
+                entry.value = entry.factory()
+                entry.created = True
+                entry.checked_at = time.monotonic()
+                logger.info(f"Created shared resource '{name}' in {(time.perf_counter() - start) * 1000:.1f} ms")
+            elif entry.health_check is not None and time.monotonic() - entry.checked_at >= self.check_interval:
+                entry.checked_at = time.monotonic()
+                if not self._healthy(name, entry):
+                    old = entry.value
+                    entry.value = entry.factory()
+                    self.rebuilds += 1
+                    logger.warning(f"Rebuilt shared resource '{name}' after a failed health check")
+                    self._retire(old)
+            return entry.value
+
+    def reset(self, name: Optional[str] = None):
+        """Close and forget one resource (or all of them); the next get() rebuilds it"""
+        names = [name] if name else list(self._entries)
+        for key in names:
+            entry = self._entries[key]
+            with entry.lock:
+                if entry.created:
+                    _close(entry.value)
+                entry.value = None
+                entry.created = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'created': sorted(name for name, entry in self._entries.items() if entry.created),
+            'registered': sorted(self._entries),
+            'rebuilds': self.rebuilds
+        }
+
+    def _retire(self, resource: Any):
+        """Close a replaced resource once the sessions holding it had time to finish with it"""
+        if self.close_grace <= 0:
+            _close(resource)
+            return
+        timer = threading.Timer(self.close_grace, _close, args=(resource,))
+        timer.daemon = True
+        timer.start()
+
+    @staticmethod
+    def _healthy(name: str, entry: _Entry) -> bool:
+        try:
+            return bool(entry.health_check(entry.value))
+        except Exception as e:
+            logger.error(f"Health check for shared resource '{name}' failed: {str(e)}")
+            return False
+
+
+def _close(resource: Any):
+    close = getattr(resource, 'close', None)
+    if callable(close):
+        try:
+            close()
+        except Exception as e:
+            logger.warning(f"Error closing shared resource: {str(e)}")
+
+
+def _build_vector_store():
+    # Imported here so importing the registry does not connect to anything
+    from chatbot.retriver.data_retriver import VectorStore
+    return VectorStore()
+
+
+def _build_catalog():
+    from chatbot.retriver.catalog_engine import ColumnarCatalog
+    return ColumnarCatalog.from_catalog(Config.CATALOG_PATH)
+
+
+def _catalog_is_current(catalog) -> bool:
+    # Ingestion bumps the catalog version; reload when it moves
+    return catalog.version == _current_catalog_version()
+
+
+def _build_bm25():
+    from chatbot.retriver.hybrid import load_bm25_index
+    index = load_bm25_index()
+    index.version = _current_catalog_version()
+    return index
+
+
+def _current_catalog_version() -> str:
+    from utils.catalog_version import get_catalog_version
+    return get_catalog_version()
+
+
+_registry: Optional[ResourceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_resources() -> ResourceRegistry:
+    """Process-wide registry with the retrieval resources registered"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ResourceRegistry()
+            _registry.register('vector_store', _build_vector_store, lambda store: store.health_check())
+            _registry.register('catalog', _build_catalog, _catalog_is_current)
+            _registry.register('bm25', _build_bm25, _catalog_is_current)
+        return _registry
+
+
+def get_vector_store():
+    """Shared VectorStore: OpenAI clients, index handle, query analyzer and prompt definitions, built once per process"""
+    return get_resources().get('vector_store')
+
+
+def get_catalog():
+    """Shared ColumnarCatalog for exact superlative, range and aggregate questions"""
+    return get_resources().get('catalog')
+
+
+def get_bm25_index():
+    """Shared BM25 index over product text, written at ingest time"""
+    return get_resources().get('bm25')
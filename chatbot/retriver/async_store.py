@@ -0,0 +1,411 @@
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from utils.config import Config
+from utils.embedding_cache import get_embedding_cache
+from utils.resilience import get_upstream
+from utils.single_flight import copy_records, get_single_flight, normalize_query, vector_key
+from utils.tracing import count, record_usage, span
+from chatbot.retriver.local_index import LocalVectorIndex
+from chatbot.retriver.context_builder import build_context
+from chatbot.retriver.hybrid import HybridRetriever
+from chatbot.retriver.mmr import attach_vectors, diversify, merge_vectors, missing_vector_ids, wants_values
+from chatbot.retriver.query_analyzer import QueryAnalyzer
+from chatbot.retriver.prompts import (
+    NOT_CHEESE_RESPONSE, NO_PRODUCTS_RESPONSE, ERROR_RESPONSE,
+    build_response_messages, classification_request, filter_request, parse_filter_response, stage_timer
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncVectorStore:
+    """
+    Asyncio counterpart of VectorStore for serving many sessions on one event loop.
+
+    All upstream calls go through one AsyncOpenAI client backed by a pooled
+    httpx.AsyncClient, run under the shared upstream deadline, retry and
+    circuit-breaker policy, and hold a slot of a shared semaphore while in
+    flight. Pinecone is reached through PineconeAsyncio when the installed
+    client provides it; otherwise, and for a caller-supplied synchronous
+    index, queries run in a worker thread. The local NumPy index is queried
+    inline since a catalog search takes microseconds.
+
+    Call aconnect() once before use (aget_relevant_products does it lazily)
+    and aclose() on shutdown.
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        index: Any = None,
+        query_analyzer: Optional[QueryAnalyzer] = None,
+        max_concurrency: int = Config.ASYNC_MAX_CONCURRENCY,
+        hybrid: Optional[HybridRetriever] = None
+    ):
+        if client is None:
+            if not Config.OPENAI_API_KEY:
+                raise ValueError("OPENAI_API_KEY is not set in config.py")
+            client = AsyncOpenAI(
+                api_key=Config.OPENAI_API_KEY,
+                base_url=Config.OPENAI_BASE_URL,
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=httpx.Limits(
+                    max_connections=max_concurrency,
+                    max_keepalive_connections=max_concurrency
+                ))
+            )
+        self.client = client
+        self.openai = get_upstream('openai')
+        self.pinecone = get_upstream('pinecone')
+        self.flights = get_single_flight()
+        self.index = index
+        self.query_analyzer = query_analyzer
+        # When set, the BM25 leg of this retriever is fused with every vector query
+        self.hybrid = hybrid
+        self.embedding_cache = get_embedding_cache()
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pinecone = None
+        self._connected = index is not None
+
+    async def aconnect(self):
+        """Open the vector index without blocking the event loop"""
+        if self._connected:
+            return
+        if self.query_analyzer is None:
+            try:
+                self.query_analyzer = await asyncio.to_thread(QueryAnalyzer.from_catalog, Config.CATALOG_PATH)
+            except Exception as e:
+                logger.warning(f"Query analyzer disabled, could not load catalog: {str(e)}")
+
+        if Config.VECTOR_BACKEND == "local":
+            self.index = await asyncio.to_thread(LocalVectorIndex.load, Path(Config.LOCAL_INDEX_PATH))
+        else:
+            if not Config.PINECONE_API_KEY:
+                raise ValueError("PINECONE_API_KEY is not set in config.py")
+            try:
+                from pinecone import PineconeAsyncio
+            except ImportError:
+                PineconeAsyncio = None
+
+            if PineconeAsyncio is not None:
+                self._pinecone = PineconeAsyncio(api_key=Config.PINECONE_API_KEY)
+                host = Config.PINECONE_HOST
+                if not host:
+                    host = (await self._pinecone.describe_index(Config.PINECONE_INDEX_NAME)).host
+                self.index = self._pinecone.IndexAsyncio(host=host)
+            else:
+                from pinecone import Pinecone
+                pc = Pinecone(api_key=Config.PINECONE_API_KEY)
+                if Config.PINECONE_HOST:
+                    self.index = pc.Index(host=Config.PINECONE_HOST)
+                else:
+                    self.index = await asyncio.to_thread(pc.Index, Config.PINECONE_INDEX_NAME)
+        self._connected = True
+        logger.info(f"AsyncVectorStore connected to {Config.VECTOR_BACKEND} index")
+
+    async def aclose(self):
+        """Release pooled connections"""
+        close_index = getattr(self.index, 'close', None)
+        if close_index is not None and asyncio.iscoroutinefunction(close_index):
+            await close_index()
+        if self._pinecone is not None:
+            await self._pinecone.close()
+        await self.client.close()
+
+    async def aget_embedding(self, text: str) -> List[float]:
+        """Generate embedding for text, consulting the shared embedding cache first"""
+        # The memory tier is served inline; the SQLite tier is read off the event loop
+        cached = self.embedding_cache.peek(Config.EMBEDDING_MODEL, text)
+        if cached is None:
+            cached = await asyncio.to_thread(self.embedding_cache.get, Config.EMBEDDING_MODEL, text)
+        if cached is not None:
+            return cached
+        try:
+            return await self.flights.ado('embedding', (Config.EMBEDDING_MODEL, (text,)), self._arequest_embedding, text)
+        except Exception as e:
+            logger.error(f"Error generating embedding: {str(e)}")
+            return []
+
+    async def _arequest_embedding(self, text: str) -> List[float]:
+        with span('openai.embeddings', texts=1):
+            response = await self.openai.acall(
+                'embedding', self._bounded(self.client.embeddings.create), model=Config.EMBEDDING_MODEL, input=text, hedge=True
+            )
+            record_usage('embedding', response)
+        embedding = response.data[0].embedding
+        await asyncio.to_thread(self.embedding_cache.put, Config.EMBEDDING_MODEL, text, embedding)
+        return embedding
+
+    async def aquery_by_vector(
+        self,
+        query_embedding: List[float],
+        top_k: int = Config.TOP_K_RESULTS,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        include_values: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Query the vector index with an already computed embedding; include_values adds each match's vector as 'values'"""
+        await self.aconnect()
+        try:
+            if isinstance(self.index, LocalVectorIndex):
+                return await self._arequest_products(query_embedding, top_k, filter_dict, include_values)
+            # Identical remote queries in flight at once share one request
+            return await self.flights.ado(
+                'vector_query', vector_key(query_embedding, top_k, filter_dict, include_values),
+                self._arequest_products, query_embedding, top_k, filter_dict, include_values,
+                share=copy_records
+            )
+        except Exception as e:
+            logger.error(f"Error querying products: {str(e)}")
+            return []
+
+    async def _arequest_products(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]],
+        include_values: bool
+    ) -> List[Dict[str, Any]]:
+        kwargs = dict(
+            vector=query_embedding, top_k=top_k, include_metadata=True, include_values=include_values, filter=filter_dict
+        )
+        with span('vector.query', backend=Config.VECTOR_BACKEND, top_k=top_k, filtered=bool(filter_dict)) as query_span:
+            if isinstance(self.index, LocalVectorIndex):
+                results = self.index.query(**kwargs)
+            elif asyncio.iscoroutinefunction(self.index.query):
+                results = await self.pinecone.acall('vector_query', self._bounded(self.index.query), hedge=True, **kwargs)
+            else:
+                results = await self.pinecone.acall(
+                    'vector_query', self._bounded(lambda **kw: asyncio.to_thread(self.index.query, **kw)), hedge=True, **kwargs
+                )
+            query_span.set(matches=len(results.matches))
+        count('retrieved_products_total', len(results.matches), source='vector')
+
+        products = [
+            {'id': match.id, 'score': match.score, **(match.metadata or {})}
+            for match in results.matches
+        ]
+        if include_values:
+            for product, match in zip(products, results.matches):
+                product['values'] = match.values
+        return products
+
+    async def aquery_products(
+        self,
+        query: str,
+        top_k: int = Config.TOP_K_RESULTS,
+        filter_dict: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Embed a query and search the vector index"""
+        query_embedding = await self.aget_embedding(query)
+        if not query_embedding:
+            logger.error("Failed to generate query embedding")
+            return []
+        return await self.aquery_by_vector(query_embedding, top_k=top_k, filter_dict=filter_dict)
+
+    async def agenerate_response(
+        self,
+        query: str,
+        type_of_question: int,
+        context_products: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Generate a response using GPT-4 with RAG"""
+        if type_of_question != 1:
+            return {'response': NOT_CHEESE_RESPONSE, 'context': []}
+        packed = build_context(context_products)
+        if not packed.products:
+            return {'response': NO_PRODUCTS_RESPONSE, 'context': [], 'context_stats': packed.stats()}
+        try:
+            response = await self._achat('generation', dict(
+                model=Config.OPENAI_MODEL,
+                messages=build_response_messages(query, packed.text),
+                temperature=0.7,
+                max_tokens=500
+            ))
+            return {
+                'response': response.choices[0].message.content,
+                'context': packed.products,
+                'context_stats': packed.stats()
+            }
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
+            return {'response': ERROR_RESPONSE, 'context': []}
+
+    async def _achat(self, operation: str, request: Dict[str, Any]):
+        """One chat completion under the upstream policy (the operation names its deadline), traced with its token usage"""
+        with span('openai.chat', operation=operation):
+            response = await self.openai.acall(operation, self._bounded(self.client.chat.completions.create), **request)
+            record_usage(operation, response)
+        return response
+
+    def _bounded(self, fn):
+        """fn holding a semaphore slot only while its request is in flight, not across retry backoff"""
+        async def call(*args, **kwargs):
+            async with self._semaphore:
+                return await fn(*args, **kwargs)
+        return call
+
+    async def aget_relevant_products(
+        self,
+        query: str,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        question: Optional[str] = None,
+        generate: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Async get_relevant_products with concurrent stages.
+
+        Classification, filter generation and the query embedding are started
+        together; the speculative filter and embedding work is cancelled when
+        the classifier says the question is not about cheese. When the catalog
+        analyzer is confident, both LLM stages are skipped.
+        """
+        with span('retrieval', mode='concurrent'):
+            await self.aconnect()
+            timings: Dict[str, float] = {}
+            start = time.perf_counter()
+
+            async def timed(stage, coro):
+                with stage_timer(timings, stage):
+                    return await coro
+
+            analysis = None
+            if self.query_analyzer is not None:
+                with stage_timer(timings, 'analysis'):
+                    analysis = self.query_analyzer.analyze(question or query)
+                if analysis.confidence < Config.QUERY_ANALYZER_MIN_CONFIDENCE:
+                    analysis = None
+
+            if analysis is not None:
+                if analysis.is_cheese_question == 1:
+                    embedding = await timed('embedding', self.aget_embedding(query))
+                    result = await self._answer_from_index(query, embedding, analysis.filter_dict, timings, generate)
+                else:
+                    result = await self.agenerate_response(query, analysis.is_cheese_question, [])
+                return self._finish(result, timings, start, "analyzer fast path")
+
+            # Sessions asking the same question at once share these calls
+            key = normalize_query(query)
+            classify_task = asyncio.create_task(timed('classification', self.flights.ado(
+                'classification', key, self._achat, 'classification', classification_request(query)
+            )))
+            filter_task = asyncio.create_task(timed('filter_generation', self.flights.ado(
+                'filter_generation', key, self._achat, 'filter_generation', filter_request(query)
+            )))
+            embedding_task = asyncio.create_task(timed('embedding', self.aget_embedding(query)))
+            speculative = (filter_task, embedding_task)
+
+            try:
+                type_of_question = await classify_task
+                is_cheese_question = json.loads(type_of_question.choices[0].message.tool_calls[0].function.arguments)['is_cheese_question']
+            except BaseException:
+                for task in speculative:
+                    task.cancel()
+                raise
+
+            if is_cheese_question != 1:
+                for task in speculative:
+                    task.cancel()
+                await asyncio.gather(*speculative, return_exceptions=True)
+                result = await self.agenerate_response(query, is_cheese_question, [])
+            else:
+                filter_response, embedding = await asyncio.gather(*speculative, return_exceptions=True)
+                if isinstance(filter_response, Exception):
+                    logger.error(f"Error generating filter: {str(filter_response)}")
+                    filter_dict = None
+                else:
+                    filter_dict = parse_filter_response(filter_response.choices[0].message.content.strip())
+                if isinstance(embedding, Exception):
+                    logger.error(f"Error generating embedding: {str(embedding)}")
+                    embedding = []
+                result = await self._answer_from_index(query, embedding, filter_dict, timings, generate)
+
+            return self._finish(result, timings, start, "concurrent")
+
+    async def _answer_from_index(
+        self,
+        query: str,
+        embedding: List[float],
+        filter_dict: Optional[Dict[str, Any]],
+        timings: Dict[str, float],
+        generate: bool
+    ) -> Dict[str, Any]:
+        """Vector (or hybrid) query plus answer generation, the tail shared by both paths"""
+        if self.hybrid is None:
+            with stage_timer(timings, 'vector_query'):
+                products = await self.aquery_by_vector(
+                    embedding, filter_dict=filter_dict, include_values=wants_values(self.index)
+                ) if embedding else []
+        else:
+            with stage_timer(timings, 'hybrid_query'):
+                products = await self._ahybrid_query(query, embedding, filter_dict, timings)
+
+        if Config.MMR_ENABLED and products:
+            if isinstance(self.index, LocalVectorIndex):
+                products = diversify(embedding, products, timings, index=self.index)
+            else:
+                products = diversify(embedding, await self._aattach_vectors(products), timings)
+
+        if not products:
+            return {'response': NO_PRODUCTS_RESPONSE, 'context': []}
+        if not generate:
+            return {'response': None, 'context': products}
+        with stage_timer(timings, 'generation'):
+            return await self.agenerate_response(query, 1, products)
+
+    async def _ahybrid_query(
+        self,
+        query: str,
+        embedding: List[float],
+        filter_dict: Optional[Dict[str, Any]],
+        timings: Dict[str, float]
+    ) -> List[Dict[str, Any]]:
+        """Vector query and BM25 concurrently, fused by reciprocal rank"""
+        start = time.perf_counter()
+
+        async def vector_leg():
+            leg_start = time.perf_counter()
+            products = await self.aquery_by_vector(
+                embedding, filter_dict=filter_dict, include_values=wants_values(self.index)
+            ) if embedding else []
+            return products, round((time.perf_counter() - leg_start) * 1000, 2)
+
+        (vector_products, vector_ms), (lexical, bm25_ms) = await asyncio.gather(
+            vector_leg(),
+            asyncio.to_thread(self.hybrid.lexical_leg, query, Config.TOP_K_RESULTS, filter_dict)
+        )
+        result = self.hybrid.fuse(vector_products, lexical, Config.TOP_K_RESULTS, vector_ms, bm25_ms, start)
+        timings['vector_leg'] = vector_ms
+        timings['bm25_leg'] = bm25_ms
+        return result['products']
+
+    async def _aattach_vectors(self, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fetch vectors for products the vector query did not return (BM25-only hybrid hits) for MMR"""
+        missing = missing_vector_ids(products)
+        if not missing:
+            return products
+        if not asyncio.iscoroutinefunction(self.index.fetch):
+            async with self._semaphore:
+                return await asyncio.to_thread(attach_vectors, self.index, products)
+        try:
+            async with self._semaphore:
+                fetched = await self.index.fetch(ids=missing)
+        except Exception as e:
+            logger.warning(f"Could not fetch vectors for MMR: {str(e)}")
+            return products
+        return merge_vectors(products, fetched)
+
+    @staticmethod
+    def _finish(result: Dict[str, Any], timings: Dict[str, float], start: float, path: str) -> Dict[str, Any]:
+        timings['total'] = round((time.perf_counter() - start) * 1000, 2)
+        logger.info("Stage latency (%s, ms): %s", path, timings)
+        result['timings'] = timings
+        return result
@@ -0,0 +1,249 @@
+import logging
+import math
+import re
+from array import array
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its me of on or our that the this to was we what "
+    "which with you your do does any some can show tell about want looking need please".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens without stopwords, with a plural 's' stripped"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def product_text(item: Dict[str, Any]) -> str:
+    """Fields of a processed catalog item that the lexical index covers"""
+    metadata = item.get('metadata', item)
+    return " ".join(str(part) for part in (
+        metadata.get('brand', ''),
+        metadata.get('cheese_type', ''),
+        metadata.get('cheese_form', ''),
+        item.get('description', metadata.get('description', ''))
+    ))
+
+
+class BM25Index:
+    """
+    In-process Okapi BM25 index over product text.
+
+    Documents are added incrementally into per-term typed arrays; compact()
+    freezes them into CSR form: one int64 offsets array over the vocabulary
+    and flat int32 doc-number and uint16 term-frequency arrays, so a query
+    term is a slice and scoring is a vectorized scatter-add. Removed
+    documents are tombstoned and dropped at the next compaction. The frozen
+    arrays round-trip through a single .npz file.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._doc_len = array('f')
+        self._deleted = array('b')
+        # Frozen CSR postings
+        self._vocab: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._docs = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.uint16)
+        # Postings added since the last compaction: term -> (doc numbers, term frequencies)
+        self._pending: Dict[str, Tuple[array, array]] = {}
+        self._live = 0
+        self._total_len = 0.0
+        # Catalog version the index was loaded for, set by the shared resource registry
+        self.version: Optional[str] = None
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __contains__(self, doc_id: str) -> bool:
+        pos = self._positions.get(doc_id)
+        return pos is not None and not self._deleted[pos]
+
+    def add(self, doc_id: str, text: str):
+        """Index a document; re-adding an id replaces the previous version"""
+        if doc_id in self:
+            self.remove(doc_id)
+        tokens = tokenize(text)
+        doc = len(self._ids)
+        self._ids.append(doc_id)
+        self._positions[doc_id] = doc
+        self._doc_len.append(len(tokens))
+        self._deleted.append(0)
+        self._live += 1
+        self._total_len += len(tokens)
+
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            docs, tfs = self._pending.setdefault(token, (array('i'), array('H')))
+            docs.append(doc)
+            tfs.append(min(tf, 65535))
+
+    def add_many(self, items: Iterable[Tuple[str, str]]):
+        for doc_id, text in items:
+            self.add(doc_id, text)
+        self.compact()
+
+    def remove(self, doc_id: str):
+        pos = self._positions.get(doc_id)
+        if pos is None or self._deleted[pos]:
+            return
+        self._deleted[pos] = 1
+        self._live -= 1
+        self._total_len -= self._doc_len[pos]
+
+    def compact(self):
+        """Merge pending postings into the frozen arrays and drop removed documents"""
+        deleted = np.frombuffer(self._deleted, dtype=np.int8).astype(bool) if len(self._deleted) else np.zeros(0, bool)
+        if not self._pending and not deleted.any():
+            return
+
+        # Renumber live documents densely
+        keep = np.flatnonzero(~deleted)
+        remap = np.full(len(self._ids), -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+
+        terms = sorted(set(self._vocab) | set(self._pending))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_parts, tf_parts = [], []
+        vocab = {}
+        for term in terms:
+            old = self._vocab.get(term)
+            if old is not None:
+                docs = self._docs[self._offsets[old]:self._offsets[old + 1]]
+                tfs = self._tfs[self._offsets[old]:self._offsets[old + 1]]
+            else:
+                docs, tfs = np.zeros(0, np.int32), np.zeros(0, np.uint16)
+            pending = self._pending.get(term)
+            if pending is not None:
+                docs = np.concatenate([docs, np.frombuffer(pending[0], dtype=np.int32)])
+                tfs = np.concatenate([tfs, np.frombuffer(pending[1], dtype=np.uint16)])
+            docs = remap[docs]
+            live = docs >= 0
+            if not live.any():
+                continue
+            vocab[term] = len(vocab)
+            doc_parts.append(docs[live].astype(np.int32))
+            tf_parts.append(tfs[live])
+            offsets[len(vocab)] = offsets[len(vocab) - 1] + int(live.sum())
+
+        self._vocab = vocab
+        self._offsets = offsets[:len(vocab) + 1].copy()
+        self._docs = np.concatenate(doc_parts) if doc_parts else np.zeros(0, np.int32)
+        self._tfs = np.concatenate(tf_parts) if tf_parts else np.zeros(0, np.uint16)
+        self._pending = {}
+
+        self._ids = [self._ids[i] for i in keep]
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        self._doc_len = array('f', (self._doc_len[i] for i in keep))
+        self._deleted = array('b', bytes(len(keep)))
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 20,
+        allowed_ids: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """(doc id, BM25 score) pairs for the best matches, optionally restricted to allowed_ids"""
+        if self._pending:
+            self.compact()
+        n_docs = len(self._ids)
+        if not n_docs or not self._live:
+            return []
+
+        doc_len = np.frombuffer(self._doc_len, dtype=np.float32)
+        avg_len = self._total_len / self._live if self._live else 1.0
+        norm = self.k1 * (1 - self.b + self.b * doc_len / max(avg_len, 1e-9))
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self._vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            docs = self._docs[start:end]
+            tfs = self._tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1 + (self._live - df + 0.5) / (df + 0.5))
+            # Postings hold each document at most once per term, so fancy-index add is safe
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+        if allowed_ids is not None:
+            mask = np.zeros(n_docs, dtype=bool)
+            mask[[self._positions[i] for i in allowed_ids if i in self._positions]] = True
+            scores[~mask] = 0
+        scores[np.frombuffer(self._deleted, dtype=np.int8).astype(bool)] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self._ids[i], float(scores[i])) for i in order]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'documents': self._live,
+            'terms': len(self._vocab),
+            'postings': int(len(self._docs)),
+            'pending_terms': len(self._pending),
+            'bytes': int(self._offsets.nbytes + self._docs.nbytes + self._tfs.nbytes + len(self._doc_len) * 4)
+        }
+
+    def save(self, path: str):
+        """Write the compacted index to a .npz file"""
+        self.compact()
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                terms=np.array(sorted(self._vocab, key=self._vocab.get), dtype=str),
+                offsets=self._offsets,
+                docs=self._docs,
+                tfs=self._tfs,
+                ids=np.array(self._ids, dtype=str),
+                doc_len=np.frombuffer(self._doc_len, dtype=np.float32),
+                params=np.array([self.k1, self.b], dtype=np.float64)
+            )
+        logger.info(f"Saved BM25 index to {path}: {self.stats()}")
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            k1, b = data['params'].tolist()
+            index = cls(k1=k1, b=b)
+            index._vocab = {term: i for i, term in enumerate(data['terms'].tolist())}
+            index._offsets = data['offsets']
+            index._docs = data['docs']
+            index._tfs = data['tfs']
+            index._ids = data['ids'].tolist()
+            index._doc_len = array('f', data['doc_len'].astype(np.float32).tobytes())
+        index._positions = {doc_id: i for i, doc_id in enumerate(index._ids)}
+        index._deleted = array('b', bytes(len(index._ids)))
+        index._live = len(index._ids)
+        index._total_len = float(sum(index._doc_len))
+        return index
+
+    @classmethod
+    def from_catalog(cls, products: List[Dict[str, Any]]) -> "BM25Index":
+        index = cls()
+        index.add_many((item['id'], product_text(item)) for item in products)
+        return index
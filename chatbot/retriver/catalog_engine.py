@@ -0,0 +1,433 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+from utils.config import Config
+from utils.catalog_version import get_catalog_version
+from utils.jsonl import read_records
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_COLUMNS = ("price_each", "price_per_lb", "lb_per_each")
+CATEGORICAL_COLUMNS = ("brand", "cheese_type", "cheese_form")
+# Per-row fields carried along for display only; never filtered or aggregated
+_EXTRA_FIELDS = ("description", "image_url", "source_url", "sku", "upc")
+
+_NUMERIC_OPS = {
+    "$lt": np.less,
+    "$lte": np.less_equal,
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+}
+
+
+class ColumnarCatalog:
+    """
+    The processed product catalog held column-wise in NumPy arrays.
+
+    Prices and weights are float64 columns (NaN when missing), `case` is an
+    int32 column of units per case (0 when not sold by the case) and brand,
+    cheese_type and cheese_form are dictionary encoded: an int32 code per row
+    plus the sorted list of distinct values.
+    Filters use the Pinecone dialect and compile to boolean masks over the
+    code and value arrays, so top-k, min/max, range and group-by queries are
+    a handful of vectorized operations regardless of catalog size.
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        numeric: Dict[str, np.ndarray],
+        case: np.ndarray,
+        codes: Dict[str, np.ndarray],
+        categories: Dict[str, List[str]],
+        extras: Optional[List[Dict[str, Any]]] = None,
+        version: Optional[str] = None
+    ):
+        self.ids = np.asarray(ids, dtype=object)
+        self.numeric = {name: np.asarray(numeric[name], dtype=np.float64) for name in NUMERIC_COLUMNS}
+        self.case = np.asarray(case, dtype=np.int32)
+        self.codes = {name: np.asarray(codes[name], dtype=np.int32) for name in CATEGORICAL_COLUMNS}
+        self.categories = {name: list(categories[name]) for name in CATEGORICAL_COLUMNS}
+        self._lookup = {name: {value: code for code, value in enumerate(values)} for name, values in self.categories.items()}
+        self.extras = extras
+        self.version = version
+        self._positions: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_products(cls, products: List[Dict[str, Any]], version: Optional[str] = None) -> "ColumnarCatalog":
+        """Build from the processed product JSON records"""
+        metadata = [p.get('metadata', {}) for p in products]
+        numeric = {
+            name: np.array([_to_float(m.get(name)) for m in metadata], dtype=np.float64)
+            for name in NUMERIC_COLUMNS
+        }
+        case = np.array([_case_count(m.get('case', 'No')) for m in metadata], dtype=np.int32)
+        codes, categories = {}, {}
+        for name in CATEGORICAL_COLUMNS:
+            categories[name], codes[name] = _dictionary_encode([str(m.get(name, 'N/A')) for m in metadata])
+        extras = [
+            {key: (p.get(key) if key in p else m.get(key)) for key in _EXTRA_FIELDS}
+            for p, m in zip(products, metadata)
+        ]
+        ids = [p.get('id', str(i)) for i, p in enumerate(products)]
+        return cls(ids, numeric, case, codes, categories, extras, version)
+
+    @classmethod
+    def from_catalog(cls, path: str = Config.CATALOG_PATH) -> "ColumnarCatalog":
+        version = get_catalog_version()
+        catalog = cls.from_products(list(read_records(path)), version)
+        logger.info(f"Columnar catalog loaded with {len(catalog)} products (version {version})")
+        return catalog
+
+    def mask(self, filter_dict: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Evaluate a Pinecone metadata filter into a boolean row mask"""
+        mask = np.ones(len(self), dtype=bool)
+        for key, condition in (filter_dict or {}).items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self.mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(len(self), dtype=bool)
+                for clause in condition:
+                    any_mask |= self.mask(clause)
+                mask &= any_mask
+            elif isinstance(condition, dict):
+                for op, operand in condition.items():
+                    mask &= self._field_mask(key, op, operand)
+            else:
+                mask &= self._field_mask(key, "$eq", condition)
+        return mask
+
+    def top_k(
+        self,
+        column: str,
+        k: int = 5,
+        ascending: bool = False,
+        filter_dict: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Rows with the k largest (or smallest) values of a numeric column, best first; missing values never rank"""
+        values = self.numeric[column]
+        candidates = np.flatnonzero(self.mask(filter_dict) & ~np.isnan(values))
+        if not len(candidates) or k <= 0:
+            return []
+        keys = values[candidates] if ascending else -values[candidates]
+        if len(candidates) > k:
+            part = np.argpartition(keys, k - 1)[:k]
+            candidates, keys = candidates[part], keys[part]
+        return self.rows(candidates[np.argsort(keys, kind="stable")])
+
+    def min(self, column: str, filter_dict: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        rows = self.top_k(column, 1, ascending=True, filter_dict=filter_dict)
+        return rows[0] if rows else None
+
+    def max(self, column: str, filter_dict: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        rows = self.top_k(column, 1, ascending=False, filter_dict=filter_dict)
+        return rows[0] if rows else None
+
+    def range(
+        self,
+        column: str,
+        low: Optional[float] = None,
+        high: Optional[float] = None,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Rows with low <= column <= high (either bound optional), sorted ascending by the column"""
+        values = self.numeric[column]
+        mask = self.mask(filter_dict)
+        with np.errstate(invalid="ignore"):
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        selected = np.flatnonzero(mask)
+        if limit and len(selected) > limit:
+            selected = selected[np.argpartition(values[selected], limit - 1)[:limit]]
+        return self.rows(selected[np.argsort(values[selected], kind="stable")])
+
+    def count(self, filter_dict: Optional[Dict[str, Any]] = None) -> int:
+        return int(self.mask(filter_dict).sum())
+
+    def aggregate(self, column: str, agg: str, filter_dict: Optional[Dict[str, Any]] = None) -> Optional[float]:
+        """mean/min/max/sum of a numeric column over the filtered rows, ignoring missing values"""
+        values = self.numeric[column][self.mask(filter_dict)]
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return None
+        return float(getattr(np, agg)(values))
+
+    def group_by(
+        self,
+        key: str,
+        column: Optional[str] = None,
+        agg: str = "count",
+        filter_dict: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Aggregate a numeric column per value of a categorical column.
+
+        agg is one of count, sum, mean, min or max; groups come back sorted by
+        the aggregate, largest first except for min which sorts smallest first.
+        """
+        mask = self.mask(filter_dict)
+        if agg != "count":
+            mask &= ~np.isnan(self.numeric[column])
+        codes = self.codes[key][mask]
+        n_groups = len(self.categories[key])
+        counts = np.bincount(codes, minlength=n_groups)
+
+        if agg == "count":
+            result = counts.astype(np.float64)
+        else:
+            values = self.numeric[column][mask]
+            if agg in ("sum", "mean"):
+                result = np.bincount(codes, weights=values, minlength=n_groups)
+                if agg == "mean":
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        result = result / counts
+            elif agg in ("min", "max"):
+                result = np.full(n_groups, np.inf if agg == "min" else -np.inf)
+                (np.minimum if agg == "min" else np.maximum).at(result, codes, values)
+            else:
+                raise ValueError(f"Unsupported aggregate: {agg}")
+
+        present = np.flatnonzero(counts)
+        order = present[np.argsort(result[present] if agg == "min" else -result[present], kind="stable")]
+        return [
+            {key: self.categories[key][code], 'value': float(result[code]), 'count': int(counts[code])}
+            for code in order
+        ]
+
+    def rows(self, positions: Sequence[int]) -> List[Dict[str, Any]]:
+        """Materialize rows as dicts shaped like vector-search matches (without a score)"""
+        out = []
+        for pos in positions:
+            pos = int(pos)
+            row = {'id': self.ids[pos]}
+            for name in CATEGORICAL_COLUMNS:
+                row[name] = self.categories[name][self.codes[name][pos]]
+            for name in NUMERIC_COLUMNS:
+                value = self.numeric[name][pos]
+                row[name] = None if np.isnan(value) else float(value)
+            # As in the processed records: the count per case, or "No"
+            row['case'] = int(self.case[pos]) if self.case[pos] else "No"
+            if self.extras is not None:
+                row.update(self.extras[pos])
+            out.append(row)
+        return out
+
+    def rows_by_id(self, ids: Sequence[str]) -> List[Dict[str, Any]]:
+        """Rows for the given product ids, in the given order; unknown ids are skipped"""
+        if self._positions is None:
+            self._positions = {doc_id: pos for pos, doc_id in enumerate(self.ids.tolist())}
+        return self.rows([self._positions[i] for i in ids if i in self._positions])
+
+    def _field_mask(self, name: str, op: str, operand: Any) -> np.ndarray:
+        if name in self.codes:
+            lookup = self._lookup[name]
+            if op in ("$eq", "$ne"):
+                code = lookup.get(operand, -1)
+                matched = self.codes[name] == code
+                return matched if op == "$eq" else ~matched
+            if op in ("$in", "$nin"):
+                # Lookup table over the dictionary: one gather instead of a set-membership test per row
+                table = np.zeros(len(self.categories[name]), dtype=bool)
+                table[[lookup[v] for v in operand if v in lookup]] = True
+                matched = table[self.codes[name]]
+                return matched if op == "$in" else ~matched
+        elif name in self.numeric:
+            values = self.numeric[name]
+            with np.errstate(invalid="ignore"):
+                if op in _NUMERIC_OPS:
+                    return _NUMERIC_OPS[op](values, float(operand))
+                if op in ("$eq", "$ne"):
+                    matched = values == float(operand)
+                    return matched if op == "$eq" else ~matched
+                if op in ("$in", "$nin"):
+                    matched = np.isin(values, np.asarray(operand, dtype=np.float64))
+                    return matched if op == "$in" else ~matched
+        elif name == "case":
+            if op in _NUMERIC_OPS:
+                return _NUMERIC_OPS[op](self.case, _case_count(operand))
+            if op in ("$eq", "$ne"):
+                if str(operand).lower() in ('yes', 'true'):
+                    # Sold by the case at all, whatever the count
+                    matched = self.case > 0
+                else:
+                    matched = self.case == _case_count(operand)
+                return matched if op == "$eq" else ~matched
+        else:
+            # Unknown fields match nothing, as in Pinecone
+            return np.zeros(len(self), dtype=bool) if op not in ("$ne", "$nin") else np.ones(len(self), dtype=bool)
+        raise ValueError(f"Unsupported filter operator for {name}: {op}")
+
+
+@dataclass
+class CatalogQuery:
+    """An exact question over the catalog, as planned from the user's wording"""
+    kind: str  # "top_k", "range", "count", "aggregate" or "group_by"
+    column: Optional[str] = None
+    ascending: bool = False
+    k: int = 3
+    agg: Optional[str] = None
+    group_key: Optional[str] = None
+    filter_dict: Optional[Dict[str, Any]] = None
+    description: str = ""
+    low: Optional[float] = None
+    high: Optional[float] = None
+
+
+@dataclass
+class CatalogAnswer:
+    """Result of a CatalogQuery: product rows and/or a scalar or grouped value, plus a prompt rendering"""
+    query: CatalogQuery
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    value: Optional[float] = None
+    groups: List[Dict[str, Any]] = field(default_factory=list)
+    total_matches: int = 0
+
+    def to_context(self) -> str:
+        lines = [f"Exact catalog lookup: {self.query.description}", f"Products matching the filters: {self.total_matches}"]
+        if self.value is not None:
+            lines.append(f"Result: {int(self.value)}" if self.query.kind == "count" else f"Result: {self.value:.2f}")
+        for group in self.groups:
+            value = f"{group['count']}" if self.query.agg == "count" else f"{group['value']:.2f}"
+            lines.append(f"- {group[self.query.group_key]}: {value} ({group['count']} products)")
+        if self.rows:
+            lines.append("Rows, in order:")
+            for i, row in enumerate(self.rows, 1):
+                lines.append(
+                    f"{i}. {row['cheese_type']} | {row['brand']} | {row['cheese_form']} | "
+                    f"price ${_fmt(row['price_each'])} | ${_fmt(row['price_per_lb'])}/lb | {_fmt(row['lb_per_each'])} lb"
+                )
+        return "\n".join(lines)
+
+
+# Price wording anywhere in the question ("cheapest mozzarella per lb") selects price_per_lb
+_PER_LB_RE = re.compile(r"\bper (?:lb|pound)\b|/lb\b|\bby the pound\b", re.IGNORECASE)
+# wording -> (column, ascending)
+_SUPERLATIVES = [
+    (r"best value|best deal", ("price_per_lb", True)),
+    (r"most expensive|priciest|costliest|highest[- ]priced|highest price|costs? the most", ("price_each", False)),
+    (r"cheapest|least expensive|most affordable|lowest[- ]priced|lowest price|costs? the least", ("price_each", True)),
+    (r"heaviest|largest|biggest", ("lb_per_each", False)),
+    (r"lightest|smallest", ("lb_per_each", True)),
+]
+_SUPERLATIVE_PATTERNS = [(re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE), target) for pattern, target in _SUPERLATIVES]
+_TOP_N_RE = re.compile(r"(?<![\$.\d])\b(?:top\s+)?(\d{1,2})\s+(?:most|cheapest|least|priciest|heaviest|lightest|largest|smallest|biggest|costliest)", re.IGNORECASE)
+_COUNT_RE = re.compile(r"\bhow many\b|\bnumber of\b|\bcount\b", re.IGNORECASE)
+_AVERAGE_RE = re.compile(r"\b(?:average|mean|typical)\b", re.IGNORECASE)
+_GROUP_RE = re.compile(r"\b(?:by|per|for each|each|every)\s+(brand|form|type)s?\b", re.IGNORECASE)
+_GROUP_FIELDS = {"brand": "brand", "form": "cheese_form", "type": "cheese_type"}
+_COLUMN_WORDS = [
+    (_PER_LB_RE, "price_per_lb"),
+    (re.compile(r"\b(?:weigh|weight|heavy|pounds?|lbs?)\b", re.IGNORECASE), "lb_per_each"),
+    (re.compile(r"\b(?:price|cost|expensive|cheap|dollars?)\b|\$", re.IGNORECASE), "price_each"),
+]
+_COLUMN_LABELS = {"price_each": "price", "price_per_lb": "price per lb", "lb_per_each": "weight (lb)"}
+
+
+def plan_catalog_query(text: str, analyzer) -> Optional[CatalogQuery]:
+    """
+    Map a superlative, aggregate or purely numeric question onto a CatalogQuery.
+
+    Returns None when the question needs semantic search instead, e.g. it
+    names no orderable attribute ("softest") or carries no numeric intent.
+    """
+    filter_dict, matched_terms, numeric = analyzer.extract_filter(text)
+
+    superlative = next(((col, asc) for pattern, (col, asc) in _SUPERLATIVE_PATTERNS if pattern.search(text)), None)
+    if superlative and superlative[0] == "price_each" and _PER_LB_RE.search(text):
+        superlative = ("price_per_lb", superlative[1])
+    group = _GROUP_RE.search(text)
+    column = next((col for pattern, col in _COLUMN_WORDS if pattern.search(text)), None)
+
+    if group and (superlative or _AVERAGE_RE.search(text) or _COUNT_RE.search(text)):
+        key = _GROUP_FIELDS[group.group(1).lower()]
+        if _COUNT_RE.search(text):
+            return CatalogQuery("group_by", agg="count", group_key=key, filter_dict=filter_dict,
+                                description=f"number of products per {key}")
+        if superlative:
+            col, asc = superlative
+            agg = "min" if asc else "max"
+        else:
+            col, agg = column or "price_each", "mean"
+        return CatalogQuery("group_by", column=col, agg=agg, group_key=key, filter_dict=filter_dict,
+                            description=f"{agg} {_COLUMN_LABELS[col]} per {key}")
+
+    if superlative:
+        col, asc = superlative
+        top_n = _TOP_N_RE.search(text)
+        k = int(top_n.group(1)) if top_n else 3
+        order = "lowest" if asc else "highest"
+        return CatalogQuery("top_k", column=col, ascending=asc, k=max(1, min(k, Config.TOP_K_RESULTS)),
+                            filter_dict=filter_dict,
+                            description=f"products with the {order} {_COLUMN_LABELS[col]}, best first")
+
+    if _AVERAGE_RE.search(text) and column:
+        return CatalogQuery("aggregate", column=column, agg="mean", filter_dict=filter_dict,
+                            description=f"average {_COLUMN_LABELS[column]}")
+
+    if _COUNT_RE.search(text) and (matched_terms or numeric):
+        return CatalogQuery("count", filter_dict=filter_dict, description="number of matching products")
+
+    if numeric and not matched_terms:
+        # A bare bound such as "cheese under $20": list every match, cheapest/lightest first
+        first_field = next(iter(numeric[0]))
+        return CatalogQuery("range", column=first_field, ascending=True, k=Config.TOP_K_RESULTS,
+                            filter_dict=filter_dict,
+                            description=f"products within the requested {_COLUMN_LABELS[first_field]} range, sorted ascending")
+    return None
+
+
+def execute(catalog: ColumnarCatalog, query: CatalogQuery) -> CatalogAnswer:
+    """Run a planned query against the columnar catalog"""
+    total = catalog.count(query.filter_dict)
+    if query.kind == "top_k":
+        rows = catalog.top_k(query.column, query.k, query.ascending, query.filter_dict)
+        return CatalogAnswer(query, rows=rows, total_matches=total)
+    if query.kind == "range":
+        rows = catalog.range(query.column, query.low, query.high, query.filter_dict, limit=query.k)
+        return CatalogAnswer(query, rows=rows, total_matches=total)
+    if query.kind == "count":
+        rows = catalog.range("price_each", filter_dict=query.filter_dict, limit=5)
+        return CatalogAnswer(query, rows=rows, value=float(total), total_matches=total)
+    if query.kind == "aggregate":
+        value = catalog.aggregate(query.column, query.agg, query.filter_dict)
+        return CatalogAnswer(query, value=value, total_matches=total)
+    if query.kind == "group_by":
+        groups = catalog.group_by(query.group_key, query.column, query.agg, query.filter_dict)
+        return CatalogAnswer(query, groups=groups[:Config.TOP_K_RESULTS], total_matches=total)
+    raise ValueError(f"Unsupported catalog query kind: {query.kind}")
+
+
+def _dictionary_encode(values: List[str]):
+    categories = sorted(set(values))
+    lookup = {value: code for code, value in enumerate(categories)}
+    return categories, np.fromiter((lookup[v] for v in values), dtype=np.int32, count=len(values))
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _case_count(value: Any) -> int:
+    """Units per case from the metadata value: a count such as 6 or "6", "Yes" (count unknown) or "No" """
+    if isinstance(value, str) and value.strip().lower() in ('yes', 'true'):
+        return 1
+    count = _to_float(value)
+    return int(count) if count > 0 else 0
+
+
+def _fmt(value: Optional[float]) -> str:
+    return f"{value:.2f}" if value is not None else "n/a"
@@ -0,0 +1,205 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional
+
+from utils.config import Config
+from utils.tokens import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = ("#", "product", "brand", "form", "price", "$/lb", "lb", "description")
+
+
+@dataclass
+class PackedContext:
+    """Context text for the answer prompt plus the products it describes"""
+    text: str
+    products: List[Dict[str, Any]]
+    tokens: int
+    baseline_tokens: int
+    dropped: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.baseline_tokens - self.tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'products': len(self.products),
+            'tokens': self.tokens,
+            'baseline_tokens': self.baseline_tokens,
+            'tokens_saved': self.tokens_saved,
+            'dropped': self.dropped
+        }
+
+
+class ContextBuilder:
+    """
+    Turns vector-search matches into the product context of the answer prompt.
+
+    Matches go through four steps: a fixed score cutoff, a knee detector that
+    drops the flat tail after the last sharp fall in scores, deduplication of
+    near-identical listings (the same cheese in several pack sizes), and
+    packing into a pipe-separated table until max_tokens is reached. The
+    table leaves out image and source URLs, SKU/UPC codes and the case flag,
+    which the model never uses in an answer.
+    """
+
+    def __init__(
+        self,
+        min_score: float = Config.CONTEXT_MIN_SCORE,
+        knee_sensitivity: float = Config.CONTEXT_KNEE_SENSITIVITY,
+        min_products: int = Config.CONTEXT_MIN_PRODUCTS,
+        dedupe_similarity: float = Config.CONTEXT_DEDUPE_SIMILARITY,
+        max_tokens: int = Config.CONTEXT_MAX_TOKENS,
+        description_tokens: int = Config.CONTEXT_DESCRIPTION_TOKENS,
+        model: str = Config.OPENAI_MODEL
+    ):
+        self.min_score = min_score
+        self.knee_sensitivity = knee_sensitivity
+        self.min_products = min_products
+        self.dedupe_similarity = dedupe_similarity
+        self.max_tokens = max_tokens
+        self.description_tokens = description_tokens
+        self.model = model
+
+    def build(self, products: List[Dict[str, Any]]) -> PackedContext:
+        baseline_tokens = count_tokens("".join(verbose_product_block(p) for p in products), self.model)
+        dropped = {}
+
+        survivors = [p for p in products if p.get('score') is None or p['score'] >= self.min_score]
+        dropped['below_min_score'] = len(products) - len(survivors)
+
+        before = len(survivors)
+        survivors = survivors[:self.knee(survivors)]
+        dropped['after_knee'] = before - len(survivors)
+
+        before = len(survivors)
+        survivors = self.dedupe(survivors)
+        dropped['duplicates'] = before - len(survivors)
+
+        header = " | ".join(_COLUMNS)
+        lines = [header]
+        tokens = count_tokens(header, self.model)
+        packed = []
+        for product in survivors:
+            row = self._row(len(packed) + 1, product)
+            row_tokens = count_tokens("\n" + row, self.model)
+            if packed and tokens + row_tokens > self.max_tokens:
+                break
+            lines.append(row)
+            tokens += row_tokens
+            packed.append(product)
+        dropped['over_budget'] = len(survivors) - len(packed)
+
+        if not packed:
+            return PackedContext("", [], 0, baseline_tokens, dropped)
+        result = PackedContext("\n".join(lines), packed, tokens, baseline_tokens, dropped)
+        logger.info(f"Context packed: {result.stats()}")
+        return result
+
+    def knee(self, products: List[Dict[str, Any]]) -> int:
+        """
+        Number of leading products to keep, cutting at the elbow of the score curve.
+
+        Scores (sorted descending by the index) are normalized to [0, 1] on both
+        axes; the elbow is the point furthest below the straight line from the
+        first to the last score. The cut is only made when that distance reaches
+        knee_sensitivity, so a gently declining list is kept whole. Lists not in
+        descending score order, as MMR reranking leaves them, are kept whole too:
+        their tail holds the picks made for diversity, not the weakest matches.
+        """
+        scores = [p['score'] for p in products if p.get('score') is not None]
+        n = len(scores)
+        if n != len(products) or n <= self.min_products:
+            return len(products)
+        if any(later > earlier for earlier, later in zip(scores, scores[1:])):
+            return n
+        top, bottom = scores[0], scores[-1]
+        if top - bottom <= 1e-9:
+            return n
+
+        best_index, best_distance = n, 0.0
+        for i, score in enumerate(scores):
+            distance = (1 - i / (n - 1)) - (score - bottom) / (top - bottom)
+            if distance > best_distance:
+                best_index, best_distance = i, distance
+        if best_distance < self.knee_sensitivity:
+            return n
+        return max(best_index, self.min_products)
+
+    def dedupe(self, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep the best-scoring listing among products whose name, brand and form words nearly coincide"""
+        kept: List[Dict[str, Any]] = []
+        kept_words: List[set] = []
+        for product in products:
+            words = _identity_words(product)
+            if any(_jaccard(words, other) >= self.dedupe_similarity for other in kept_words):
+                continue
+            kept.append(product)
+            kept_words.append(words)
+        return kept
+
+    def _row(self, number: int, product: Dict[str, Any]) -> str:
+        description = re.sub(r"\s+", " ", str(product.get('description', ''))).replace("|", "/").strip()
+        cells = [
+            str(number),
+            product.get('cheese_type', product.get('name', '')),
+            product.get('brand', ''),
+            product.get('cheese_form', ''),
+            _money(product.get('price_each')),
+            _money(product.get('price_per_lb')),
+            _number(product.get('lb_per_each')),
+            truncate_tokens(description, self.description_tokens, self.model, keep="head")
+        ]
+        return " | ".join(str(cell).replace("|", "/") for cell in cells)
+
+
+def verbose_product_block(product: Dict[str, Any]) -> str:
+    """The original per-product prompt block, kept as the baseline for token savings"""
+    return (
+        f"Product: {product.get('cheese_type', '')}\n"
+        f"Brand: {product.get('brand', '')}\n"
+        f"Form: {product.get('cheese_form', '')}\n"
+        f"Description: {product.get('description', '')}\n"
+        f"Price: ${product.get('price_each', 0):.2f}\n"
+        f"Price per lb: ${product.get('price_per_lb', 0):.2f}\n"
+        f"Lb per unit: {product.get('lb_per_each', 0):.2f}\n"
+        f"Case: {product.get('case', 'No')}\n"
+        f"Sku: {product.get('sku', 'No')}\n"
+        f"Upc: {product.get('upc', 'No')}\n"
+        f"Image: {product.get('image_url', 'N/A')}\n"
+        f"Source: {product.get('source_url', 'N/A')}\n"
+    )
+
+
+def _identity_words(product: Dict[str, Any]) -> set:
+    text = " ".join(str(product.get(key, '')) for key in ('cheese_type', 'brand', 'cheese_form'))
+    # Pack sizes and counts ("5 lb", "12 ct") distinguish listings of the same cheese, not different cheeses
+    return set(re.findall(r"[a-z]+", text.lower())) - {"lb", "lbs", "oz", "ct", "pack", "case", "each"}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _money(value: Optional[float]) -> str:
+    return f"${value:.2f}" if isinstance(value, (int, float)) and value else "-"
+
+
+def _number(value: Optional[float]) -> str:
+    return f"{value:.2f}" if isinstance(value, (int, float)) and value else "-"
+
+
+_default_builder: Optional[ContextBuilder] = None
+
+
+def build_context(products: List[Dict[str, Any]]) -> PackedContext:
+    """Pack products with the Config-driven builder"""
+    global _default_builder
+    if _default_builder is None:
+        _default_builder = ContextBuilder()
+    return _default_builder.build(products)
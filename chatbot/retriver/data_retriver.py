@@ -1,16 +1,37 @@
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Iterable, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pinecone import Pinecone
 from openai import OpenAI
 import sys
 from pathlib import Path
 import json
+import asyncio
+import threading
+import time
 
 # Add project root to Python path
 project_root = str(Path(__file__).parent.parent)
 sys.path.append(project_root)
 
 from utils.config import Config
+from utils.embedding_cache import get_embedding_cache
+from utils.jsonl import read_records
+from utils.resilience import get_upstream
+from utils.single_flight import copy_records, get_single_flight, normalize_query, vector_key
+from utils.tracing import count, in_current_context, record_usage, span, with_current_context
+from chatbot.retriver.local_index import LocalVectorIndex
+from chatbot.retriver.query_analyzer import QueryAnalyzer, QueryAnalysis
+from chatbot.retriver.async_store import AsyncVectorStore
+from chatbot.retriver.context_builder import build_context
+from chatbot.retriver.hybrid import HybridRetriever
+from chatbot.retriver.mmr import diversify, wants_values
+from chatbot.resources import get_bm25_index, get_catalog
+from chatbot.retriver.prompts import (
+    DETERMINE_FUNCTION, NOT_CHEESE_RESPONSE, NO_PRODUCTS_RESPONSE, ERROR_RESPONSE,
+    build_response_messages, classification_request, filter_request, parse_filter_response, stage_timer
+)
 
 logger = logging.getLogger(__name__)
 
@@ -19,24 +40,30 @@ class VectorStore:
         # Initialize OpenAI client
         if not Config.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY is not set in config.py")
-        self.client = OpenAI(api_key=Config.OPENAI_API_KEY)
+        # Retries are left to the shared upstream policy, which also enforces per-stage deadlines
+        self.client = OpenAI(api_key=Config.OPENAI_API_KEY, base_url=Config.OPENAI_BASE_URL, max_retries=0)
+        self.openai = get_upstream('openai')
+        self.pinecone = get_upstream('pinecone')
+        # Sessions asking the same thing at the same time share one upstream call per stage
+        self.flights = get_single_flight()
+        self._async_store = None
+        self._hybrid = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self.embedding_cache = get_embedding_cache()
         
         # Define the function for determining question type
-        self.DETERMINEFUNCTION = [{
-            "type": "function",
-            "function": {
-                "name": "determine_question_type",
-                "description": "The metadata we use include: cheese_type, brand, cheese_form, price_each, price_per_lb, lb_per_each, case, sku, upc, image_url, source_url. If the answer can be answered accurately through a pinecone vector database search that includes metadata filtering related to these values, then 1 must be output. But if the user's question now is one that is difficult to answer accurately with a chatbot using the Pinecone vector database. For example, it may be a greeting that is not related to the exact information about cheese, or it may be a question that is difficult to answer accurately with a semantic search using the vector database, in this case the output has to be 0, e.g. finding most expensive cheese, or the heaviest product. and also, it may be a question about a different field that cannot be considered a question from a user using this chatbot to know about cheese. In this case function output has to be 0, Otherwise output has to be 1 that is answerable.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "is_cheese_question": {"type": "integer"}
-                    },
-                    "required": ["is_cheese_question"]
-                }
-            },
-            "strict": True
-        }]
+        self.DETERMINEFUNCTION = DETERMINE_FUNCTION
+
+        try:
+            self.query_analyzer = QueryAnalyzer.from_catalog(Config.CATALOG_PATH)
+        except Exception as e:
+            logger.warning(f"Query analyzer disabled, could not load catalog: {str(e)}")
+            self.query_analyzer = None
+
+        if Config.VECTOR_BACKEND == "local":
+            self.index = self._load_local_index()
+            return
 
         # Initialize Pinecone
         if not Config.PINECONE_API_KEY:
@@ -46,6 +73,11 @@ class VectorStore:
             # Initialize Pinecone client
             self.pc = Pinecone(api_key=Config.PINECONE_API_KEY)
 
+            if Config.PINECONE_HOST:
+                self.index = self.pc.Index(host=Config.PINECONE_HOST)
+                print(f"Connected to Pinecone index at {Config.PINECONE_HOST}")
+                return
+
             # Check if index exists
             available_indexes = self.pc.list_indexes()
             if Config.PINECONE_INDEX_NAME not in [index.name for index in available_indexes]:
@@ -66,17 +98,49 @@ class VectorStore:
             logger.error(f"Error connecting to Pinecone: {str(e)}")
             raise
 
+    def _load_local_index(self) -> LocalVectorIndex:
+        """Load the in-process index, building it from the processed catalog on first use"""
+        index_path = Path(Config.LOCAL_INDEX_PATH)
+        if index_path.exists():
+            index = LocalVectorIndex.load(index_path)
+            logger.info(f"Loaded local index with {len(index)} vectors from {index_path}")
+            return index
+
+        products = list(read_records(Config.CATALOG_PATH))
+        index = LocalVectorIndex.from_catalog(products, self.get_embeddings, Config.VECTOR_DIMENSION)
+        if len(index) < len(products):
+            # Saved, a partial index (say, built during an OpenAI outage) would be loaded by every later start
+            logger.error(
+                f"Built local index with only {len(index)} of {len(products)} products; "
+                f"not saving it, the next start builds it again"
+            )
+            return index
+        index.save(index_path)
+        logger.info(f"Built local index with {len(index)} vectors from {Config.CATALOG_PATH}")
+        return index
+
     def get_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using OpenAI's API"""
+        return self.get_embeddings([text])[0]
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for several texts, sending only cache misses in one request"""
         try:
-            response = self.client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=text
-            )
-            return response.data[0].embedding
+            return self.embedding_cache.get_many(Config.EMBEDDING_MODEL, texts, self._create_embeddings)
         except Exception as e:
-            logger.error(f"Error generating embedding: {str(e)}")
-            return []
+            logger.error(f"Error generating embeddings: {str(e)}")
+            return [[] for _ in texts]
+
+    def _create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.flights.do('embedding', (Config.EMBEDDING_MODEL, tuple(texts)), self._request_embeddings, texts)
+
+    def _request_embeddings(self, texts: List[str]) -> List[List[float]]:
+        with span('openai.embeddings', texts=len(texts)):
+            response = self.openai.call(
+                'embedding', self.client.embeddings.create, model=Config.EMBEDDING_MODEL, input=texts, hedge=True
+            )
+            record_usage('embedding', response)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
     def query_products(
         self,
@@ -95,54 +159,215 @@ class VectorStore:
         Returns:
             List of relevant products with their metadata
         """
+        # Generate query embedding
+        query_embedding = self.get_embedding(query)
+        if not query_embedding:
+            logger.error("Failed to generate query embedding")
+            return []
+
+        logger.debug("Query: %s", query)
+        return self.query_by_vector(query_embedding, top_k=top_k, filter_dict=filter_dict)
+
+    def query_by_vector(
+        self,
+        query_embedding: List[float],
+        top_k: int = Config.TOP_K_RESULTS,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        include_values: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Query the vector index with an already computed embedding; include_values adds each match's vector as 'values'"""
         try:
-            # Generate query embedding
-            query_embedding = self.get_embedding(query)
-            if not query_embedding:
-                logger.error("Failed to generate query embedding")
-                return []
-
-            # Log the query details
-            print(f"Querying Pinecone with:")
-            print(f"- Query: {query}")
-            print(f"- Top K: {top_k}")
-            print(f"- Filters: {filter_dict}")
-
-            # Query Pinecone
-            results = self.index.query(
+            logger.debug("Querying %s index: top_k=%d, filter=%s", Config.VECTOR_BACKEND, top_k, filter_dict)
+            if isinstance(self.index, LocalVectorIndex):
+                products = self._request_products(query_embedding, top_k, filter_dict, include_values)
+            else:
+                # Identical remote queries in flight at once share one request
+                products = self.flights.do(
+                    'vector_query', vector_key(query_embedding, top_k, filter_dict, include_values),
+                    self._request_products, query_embedding, top_k, filter_dict, include_values,
+                    share=copy_records
+                )
+            if not products:
+                logger.info("No products matched (filter=%s); the filter may be too restrictive or the index empty", filter_dict)
+
+            return products
+
+        except Exception as e:
+            logger.error(f"Error querying products: {str(e)}")
+            return []
+
+    def _request_products(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]],
+        include_values: bool
+    ) -> List[Dict[str, Any]]:
+        # Query the vector index (Pinecone or local)
+        with span('vector.query', backend=Config.VECTOR_BACKEND, top_k=top_k, filtered=bool(filter_dict)) as query_span:
+            results = self._query_index(
                 vector=query_embedding,
                 top_k=top_k,
                 include_metadata=True,
+                include_values=include_values,
                 filter=filter_dict
             )
-            
-            # Log the results
-            print(f"Pinecone returned {len(results.matches)} matches")
-            
-            # Process and return results
-            products = []
-            for match in results.matches:
-                product = {
-                    'id': match.id,
-                    'score': match.score,
-                    **match.metadata
-                }
-                products.append(product)
-                print(f"Match found - ID: {match.id}, Score: {match.score}")
+            query_span.set(matches=len(results.matches))
+        count('retrieved_products_total', len(results.matches), source='vector')
+
+        # Process and return results
+        products = []
+        for match in results.matches:
+            product = {
+                'id': match.id,
+                'score': match.score,
+                **match.metadata
+            }
+            if include_values:
+                product['values'] = match.values
+            products.append(product)
+        return products
 
-            if not products:
-                print("No products found matching the query. This could be due to:")
-                print("1. No vectors in the index")
-                print("2. Query filters too restrictive")
-                print("3. Query not matching any vectors")
-                print("4. Index connection issues")
+    def query_products_batch(
+        self,
+        queries: Iterable[str],
+        filters: Optional[Iterable[Optional[Dict[str, Any]]]] = None,
+        top_k: int = Config.TOP_K_RESULTS,
+        batch_size: int = Config.BATCH_QUERY_SIZE
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Embed and search many queries, yielding {'query', 'filter', 'products'} in input order.
 
-            return products
+        Inputs are consumed batch_size at a time, so memory stays bounded for
+        arbitrarily long (or lazily produced) query streams. Each batch's cache
+        misses go out in one embedding request, issued while the previous batch
+        is being searched. Against the local index a batch is searched with one
+        matrix-matrix product per distinct filter; against Pinecone its queries
+        run concurrently on a thread pool.
+
+        Args:
+            queries: Query texts
+            filters: Optional metadata filter per query, aligned with queries; a
+                length mismatch raises ValueError when the shorter one runs out
+            top_k: Number of results per query
+            batch_size: Queries per embedding request and per search batch
+        """
+        pairs = zip(queries, filters, strict=True) if filters is not None else ((query, None) for query in queries)
+        batches = iter(lambda: list(islice(pairs, batch_size)), [])
+
+        with ThreadPoolExecutor(max_workers=Config.ASYNC_MAX_CONCURRENCY, thread_name_prefix="batch-query") as executor:
+            batch = next(batches, None)
+            pending = executor.submit(in_current_context(self.get_embeddings), [query for query, _ in batch]) if batch else None
+            while batch:
+                embeddings = pending.result()
+                following = next(batches, None)
+                if following:
+                    pending = executor.submit(in_current_context(self.get_embeddings), [query for query, _ in following])
+
+                start = time.perf_counter()
+                batch_filters = [filter_dict for _, filter_dict in batch]
+                if isinstance(self.index, LocalVectorIndex):
+                    results = self._search_local_batch(embeddings, batch_filters, top_k)
+                else:
+                    futures = [
+                        executor.submit(in_current_context(self._search_quietly), embedding, top_k, filter_dict)
+                        for embedding, filter_dict in zip(embeddings, batch_filters)
+                    ]
+                    results = [future.result() for future in futures]
+                logger.info(f"Searched a batch of {len(batch)} queries in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+                for (query, filter_dict), products in zip(batch, results):
+                    yield {'query': query, 'filter': filter_dict, 'products': products}
+                batch = following
+
+    def _search_local_batch(
+        self,
+        embeddings: List[List[float]],
+        filters: List[Optional[Dict[str, Any]]],
+        top_k: int
+    ) -> List[List[Dict[str, Any]]]:
+        """One query_batch call per distinct filter; queries whose embedding failed get no products"""
+        groups: Dict[str, Tuple[Optional[Dict[str, Any]], List[int]]] = {}
+        for pos, (embedding, filter_dict) in enumerate(zip(embeddings, filters)):
+            if embedding:
+                key = json.dumps(filter_dict, sort_keys=True)
+                groups.setdefault(key, (filter_dict, []))[1].append(pos)
+
+        results: List[List[Dict[str, Any]]] = [[] for _ in embeddings]
+        for filter_dict, positions in groups.values():
+            try:
+                with span('vector.query_batch', queries=len(positions), top_k=top_k, filtered=bool(filter_dict)):
+                    responses = self.index.query_batch(
+                        [embeddings[pos] for pos in positions], top_k=top_k, include_metadata=True, filter=filter_dict
+                    )
+            except Exception as e:
+                logger.error(f"Error querying products: {str(e)}")
+                continue
+            for pos, response in zip(positions, responses):
+                results[pos] = [{'id': m.id, 'score': m.score, **m.metadata} for m in response.matches]
+        return results
 
+    def _search_quietly(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """query_by_vector without the per-match console output, for bulk jobs"""
+        if not query_embedding:
+            return []
+        try:
+            with span('vector.query', backend=Config.VECTOR_BACKEND, top_k=top_k, filtered=bool(filter_dict)) as query_span:
+                results = self._query_index(vector=query_embedding, top_k=top_k, include_metadata=True, filter=filter_dict)
+                query_span.set(matches=len(results.matches))
         except Exception as e:
             logger.error(f"Error querying products: {str(e)}")
-            print(f"Error details: {str(e)}")
             return []
+        return [{'id': match.id, 'score': match.score, **match.metadata} for match in results.matches]
+
+    def _query_index(self, **kwargs):
+        """index.query, under the Pinecone deadline and retry policy unless the index is in-process"""
+        if isinstance(self.index, LocalVectorIndex):
+            return self.index.query(**kwargs)
+        return self.pinecone.call('vector_query', self.index.query, hedge=True, **kwargs)
+
+    @property
+    def hybrid_retriever(self) -> Optional[HybridRetriever]:
+        """BM25 + vector retriever over the shared lexical index and catalog, created on first use when enabled"""
+        if not Config.HYBRID_SEARCH:
+            return None
+        with self._loop_lock:
+            if self._hybrid is None:
+                self._hybrid = HybridRetriever(self, get_bm25_index(), get_catalog())
+            return self._hybrid
+
+    def retrieve(
+        self,
+        query: str,
+        query_embedding: List[float],
+        filter_dict: Optional[Dict[str, Any]],
+        timings: Dict[str, float]
+    ) -> List[Dict[str, Any]]:
+        """
+        Vector retrieval, or vector and BM25 fused by rank when Config.HYBRID_SEARCH is on,
+        narrowed to a diverse Config.MMR_TOP_N by maximal marginal relevance when Config.MMR_ENABLED is on
+        """
+        hybrid = self.hybrid_retriever
+        if hybrid is None:
+            with stage_timer(timings, 'vector_query'):
+                products = self.query_by_vector(
+                    query_embedding, filter_dict=filter_dict, include_values=wants_values(self.index)
+                ) if query_embedding else []
+        else:
+            with stage_timer(timings, 'hybrid_query'):
+                result = hybrid.search(query, query_embedding, filter_dict=filter_dict, include_values=wants_values(self.index))
+            timings['vector_leg'] = result['metrics']['vector_ms']
+            timings['bm25_leg'] = result['metrics']['bm25_ms']
+            products = result['products']
+
+        if Config.MMR_ENABLED and products:
+            products = diversify(query_embedding, products, timings, index=self.index)
+        return products
 
     def generate_response(
         self,
@@ -161,66 +386,122 @@ class VectorStore:
             Dictionary containing the response and reference context
         """
         if type_of_question == 1:
+            packed = build_context(context_products)
+            if not packed.products:
+                return {'response': NO_PRODUCTS_RESPONSE, 'context': [], 'context_stats': packed.stats()}
             try:
-                # Prepare context from products
-                context = []
-                for product in context_products:
-                    product_info = (
-                        f"Product: {product['cheese_type']}\n"
-                        f"Brand: {product['brand']}\n"
-                        f"Form: {product['cheese_form']}\n"
-                        f"Description: {product['description']}\n"
-                        f"Price: ${product.get('price_each', 0):.2f}\n"
-                        f"Price per lb: ${product.get('price_per_lb', 0):.2f}\n"
-                        f"Lb per unit: {product.get('lb_per_each', 0):.2f}\n"
-                        f"Case: {product.get('case', 'No')}\n"
-                        f"Sku: {product.get('sku', 'No')}\n"
-                        f"Upc: {product.get('upc', 'No')}\n"
-                        f"Image: {product.get('image_url', 'N/A')}\n"
-                        f"Source: {product.get('source_url', 'N/A')}\n"
-                    )
-                    context.append(product_info)
-
-                # Create RAG prompt
-                prompt = (
-                    "You are a cheese expert assistant. Use the following product information to answer the user's question.\n"
-                    "If the information is not in the context, say so. Always cite the specific products you reference.\n\n"
-                    f"Context:\n{''.join(context)}\n\n"
-                    f"User Question: {query}\n\n"
-                    "Please provide a detailed answer based on the product information above:"
-                )
-
                 # Generate response
-                response = self.client.chat.completions.create(
-                    model=Config.OPENAI_MODEL,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful cheese expert assistant."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7,
-                    max_tokens=500
-                )
-                print("response")
+                with span('openai.chat', operation='generation', context_products=len(packed.products)):
+                    response = self.openai.call(
+                        'generation',
+                        self.client.chat.completions.create,
+                        model=Config.OPENAI_MODEL,
+                        messages=build_response_messages(query, packed.text),
+                        temperature=0.7,
+                        max_tokens=500
+                    )
+                    record_usage('generation', response)
                 return {
                     'response': response.choices[0].message.content,
-                    'context': context_products
+                    'context': packed.products,
+                    'context_stats': packed.stats()
                 }
 
             except Exception as e:
                 logger.error(f"Error generating response: {str(e)}")
                 return {
-                    'response': "I apologize, but I encountered an error while processing your request.",
+                    'response': ERROR_RESPONSE,
                     'context': []
                 }
         else:
             return {
-                'response': "this is not a question about cheese, general question",
+                'response': NOT_CHEESE_RESPONSE,
                 'context': []
             }
+
+    def generate_response_stream(
+        self,
+        query: str,
+        type_of_question: int,
+        context_products: List[Dict[str, Any]]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of generate_response.
+
+        Yields {'type': 'chunk', 'content': str} events as the model produces
+        tokens, then one {'type': 'final', 'response': str, 'context': [...], 'context_stats': {...}}.
+        """
+        if type_of_question != 1:
+            response = NOT_CHEESE_RESPONSE
+            yield {'type': 'chunk', 'content': response}
+            yield {'type': 'final', 'response': response, 'context': []}
+            return
+
+        packed = build_context(context_products)
+        if not packed.products:
+            yield {'type': 'chunk', 'content': NO_PRODUCTS_RESPONSE}
+            yield {'type': 'final', 'response': NO_PRODUCTS_RESPONSE, 'context': [], 'context_stats': packed.stats()}
+            return
+
+        parts = []
+        try:
+            with span('openai.chat', operation='generation', context_products=len(packed.products), stream=True) as chat_span:
+                stream = self.openai.call(
+                    'generation',
+                    self.client.chat.completions.create,
+                    model=Config.OPENAI_MODEL,
+                    messages=build_response_messages(query, packed.text),
+                    temperature=0.7,
+                    max_tokens=500,
+                    stream=True
+                )
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        parts.append(content)
+                        yield {'type': 'chunk', 'content': content}
+                chat_span.set(chunks=len(parts))
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            if not parts:
+                message = ERROR_RESPONSE
+                yield {'type': 'chunk', 'content': message}
+                yield {'type': 'final', 'response': message, 'context': []}
+                return
+
+        yield {'type': 'final', 'response': ''.join(parts), 'context': packed.products, 'context_stats': packed.stats()}
+
+    def _classify(self, query: str):
+        with span('openai.chat', operation='classification'):
+            response = self.openai.call('classification', self.client.chat.completions.create, **classification_request(query))
+            record_usage('classification', response)
+        return response
+
+    def _generate_filter(self, query: str):
+        with span('openai.chat', operation='filter_generation'):
+            response = self.openai.call('filter_generation', self.client.chat.completions.create, **filter_request(query))
+            record_usage('filter_generation', response)
+        return response
+
+    def analyze_query(self, text: str, timings: Dict[str, float]) -> Optional[QueryAnalysis]:
+        """Run the catalog analyzer; returns its result only when it is confident enough to skip the LLM stages"""
+        if self.query_analyzer is None:
+            return None
+        with stage_timer(timings, 'analysis'):
+            analysis = self.query_analyzer.analyze(text)
+        if analysis.confidence < Config.QUERY_ANALYZER_MIN_CONFIDENCE:
+            return None
+        logger.info("Query analyzer fast path: is_cheese_question=%s, filter=%s", analysis.is_cheese_question, analysis.filter_dict)
+        return analysis
+
     def get_relevant_products(
         self,
         query: str,
-        filter_dict: Optional[Dict[str, Any]] = None
+        filter_dict: Optional[Dict[str, Any]] = None,
+        question: Optional[str] = None,
+        generate: bool = True
     ) -> Dict[str, Any]:
         """
         Main method to get relevant products and generate a response
@@ -228,93 +509,118 @@ class VectorStore:
         Args:
             query: User's question
             filter_dict: Optional metadata filters
+            question: The latest user message, when query also carries conversation history;
+                the catalog analyzer looks only at this text
+            generate: When False, stop after retrieval and return 'response': None for
+                callers that write (or stream) their own answer
         
         Returns:
-            Dictionary containing the response and reference context
+            Dictionary containing the response, reference context and per-stage timings in ms
         """
-        print(query)
-        
-        type_of_question = self.client.chat.completions.create(
-            model=Config.OPENAI_MODEL,
-            messages=[{"role": "user", "content": "Here is customer conversation:" + query}],
-            tools=self.DETERMINEFUNCTION,
-            tool_choice={"type": "function", "function": {"name": "determine_question_type"}}
-        )
-        print(json.loads(type_of_question.choices[0].message.tool_calls[0].function.arguments)['is_cheese_question'])
-        if json.loads(type_of_question.choices[0].message.tool_calls[0].function.arguments)['is_cheese_question'] == 1:
-            
-            system_message = """You are an expert data engineer. Given: 
-    - A user's NL query about cheese products, 
-    - The table of available Pinecone metadata filter fields and types below,
-    your task is to output only a valid Pinecone filter object (in JSON). Do not return any explanations, only output the JSON filter.
-
-    ONLY use these fields.
-    - cheese_type: string, e.g. "Parmesan", "Mozzarella", "Premio" This item refers types of cheese ingredients.
-    - cheese_form: string, e.g. "Sliced", "loaf", "Shredded", "Cream", "Crumbled", "Cubed", "Grated", "Shaved", "Cottage", "Weel", "Speciality" what form does the cheese come in?
-    - brand: string, e.g. "North Beach", "Galbani", "Schreiber" Refers the brand of the cheese.
-    - price_each: number (float) Refers the price of the cheese per unit.
-    - price_per_lb: number (float) Refers the price of the cheese per pound.
-    - lb_per_each: number (float) Refers the amount of pounds per unit.
-    - case: string ("No" or integer in string form, e.g. "6", "No") Refers if the cheese comes in a case or not.
-    - sku: string or integer Refers the sku number of the cheese. "No" if it doesn't have a sku.
-    - upc: string or integer Refers the universal product code of the cheese. "No" if it doesn't have a upc.
-
-    Rules:
-    1. For price, parse user intent and use appropriate operators: `$lt` (less than), `$lte`, `$gt`, `$gte`, `$eq`.
-    2. Multiple filters should be combined with `$and`.
-    3. If the user's query does not specify a field, leave it out and only filter what is specified.
-    4. Never use fields not in the schema above.
-    5. Output ONLY a valid Pinecone filter JSON object, nothing else.
-
-    Examples:
-    User: Show me cheddar cheeses under $10
-    Output: {"cheese_type": "Cheddar", "price_value": {"$lt": 10}}
-
-    User: I want blue cheese from brand Saint Agur, in wedges, at most £20 per pound
-    Output: {"$and": [{"cheese_type": "Blue Cheese"}, {"brand": "Saint Agur"}, {"cheese_form": "Wedge"}, {"price_per_lb": {"$lte": 20}}]}"""
-
-            message = []
-            message.append({"role" : "user", "content" : system_message + " Here is customer conversation:" + query})
-            response = self.client.chat.completions.create(
-                messages=message,
-                model=Config.OPENAI_MODEL,
-                temperature=0.1  # Lower temperature for more consistent JSON output
-            )
-            response_str = response.choices[0].message.content.strip()
-            print("Raw response:", response_str)
-
-            try:
-                # Clean the response string if needed
-                response_str = response_str.replace('\n', '').strip()
-                if not response_str.startswith('{'):
-                    response_str = '{' + response_str
-                if not response_str.endswith('}'):
-                    response_str = response_str + '}'
-
-                # Parse the response string as JSON
-                filter_dict = json.loads(response_str)
-                print("Parsed filter:", filter_dict)
-            except json.JSONDecodeError as e:
-                logger.error(f"Error parsing filter JSON: {str(e)}")
-                logger.error(f"Raw response was: {response_str}")
-                filter_dict = None
-
-            # Query for relevant products
-            products = self.query_products(query, filter_dict=filter_dict)
-
-            if not products:
-                print("No products found")
-                return {
-                    'response': "I couldn't find any relevant products to answer your question.",
-                    'context': []
-                }
-            # Generate response using the products as context
-            return self.generate_response(query, json.loads(type_of_question.choices[0].message.tool_calls[0].function.arguments)['is_cheese_question'], products)
-        else:
-            return self.generate_response(query, json.loads(type_of_question.choices[0].message.tool_calls[0].function.arguments)['is_cheese_question'], [])
+        if Config.CONCURRENT_STAGES:
+            return self._run_async(self.aget_relevant_products(query, filter_dict, question, generate))
+
+        with span('retrieval', mode='sequential') as retrieval_span:
+            timings: Dict[str, float] = {}
+            start = time.perf_counter()
+
+            analysis = self.analyze_query(question or query, timings)
+            if analysis is not None:
+                is_cheese_question = analysis.is_cheese_question
+            else:
+                with stage_timer(timings, 'classification'):
+                    type_of_question = self.flights.do('classification', normalize_query(query), self._classify, query)
+                is_cheese_question = json.loads(type_of_question.choices[0].message.tool_calls[0].function.arguments)['is_cheese_question']
+            logger.debug("is_cheese_question=%s for query: %s", is_cheese_question, query)
+            if is_cheese_question == 1:
+                if analysis is not None:
+                    filter_dict = analysis.filter_dict
+                else:
+                    with stage_timer(timings, 'filter_generation'):
+                        response = self.flights.do('filter_generation', normalize_query(query), self._generate_filter, query)
+                    response_str = response.choices[0].message.content.strip()
+                    logger.debug("Raw filter response: %s", response_str)
+                    filter_dict = parse_filter_response(response_str)
+
+                # Query for relevant products
+                with stage_timer(timings, 'embedding'):
+                    query_embedding = self.get_embedding(query)
+                products = self.retrieve(query, query_embedding, filter_dict, timings)
+
+                if not products:
+                    result = {
+                        'response': NO_PRODUCTS_RESPONSE,
+                        'context': []
+                    }
+                elif not generate:
+                    result = {'response': None, 'context': products}
+                else:
+                    # Generate response using the products as context
+                    with stage_timer(timings, 'generation'):
+                        result = self.generate_response(query, is_cheese_question, products)
+            else:
+                result = self.generate_response(query, is_cheese_question, [])
+
+            timings['total'] = round((time.perf_counter() - start) * 1000, 2)
+            logger.info("Stage latency (sequential, ms): %s", timings)
+            retrieval_span.set(is_cheese_question=is_cheese_question, products=len(result.get('context', [])))
+            result['timings'] = timings
+            return result
+
+    @property
+    def async_store(self) -> AsyncVectorStore:
+        """AsyncVectorStore sharing this store's index and analyzer, created on first use"""
+        with self._loop_lock:
+            if self._async_store is None:
+                self._async_store = AsyncVectorStore(index=self.index, query_analyzer=self.query_analyzer)
+        # Outside the lock: building the hybrid retriever takes it too
+        self._async_store.hybrid = self.hybrid_retriever
+        return self._async_store
+
+    async def aget_relevant_products(
+        self,
+        query: str,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        question: Optional[str] = None,
+        generate: bool = True
+    ) -> Dict[str, Any]:
+        """Concurrent variant of get_relevant_products, see AsyncVectorStore.aget_relevant_products"""
+        return await self.async_store.aget_relevant_products(query, filter_dict, question, generate)
 
+    def health_check(self) -> bool:
+        """
+        Cheap liveness probe used by the shared resource registry.
 
-vector_store = VectorStore()
+        An index that answers is healthy even when it is empty (say between a
+        reset and re-ingestion); only a connection or API error, raised from
+        here, gets the store rebuilt.
+        """
+        if isinstance(self.index, LocalVectorIndex):
+            return True
+        self.index.describe_index_stats()
+        return True
+
+    def close(self):
+        """Release the HTTP pools and the background event loop"""
+        if self._loop is not None:
+            if self._async_store is not None:
+                self._run_async(self._async_store.aclose())
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+        self.client.close()
+
+    def _run_async(self, coro):
+        """Run a coroutine on this store's background event loop and wait for the result"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="vector-store-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(with_current_context(coro), self._loop).result()
+
+
+# Use the process-wide instance from chatbot.resources rather than building a store per caller
+# from chatbot.resources import get_vector_store
+# vector_store = get_vector_store()
 
 # Simple query
 # result = vector_store.get_relevant_products("What are some good Mozzarella cheeses?")
@@ -331,4 +637,4 @@ vector_store = VectorStore()
 
 # Access results
 # print(result['response'])  # The generated answer
-# print(result['context'])   # The products used as context 
\ No newline at end of file
+# print(result['context'])   # The products used as context
@@ -0,0 +1,138 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Sequence
+
+from utils.config import Config
+from utils.jsonl import read_records
+from utils.tracing import count, in_current_context, span
+from chatbot.retriver.bm25_index import BM25Index
+
+logger = logging.getLogger(__name__)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = Config.HYBRID_RRF_K) -> Dict[str, float]:
+    """RRF score per id: the sum over rankings of 1 / (k + rank), ranks starting at 1"""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def load_bm25_index(path: str = Config.BM25_INDEX_PATH, catalog_path: str = Config.CATALOG_PATH) -> BM25Index:
+    """Load the lexical index written at ingest time, building it from the processed catalog if it is missing"""
+    if Path(path).exists():
+        index = BM25Index.load(path)
+        logger.info(f"Loaded BM25 index from {path}: {index.stats()}")
+        return index
+    index = BM25Index.from_catalog(list(read_records(catalog_path)))
+    index.save(path)
+    return index
+
+
+class HybridRetriever:
+    """
+    Vector search and BM25 run side by side and merged by reciprocal rank fusion.
+
+    The vector leg runs on a worker thread (it waits on Pinecone or the local
+    index) while BM25 scores in the calling thread. Each returned product keeps
+    its cosine 'score' from the vector leg (None when only BM25 found it) and
+    gains 'rrf_score' and 'bm25_score'; products only BM25 found are filled in
+    from the columnar catalog. Per-leg latency and the overlap between the two
+    legs are reported with every search.
+    """
+
+    def __init__(self, vector_store, bm25: BM25Index, catalog=None, rrf_k: int = Config.HYBRID_RRF_K):
+        self.vector_store = vector_store
+        self.bm25 = bm25
+        self.catalog = catalog
+        self.rrf_k = rrf_k
+        self._executor = ThreadPoolExecutor(max_workers=Config.ASYNC_MAX_CONCURRENCY, thread_name_prefix="hybrid-vector")
+
+    def search(
+        self,
+        query: str,
+        query_embedding: List[float],
+        top_k: int = Config.TOP_K_RESULTS,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        include_values: bool = False
+    ) -> Dict[str, Any]:
+        """Returns {'products': [...], 'metrics': {...}}; include_values keeps vector-leg embeddings as 'values'"""
+        start = time.perf_counter()
+        vector_future = None
+        if query_embedding:
+            vector_future = self._executor.submit(
+                in_current_context(self._timed_vector_query), query_embedding, top_k, filter_dict, include_values
+            )
+
+        lexical, bm25_ms = self.lexical_leg(query, top_k, filter_dict)
+
+        vector_products, vector_ms = vector_future.result() if vector_future else ([], 0.0)
+        return self.fuse(vector_products, lexical, top_k, vector_ms, bm25_ms, start)
+
+    def lexical_leg(self, query: str, top_k: int, filter_dict: Optional[Dict[str, Any]]):
+        """BM25 hits as (id, score) pairs, restricted to the filter when a catalog is available, and the leg latency"""
+        start = time.perf_counter()
+        if filter_dict and self.catalog is None:
+            # Without the catalog the filter cannot be checked; vector results alone respect it
+            return [], 0.0
+        with span('bm25.search', top_k=top_k, filtered=bool(filter_dict)) as search_span:
+            allowed = self.catalog.ids[self.catalog.mask(filter_dict)].tolist() if filter_dict else None
+            hits = self.bm25.search(query, top_k=top_k, allowed_ids=allowed)
+            search_span.set(matches=len(hits))
+        count('retrieved_products_total', len(hits), source='bm25')
+        return hits, round((time.perf_counter() - start) * 1000, 2)
+
+    def fuse(
+        self,
+        vector_products: List[Dict[str, Any]],
+        lexical: List[tuple],
+        top_k: int,
+        vector_ms: float,
+        bm25_ms: float,
+        start: float
+    ) -> Dict[str, Any]:
+        fusion_start = time.perf_counter()
+        vector_ids = [p['id'] for p in vector_products]
+        lexical_ids = [doc_id for doc_id, _ in lexical]
+        fused = reciprocal_rank_fusion([vector_ids, lexical_ids], self.rrf_k)
+        ranked = sorted(fused, key=fused.get, reverse=True)[:top_k]
+
+        by_id = {p['id']: p for p in vector_products}
+        bm25_scores = dict(lexical)
+        missing = [doc_id for doc_id in ranked if doc_id not in by_id]
+        if missing and self.catalog is not None:
+            for row in self.catalog.rows_by_id(missing):
+                by_id[row['id']] = {**row, 'score': None}
+
+        products = []
+        for doc_id in ranked:
+            product = by_id.get(doc_id)
+            if product is None:
+                continue
+            products.append({**product, 'rrf_score': fused[doc_id], 'bm25_score': bm25_scores.get(doc_id)})
+
+        overlap = len(set(vector_ids) & set(lexical_ids))
+        union = len(set(vector_ids) | set(lexical_ids))
+        metrics = {
+            'vector_ms': vector_ms,
+            'bm25_ms': bm25_ms,
+            'fusion_ms': round((time.perf_counter() - fusion_start) * 1000, 2),
+            'total_ms': round((time.perf_counter() - start) * 1000, 2),
+            'vector_hits': len(vector_ids),
+            'bm25_hits': len(lexical_ids),
+            'overlap': overlap,
+            'overlap_jaccard': round(overlap / union, 3) if union else 0.0,
+            'bm25_only': sum(1 for p in products if p['score'] is None)
+        }
+        logger.info("Hybrid search metrics: %s", metrics)
+        return {'products': products, 'metrics': metrics}
+
+    def _timed_vector_query(self, query_embedding, top_k, filter_dict, include_values):
+        start = time.perf_counter()
+        products = self.vector_store.query_by_vector(
+            query_embedding, top_k=top_k, filter_dict=filter_dict, include_values=include_values
+        )
+        return products, round((time.perf_counter() - start) * 1000, 2)
@@ -0,0 +1,400 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable, Callable, Sequence, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_NUMERIC_OPS = {
+    "$lt": np.less,
+    "$lte": np.less_equal,
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+}
+# Upper bound on the (queries x vectors) score matrix held at once by query_batch
+_BATCH_SCORE_CELLS = 1 << 25
+
+
+@dataclass
+class Match:
+    """A single query match, shaped like a Pinecone ScoredVector"""
+    id: str
+    score: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    values: List[float] = field(default_factory=list)
+
+
+@dataclass
+class QueryResponse:
+    """Query result, shaped like a Pinecone QueryResponse"""
+    matches: List[Match]
+
+
+@dataclass
+class IndexStats:
+    """Index statistics, shaped like Pinecone's describe_index_stats() result"""
+    dimension: int
+    total_vector_count: int
+
+
+class LocalVectorIndex:
+    """
+    In-process exact cosine index used as a drop-in for a Pinecone Index.
+
+    Vectors live in one contiguous float32 matrix whose rows are normalized on
+    insert, so a query is a single matrix-vector product followed by
+    argpartition. Metadata filters use the Pinecone filter dialect and are
+    evaluated column-wise into a boolean mask.
+    """
+
+    def __init__(self, dimension: int, capacity: int = 1024):
+        self.dimension = dimension
+        self._matrix = np.zeros((max(capacity, 1), dimension), dtype=np.float32)
+        self._size = 0
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._metadata: List[Dict[str, Any]] = []
+        self._columns: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_arrays(
+        cls,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        metadata: Optional[Sequence[Dict[str, Any]]] = None
+    ) -> "LocalVectorIndex":
+        """Build an index in bulk from an (n, dim) array of vectors"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        index = cls(vectors.shape[1], capacity=len(ids))
+        index._matrix[:len(ids)] = _normalize_rows(vectors)
+        index._size = len(ids)
+        index._ids = [str(i) for i in ids]
+        index._positions = {vid: pos for pos, vid in enumerate(index._ids)}
+        index._metadata = [dict(m) for m in metadata] if metadata is not None else [{} for _ in ids]
+        return index
+
+    @classmethod
+    def from_catalog(
+        cls,
+        products: List[Dict[str, Any]],
+        embed_many: Callable[[List[str]], List[List[float]]],
+        dimension: int
+    ) -> "LocalVectorIndex":
+        """
+        Build an index from processed catalog items, using the same metadata layout as ingestion.
+
+        Items whose embedding came back empty are left out and logged; callers
+        compare len(index) with len(products) before persisting it.
+        """
+        texts = [catalog_text(item) for item in products]
+        embeddings = embed_many(texts) if texts else []
+        index = cls(dimension, capacity=len(products))
+        index.upsert(vectors=[
+            (item['id'], embedding, catalog_metadata(item))
+            for item, embedding in zip(products, embeddings)
+            if embedding
+        ])
+        if len(index) < len(products):
+            logger.warning(f"Skipped {len(products) - len(index)} of {len(products)} catalog items without an embedding")
+        return index
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Normalized vectors of the live rows"""
+        return self._matrix[:self._size]
+
+    def upsert(self, vectors: Iterable[Union[Tuple, Dict[str, Any]]]):
+        """Insert or replace vectors given as (id, values, metadata) tuples or Pinecone-style dicts"""
+        for vector in vectors:
+            if isinstance(vector, dict):
+                vid, values, metadata = vector['id'], vector['values'], vector.get('metadata', {})
+            else:
+                vid, values = vector[0], vector[1]
+                metadata = vector[2] if len(vector) > 2 else {}
+
+            row = _normalize_rows(np.asarray(values, dtype=np.float32).reshape(1, -1))[0]
+            if row.shape[0] != self.dimension:
+                raise ValueError(f"Vector dimension {row.shape[0]} does not match index dimension {self.dimension}")
+
+            pos = self._positions.get(vid)
+            if pos is None:
+                self._grow(self._size + 1)
+                pos = self._size
+                self._size += 1
+                self._ids.append(vid)
+                self._metadata.append(dict(metadata or {}))
+                self._positions[vid] = pos
+            else:
+                self._metadata[pos] = dict(metadata or {})
+            self._matrix[pos] = row
+        self._columns.clear()
+
+    def update(self, id: str, set_metadata: Dict[str, Any]):
+        """Merge metadata fields into an existing vector, like Pinecone's Index.update"""
+        pos = self._positions.get(id)
+        if pos is None:
+            raise KeyError(id)
+        self._metadata[pos].update(set_metadata)
+        self._columns.clear()
+
+    def delete(self, ids: Iterable[str]):
+        """Remove vectors by ID; the last row is moved into the freed slot"""
+        for vid in ids:
+            pos = self._positions.pop(vid, None)
+            if pos is None:
+                continue
+            last = self._size - 1
+            if pos != last:
+                self._matrix[pos] = self._matrix[last]
+                self._ids[pos] = self._ids[last]
+                self._metadata[pos] = self._metadata[last]
+                self._positions[self._ids[pos]] = pos
+            self._ids.pop()
+            self._metadata.pop()
+            self._size -= 1
+        self._columns.clear()
+
+    def fetch(self, ids: Iterable[str]) -> Dict[str, Match]:
+        """Return stored vectors and metadata by ID"""
+        found = {}
+        for vid in ids:
+            pos = self._positions.get(vid)
+            if pos is not None:
+                found[vid] = Match(vid, 1.0, self._metadata[pos], self._matrix[pos].tolist())
+        return found
+
+    def vectors(self, ids: Sequence[str]) -> np.ndarray:
+        """Normalized vectors for ids as one (len(ids), dim) array, zero rows for unknown ids"""
+        positions = np.array([self._positions.get(vid, -1) for vid in ids], dtype=np.int64)
+        rows = self._matrix[np.maximum(positions, 0)]
+        rows[positions < 0] = 0
+        return rows
+
+    def describe_index_stats(self) -> IndexStats:
+        return IndexStats(dimension=self.dimension, total_vector_count=self._size)
+
+    def query(
+        self,
+        vector: Sequence[float],
+        top_k: int = 10,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> QueryResponse:
+        """Exact cosine top-k search with optional Pinecone-style metadata filter"""
+        if self._size == 0 or top_k <= 0:
+            return QueryResponse(matches=[])
+
+        query_vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query_vec)
+        if norm > 0:
+            query_vec = query_vec / norm
+
+        scores = self.matrix @ query_vec
+        if filter:
+            mask = self._mask(filter)
+            candidates = int(mask.sum())
+            if candidates == 0:
+                return QueryResponse(matches=[])
+            scores = np.where(mask, scores, -np.inf)
+        else:
+            candidates = self._size
+
+        k = min(top_k, candidates)
+        if k < self._size:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(self._size)
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        matches = [
+            Match(
+                id=self._ids[pos],
+                score=float(scores[pos]),
+                metadata=dict(self._metadata[pos]) if include_metadata else {},
+                values=self._matrix[pos].tolist() if include_values else []
+            )
+            for pos in top
+        ]
+        return QueryResponse(matches=matches)
+
+    def query_batch(
+        self,
+        vectors: Sequence[Sequence[float]],
+        top_k: int = 10,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[QueryResponse]:
+        """
+        Exact cosine top-k for several query vectors sharing one filter.
+
+        Queries are scored with one matrix-matrix product per block, the block
+        height chosen so the score matrix stays around _BATCH_SCORE_CELLS
+        floats however large the index is.
+        """
+        queries = _normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        if self._size == 0 or top_k <= 0 or len(queries) == 0:
+            return [QueryResponse(matches=[]) for _ in range(len(queries))]
+
+        mask = self._mask(filter) if filter else None
+        candidates = int(mask.sum()) if mask is not None else self._size
+        if candidates == 0:
+            return [QueryResponse(matches=[]) for _ in range(len(queries))]
+        k = min(top_k, candidates)
+
+        responses = []
+        block = max(1, _BATCH_SCORE_CELLS // self._size)
+        for start in range(0, len(queries), block):
+            scores = queries[start:start + block] @ self.matrix.T
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+            if k < self._size:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(self._size), scores.shape)
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for row_positions, row_scores in zip(top, top_scores):
+                responses.append(QueryResponse(matches=[
+                    Match(
+                        id=self._ids[pos],
+                        score=float(score),
+                        metadata=dict(self._metadata[pos]) if include_metadata else {},
+                        values=self._matrix[pos].tolist() if include_values else []
+                    )
+                    for pos, score in zip(row_positions, row_scores)
+                ]))
+        return responses
+
+    def save(self, path: Union[str, Path]):
+        """Persist the index as a compressed .npz file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                matrix=self.matrix,
+                ids=np.array(self._ids, dtype=object),
+                metadata=np.array(json.dumps(self._metadata, ensure_ascii=False))
+            )
+        logger.info(f"Saved local index with {self._size} vectors to {path}")
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "LocalVectorIndex":
+        """Load an index written by save()"""
+        with np.load(path, allow_pickle=True) as data:
+            ids = data['ids'].tolist()
+            metadata = json.loads(str(data['metadata']))
+            # Rows are stored already normalized
+            index = cls(data['matrix'].shape[1], capacity=len(ids))
+            index._matrix[:len(ids)] = data['matrix']
+        index._size = len(ids)
+        index._ids = ids
+        index._positions = {vid: pos for pos, vid in enumerate(ids)}
+        index._metadata = metadata
+        return index
+
+    def _grow(self, needed: int):
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((capacity, self.dimension), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+
+    def _column(self, name: str) -> np.ndarray:
+        """Object array of one metadata field across all rows, cached until the next write"""
+        column = self._columns.get(name)
+        if column is None:
+            column = np.empty(self._size, dtype=object)
+            column[:] = [m.get(name) for m in self._metadata]
+            self._columns[name] = column
+        return column
+
+    def _numeric_column(self, name: str) -> np.ndarray:
+        key = name + "#num"
+        column = self._columns.get(key)
+        if column is None:
+            column = np.fromiter(
+                (_to_float(v) for v in self._column(name)),
+                dtype=np.float64,
+                count=self._size
+            )
+            self._columns[key] = column
+        return column
+
+    def _mask(self, filter_dict: Dict[str, Any]) -> np.ndarray:
+        """Evaluate a Pinecone metadata filter into a boolean row mask"""
+        mask = np.ones(self._size, dtype=bool)
+        for key, condition in filter_dict.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(self._size, dtype=bool)
+                for clause in condition:
+                    any_mask |= self._mask(clause)
+                mask &= any_mask
+            elif isinstance(condition, dict):
+                for op, operand in condition.items():
+                    mask &= self._field_mask(key, op, operand)
+            else:
+                mask &= self._field_mask(key, "$eq", condition)
+        return mask
+
+    def _field_mask(self, name: str, op: str, operand: Any) -> np.ndarray:
+        if op in _NUMERIC_OPS:
+            with np.errstate(invalid="ignore"):
+                return _NUMERIC_OPS[op](self._numeric_column(name), float(operand))
+        if op in ("$eq", "$ne"):
+            if isinstance(operand, (int, float)) and not isinstance(operand, bool):
+                matched = self._numeric_column(name) == float(operand)
+            else:
+                matched = self._column(name) == operand
+            return matched if op == "$eq" else ~matched
+        if op in ("$in", "$nin"):
+            allowed = set(operand)
+            matched = np.fromiter((v in allowed for v in self._column(name)), dtype=bool, count=self._size)
+            return matched if op == "$in" else ~matched
+        raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def catalog_text(item: Dict[str, Any]) -> str:
+    """Text embedded for each product"""
+    return f"{item['description']}"
+
+
+def catalog_metadata(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadata stored alongside each product vector"""
+    return {
+        **item['metadata'],
+        'image_url': item['image_url'],
+        'description': item['description'],
+        'processed_at': item['processed_at']
+    }
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _to_float(value: Any) -> float:
+    if isinstance(value, bool) or value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
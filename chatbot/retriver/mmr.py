@@ -0,0 +1,229 @@
+import logging
+import time
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+from utils.config import Config
+from chatbot.retriver.context_builder import ContextBuilder
+from chatbot.retriver.local_index import LocalVectorIndex
+from chatbot.retriver.prompts import stage_timer
+
+logger = logging.getLogger(__name__)
+
+
+def mmr_select(
+    query_vector: Sequence[float],
+    candidate_vectors: np.ndarray,
+    top_n: int,
+    lambda_mult: float = Config.MMR_LAMBDA
+) -> np.ndarray:
+    """
+    Indices of top_n candidates chosen by maximal marginal relevance, in pick order.
+
+    Each step takes the candidate maximizing
+    lambda * sim(query, c) - (1 - lambda) * max sim(c, already picked).
+    All pairwise similarities come from one matrix product up front, and the
+    running "closest picked neighbour" vector is updated with np.maximum, so
+    each of the top_n steps is a single vectorized argmax.
+    """
+    vectors = _normalize_rows(np.asarray(candidate_vectors, dtype=np.float32))
+    n = vectors.shape[0]
+    top_n = min(top_n, n)
+    if top_n <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    query = np.asarray(query_vector, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    relevance = lambda_mult * (vectors @ (query / norm if norm > 0 else query))
+    penalty = (1 - lambda_mult) * (vectors @ vectors.T)
+
+    selected = np.empty(top_n, dtype=np.int64)
+    selected[0] = np.argmax(relevance)
+    redundancy = penalty[selected[0]].copy()
+    for step in range(1, top_n):
+        scores = relevance - redundancy
+        scores[selected[:step]] = -np.inf
+        selected[step] = np.argmax(scores)
+        np.maximum(redundancy, penalty[selected[step]], out=redundancy)
+    return selected
+
+
+class MMRReranker:
+    """
+    Diversifies vector-search matches before they are packed into the prompt.
+
+    Candidate vectors come either as an array aligned with the products (read
+    straight from the local index) or from each product's 'values' (Pinecone
+    queried with include_values); the reranker keeps top_n of them by maximal
+    marginal relevance, so several pack sizes of the same cheese give way to
+    other relevant products. Products without a vector (BM25-only hybrid
+    hits) fill any remaining slots after the diversified ones. The 'values'
+    key is always stripped from the result.
+    """
+
+    def __init__(self, top_n: int = Config.MMR_TOP_N, lambda_mult: float = Config.MMR_LAMBDA):
+        self.top_n = top_n
+        self.lambda_mult = lambda_mult
+
+    def rerank(
+        self,
+        query_embedding: Sequence[float],
+        products: List[Dict[str, Any]],
+        vectors: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        if vectors is None:
+            vectors = stack_values(products)
+        has_vector = np.flatnonzero(np.any(vectors != 0, axis=1)) if len(vectors) else np.zeros(0, np.int64)
+        if not len(query_embedding) or len(has_vector) <= 1:
+            return [_strip(p) for p in products[:self.top_n]]
+
+        order = has_vector[mmr_select(query_embedding, vectors[has_vector], self.top_n, self.lambda_mult)]
+        chosen = [products[i] for i in order]
+        # Vector-less products fill any remaining slots in their original order
+        picked = set(has_vector.tolist())
+        chosen += [p for i, p in enumerate(products) if i not in picked][:self.top_n - len(chosen)]
+        return [_strip(p) for p in chosen]
+
+    def evaluate(
+        self,
+        query_embedding: Sequence[float],
+        products: List[Dict[str, Any]],
+        vectors: Optional[np.ndarray] = None,
+        builder: Optional[ContextBuilder] = None
+    ) -> Dict[str, Any]:
+        """
+        Compare the MMR selection with the plain top-k list it was drawn from.
+
+        Reports rerank latency, the prompt tokens of both lists in the packed
+        table layout (formatting only, no cutoff or budget unless a builder is
+        passed) and in the verbose per-product layout, and two coverage
+        measures: distinct (brand, form) pairs and mean pairwise cosine
+        similarity of the products' vectors.
+        """
+        if vectors is None:
+            vectors = stack_values(products)
+        start = time.perf_counter()
+        reranked = self.rerank(query_embedding, products, vectors)
+        rerank_ms = (time.perf_counter() - start) * 1000
+
+        if builder is None:
+            builder = ContextBuilder(min_score=float('-inf'), knee_sensitivity=2.0, dedupe_similarity=2.0, max_tokens=10 ** 9)
+        plain = [_strip(p) for p in products]
+        plain_packed, mmr_packed = builder.build(plain), builder.build(reranked)
+        rows = {p['id']: i for i, p in enumerate(products)}
+        return {
+            'rerank_ms': round(rerank_ms, 3),
+            'candidates': len(products),
+            'selected': len(reranked),
+            'plain_tokens': plain_packed.tokens,
+            'mmr_tokens': mmr_packed.tokens,
+            'token_reduction': _reduction(plain_packed.tokens, mmr_packed.tokens),
+            'plain_verbose_tokens': plain_packed.baseline_tokens,
+            'mmr_verbose_tokens': mmr_packed.baseline_tokens,
+            'verbose_token_reduction': _reduction(plain_packed.baseline_tokens, mmr_packed.baseline_tokens),
+            'plain_coverage': _coverage(plain, vectors),
+            'mmr_coverage': _coverage(reranked, vectors[[rows[p['id']] for p in reranked]])
+        }
+
+
+def wants_values(index: Any) -> bool:
+    """Whether vector queries should return embeddings for MMR (the local index serves them directly)"""
+    return Config.MMR_ENABLED and not isinstance(index, LocalVectorIndex)
+
+
+def stack_values(products: List[Dict[str, Any]]) -> np.ndarray:
+    """Products' 'values' as one float32 array, zero rows where a product has none"""
+    dimension = next((len(p['values']) for p in products if p.get('values') is not None), 0)
+    vectors = np.zeros((len(products), dimension), dtype=np.float32)
+    for i, product in enumerate(products):
+        if product.get('values') is not None:
+            vectors[i] = product['values']
+    return vectors
+
+
+def attach_vectors(index: Any, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fill in 'values' for products that lack them by fetching from a synchronous Pinecone index"""
+    missing = missing_vector_ids(products)
+    if not missing:
+        return products
+    try:
+        fetched = index.fetch(ids=missing)
+    except Exception as e:
+        logger.warning(f"Could not fetch vectors for MMR: {str(e)}")
+        return products
+    return merge_vectors(products, fetched)
+
+
+def missing_vector_ids(products: List[Dict[str, Any]]) -> List[str]:
+    return [p['id'] for p in products if p.get('values') is None]
+
+
+def merge_vectors(products: List[Dict[str, Any]], fetched: Any) -> List[Dict[str, Any]]:
+    """Copy vectors from a Pinecone fetch response onto the products that lack them"""
+    vectors = getattr(fetched, 'vectors', fetched)
+    return [
+        p if p.get('values') is not None or p['id'] not in vectors else {**p, 'values': vectors[p['id']].values}
+        for p in products
+    ]
+
+
+_default_reranker: Optional[MMRReranker] = None
+
+
+def diversify(
+    query_embedding: Sequence[float],
+    products: List[Dict[str, Any]],
+    timings: Dict[str, float],
+    index: Any = None
+) -> List[Dict[str, Any]]:
+    """
+    MMR selection with the Config-driven reranker, timed as the 'mmr' stage.
+
+    With a LocalVectorIndex the candidate vectors are read from its matrix;
+    with any other index, vectors missing from the products are fetched from
+    it first. With Config.MMR_EVAL the comparison against the plain list is logged.
+    """
+    global _default_reranker
+    if _default_reranker is None:
+        _default_reranker = MMRReranker()
+    vectors = None
+    with stage_timer(timings, 'mmr'):
+        if isinstance(index, LocalVectorIndex):
+            vectors = index.vectors([p['id'] for p in products])
+        elif index is not None:
+            products = attach_vectors(index, products)
+        if vectors is None:
+            vectors = stack_values(products)
+        reranked = _default_reranker.rerank(query_embedding, products, vectors)
+    if Config.MMR_EVAL:
+        logger.info(f"MMR evaluation: {_default_reranker.evaluate(query_embedding, products, vectors)}")
+    return reranked
+
+
+def _strip(product: Dict[str, Any]) -> Dict[str, Any]:
+    if 'values' not in product:
+        return product
+    return {key: value for key, value in product.items() if key != 'values'}
+
+
+def _reduction(before: int, after: int) -> float:
+    return round(1 - after / before, 3) if before else 0.0
+
+
+def _coverage(products: List[Dict[str, Any]], vectors: np.ndarray) -> Dict[str, Any]:
+    pairs = {(p.get('brand', ''), p.get('cheese_form', '')) for p in products}
+    rows = vectors[np.any(vectors != 0, axis=1)] if len(vectors) else vectors
+    mean_similarity = None
+    if len(rows) > 1:
+        matrix = _normalize_rows(rows)
+        similarity = matrix @ matrix.T
+        n = len(rows)
+        mean_similarity = round(float((similarity.sum() - np.trace(similarity)) / (n * (n - 1))), 4)
+    return {'brand_form_pairs': len(pairs), 'mean_pairwise_similarity': mean_similarity}
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
@@ -0,0 +1,128 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+
+from utils.config import Config
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+NOT_CHEESE_RESPONSE = "this is not a question about cheese, general question"
+NO_PRODUCTS_RESPONSE = "I couldn't find any relevant products to answer your question."
+ERROR_RESPONSE = "I apologize, but I encountered an error while processing your request."
+
+# Tool definition for determining question type
+DETERMINE_FUNCTION = [{
+    "type": "function",
+    "function": {
+        "name": "determine_question_type",
+        "description": "The metadata we use include: cheese_type, brand, cheese_form, price_each, price_per_lb, lb_per_each, case, sku, upc, image_url, source_url. If the answer can be answered accurately through a pinecone vector database search that includes metadata filtering related to these values, then 1 must be output. But if the user's question now is one that is difficult to answer accurately with a chatbot using the Pinecone vector database. For example, it may be a greeting that is not related to the exact information about cheese, or it may be a question that is difficult to answer accurately with a semantic search using the vector database, in this case the output has to be 0, e.g. finding most expensive cheese, or the heaviest product. and also, it may be a question about a different field that cannot be considered a question from a user using this chatbot to know about cheese. In this case function output has to be 0, Otherwise output has to be 1 that is answerable.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "is_cheese_question": {"type": "integer"}
+            },
+            "required": ["is_cheese_question"]
+        }
+    },
+    "strict": True
+}]
+
+
+FILTER_SYSTEM_MESSAGE = """You are an expert data engineer. Given: 
+    - A user's NL query about cheese products, 
+    - The table of available Pinecone metadata filter fields and types below,
+    your task is to output only a valid Pinecone filter object (in JSON). Do not return any explanations, only output the JSON filter.
+
+    ONLY use these fields.
+    - cheese_type: string, e.g. "Parmesan", "Mozzarella", "Premio" This item refers types of cheese ingredients.
+    - cheese_form: string, e.g. "Sliced", "loaf", "Shredded", "Cream", "Crumbled", "Cubed", "Grated", "Shaved", "Cottage", "Weel", "Speciality" what form does the cheese come in?
+    - brand: string, e.g. "North Beach", "Galbani", "Schreiber" Refers the brand of the cheese.
+    - price_each: number (float) Refers the price of the cheese per unit.
+    - price_per_lb: number (float) Refers the price of the cheese per pound.
+    - lb_per_each: number (float) Refers the amount of pounds per unit.
+    - case: string ("No" or integer in string form, e.g. "6", "No") Refers if the cheese comes in a case or not.
+    - sku: string or integer Refers the sku number of the cheese. "No" if it doesn't have a sku.
+    - upc: string or integer Refers the universal product code of the cheese. "No" if it doesn't have a upc.
+
+    Rules:
+    1. For price, parse user intent and use appropriate operators: `$lt` (less than), `$lte`, `$gt`, `$gte`, `$eq`.
+    2. Multiple filters should be combined with `$and`.
+    3. If the user's query does not specify a field, leave it out and only filter what is specified.
+    4. Never use fields not in the schema above.
+    5. Output ONLY a valid Pinecone filter JSON object, nothing else.
+
+    Examples:
+    User: Show me cheddar cheeses under $10
+    Output: {"cheese_type": "Cheddar", "price_value": {"$lt": 10}}
+
+    User: I want blue cheese from brand Saint Agur, in wedges, at most £20 per pound
+    Output: {"$and": [{"cheese_type": "Blue Cheese"}, {"brand": "Saint Agur"}, {"cheese_form": "Wedge"}, {"price_per_lb": {"$lte": 20}}]}"""
+
+
+def parse_filter_response(response_str: str) -> Optional[Dict[str, Any]]:
+    """Parse the filter-generation completion into a filter dict, or None if it is not valid JSON"""
+    try:
+        # Clean the response string if needed
+        response_str = response_str.replace('\n', '').strip()
+        if not response_str.startswith('{'):
+            response_str = '{' + response_str
+        if not response_str.endswith('}'):
+            response_str = response_str + '}'
+
+        # Parse the response string as JSON
+        filter_dict = json.loads(response_str)
+        logger.debug("Parsed filter: %s", filter_dict)
+        return filter_dict
+    except json.JSONDecodeError as e:
+        logger.error(f"Error parsing filter JSON: {str(e)}")
+        logger.error(f"Raw response was: {response_str}")
+        return None
+
+
+@contextmanager
+def stage_timer(timings: Dict[str, float], stage: str):
+    """Record the wall time of a pipeline stage in milliseconds, traced as a span of the same name"""
+    start = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def build_response_messages(query: str, context: str) -> List[Dict[str, str]]:
+    """Build the RAG chat messages used by generate_response from packed product context"""
+    # Create RAG prompt
+    prompt = (
+        "You are a cheese expert assistant. Use the following product information to answer the user's question.\n"
+        "If the information is not in the context, say so. Always cite the specific products you reference.\n\n"
+        f"Context:\n{context}\n\n"
+        f"User Question: {query}\n\n"
+        "Please provide a detailed answer based on the product information above:"
+    )
+    return [
+        {"role": "system", "content": "You are a helpful cheese expert assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def classification_request(query: str) -> Dict[str, Any]:
+    """Chat completion arguments for the is_cheese_question tool call"""
+    return {
+        "model": Config.OPENAI_MODEL,
+        "messages": [{"role": "user", "content": "Here is customer conversation:" + query}],
+        "tools": DETERMINE_FUNCTION,
+        "tool_choice": {"type": "function", "function": {"name": "determine_question_type"}}
+    }
+
+
+def filter_request(query: str) -> Dict[str, Any]:
+    """Chat completion arguments for the metadata filter generation call"""
+    return {
+        "messages": [{"role": "user", "content": FILTER_SYSTEM_MESSAGE + " Here is customer conversation:" + query}],
+        "model": Config.OPENAI_MODEL,
+        "temperature": 0.1  # Lower temperature for more consistent JSON output
+    }
@@ -0,0 +1,241 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+
+from utils.config import Config
+from utils.jsonl import read_records
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_PRICE_AMOUNT = rf"(?:\$\s*{_NUMBER}|{_NUMBER}\s*(?:dollars?|bucks|usd)\b)"
+_WEIGHT_AMOUNT = rf"(?<![\$\d.]){_NUMBER}\s*(?:lbs?|pounds?)\b"
+_PER_LB = r"\s*(?:per|a|/)\s*(?:lb|pound)\b"
+
+_COMPARATORS = {
+    "under": "$lt", "below": "$lt", "less than": "$lt", "cheaper than": "$lt", "lighter than": "$lt",
+    "at most": "$lte", "up to": "$lte", "no more than": "$lte", "max": "$lte", "maximum": "$lte", "within": "$lte",
+    "over": "$gt", "above": "$gt", "more than": "$gt", "greater than": "$gt", "heavier than": "$gt",
+    "at least": "$gte", "no less than": "$gte", "min": "$gte", "minimum": "$gte",
+    "exactly": "$eq",
+}
+_COMPARATOR = "(" + "|".join(sorted((re.escape(c) for c in _COMPARATORS), key=len, reverse=True)) + r")\s+(?:of\s+)?"
+_TRAILING = {"or less": "$lte", "or under": "$lte", "or cheaper": "$lte", "or more": "$gte", "or over": "$gte", "or above": "$gte"}
+_TRAILING_COMPARATOR = r"\s+(" + "|".join(re.escape(c) for c in _TRAILING) + r")\b"
+
+_PRICE_RE = re.compile(rf"\b{_COMPARATOR}{_PRICE_AMOUNT}({_PER_LB})?", re.IGNORECASE)
+_PRICE_TRAILING_RE = re.compile(rf"{_PRICE_AMOUNT}({_PER_LB})?{_TRAILING_COMPARATOR}", re.IGNORECASE)
+_PRICE_BETWEEN_RE = re.compile(rf"\bbetween\s+{_PRICE_AMOUNT}\s+(?:and|to|-)\s+{_PRICE_AMOUNT}({_PER_LB})?", re.IGNORECASE)
+_WEIGHT_RE = re.compile(rf"\b{_COMPARATOR}{_WEIGHT_AMOUNT}", re.IGNORECASE)
+_WEIGHT_TRAILING_RE = re.compile(rf"{_WEIGHT_AMOUNT}{_TRAILING_COMPARATOR}", re.IGNORECASE)
+
+_SUPERLATIVE_RE = re.compile(
+    r"\b(most expensive|least expensive|most affordable|cheapest|priciest|costliest|heaviest|lightest|largest|"
+    r"biggest|smallest|highest|lowest|best value|softest|hardest)\b",
+    re.IGNORECASE
+)
+_GREETING_RE = re.compile(
+    r"^\W*(hi|hello|hey|good (?:morning|afternoon|evening)|thanks|thank you|bye|goodbye|ok|okay)\b[\w\s,!.?']{0,20}$",
+    re.IGNORECASE
+)
+_CHEESE_RE = re.compile(r"\bchees(?:e|es|y)\b", re.IGNORECASE)
+_FORM_SUFFIXES = r"(?:e|es|s|d|ed|ded|ding|ing)?"
+_GENERIC_WORDS = {"cheese", "cheeses", "and"}
+# Catalog terms made only of these words also read as everyday language ("mild and sunny", "american
+# politics"), so on their own they keep the question below the confidence threshold
+_DESCRIPTOR_WORDS = {
+    "mild", "medium", "sharp", "american", "fresh", "white", "yellow", "red", "classic", "hard", "french",
+    "greek", "bulgarian", "cream", "block", "mini", "bulk", "president", "packer", "blend", "fancy", "frozen",
+    "import", "imported", "processed", "portions", "tradition", "chefs", "specialty", "grade", "a", "label",
+    "thin", "slice",
+}
+
+
+@dataclass
+class QueryAnalysis:
+    """Result of the deterministic analyzer, in the same shape the LLM stages produce"""
+    is_cheese_question: int
+    filter_dict: Optional[Dict[str, Any]]
+    confidence: float
+    matched_terms: List[str] = field(default_factory=list)
+
+
+class QueryAnalyzer:
+    """
+    Catalog-driven classifier and filter extractor.
+
+    The distinct brand, cheese_type and cheese_form values of the processed
+    catalog are compiled into one case-insensitive alternation (longest terms
+    first), and price/weight expressions such as "under $10" or "at least 5 lb"
+    are parsed into Pinecone range operators. Callers fall back to the LLM
+    stages when confidence is below Config.QUERY_ANALYZER_MIN_CONFIDENCE, which
+    includes questions whose only catalog terms are descriptors like "mild" or
+    "fresh" without the word cheese.
+    """
+
+    def __init__(self, products: List[Dict[str, Any]]):
+        # term (lowercase) -> (field, values the term selects)
+        self._terms: Dict[str, Tuple[str, List[str]]] = {}
+
+        brands = sorted({p['metadata'].get('brand', '') for p in products} - {'', 'N/A'})
+        forms = sorted({p['metadata'].get('cheese_form', '') for p in products} - {'', 'N/A'})
+        types = sorted({p['metadata'].get('cheese_type', '') for p in products} - {'', 'N/A'})
+
+        for brand in brands:
+            self._terms[brand.lower()] = ('brand', [brand])
+
+        form_keywords: Dict[str, List[str]] = {}
+        for form in forms:
+            for keyword in re.split(r"[,\s]+", form):
+                keyword = keyword.lower()
+                if keyword and keyword not in _GENERIC_WORDS:
+                    form_keywords.setdefault(keyword, []).append(form)
+
+        type_keywords: Dict[str, List[str]] = {}
+        for cheese_type in types:
+            for token in cheese_type.split(','):
+                token = re.sub(r"\bcheese\b", "", token, flags=re.IGNORECASE).strip().lower()
+                if not _is_type_token(token) or token in form_keywords or token in self._terms:
+                    continue
+                type_keywords.setdefault(token, []).append(cheese_type)
+
+        for keyword, values in type_keywords.items():
+            self._terms.setdefault(keyword, ('cheese_type', values))
+
+        patterns = []
+        for term in sorted(self._terms, key=len, reverse=True):
+            patterns.append(re.escape(term).replace(r"\ ", r"\s+") + r"s?")
+        # Form keywords are stemmed so "slice", "slices" and "sliced" all match "Sliced"
+        self._form_stems: Dict[str, str] = {}
+        for keyword in sorted(form_keywords, key=len, reverse=True):
+            stem = _stem(keyword)
+            self._form_stems[stem] = keyword
+            self._terms.setdefault(keyword, ('cheese_form', form_keywords[keyword]))
+            patterns.append(re.escape(stem) + _FORM_SUFFIXES)
+
+        self._matcher = re.compile(r"\b(" + "|".join(patterns) + r")\b", re.IGNORECASE)
+        self._descriptors = {term for term in self._terms if set(re.findall(r"[a-z]+", term)) <= _DESCRIPTOR_WORDS}
+        logger.info(
+            f"Query analyzer built with {len(brands)} brands, {len(form_keywords)} form keywords "
+            f"and {len(type_keywords)} cheese type keywords"
+        )
+
+    @classmethod
+    def from_catalog(cls, path: str = Config.CATALOG_PATH) -> "QueryAnalyzer":
+        return cls(list(read_records(path)))
+
+    def analyze(self, text: str) -> QueryAnalysis:
+        """Classify a question and extract a metadata filter without calling the LLM"""
+        filter_dict, matched_terms, numeric = self.extract_filter(text)
+
+        mentions_cheese = bool(_CHEESE_RE.search(text))
+        # A brand or variety ("galbani", "cheddar") names cheese on its own; descriptors only next to one
+        specific = [term for term in matched_terms if term not in self._descriptors]
+        if _SUPERLATIVE_RE.search(text) and (specific or mentions_cheese or numeric):
+            # The LLM classifier routes superlative questions to the general answer path
+            return QueryAnalysis(0, None, 0.9, matched_terms)
+        if specific or (matched_terms and mentions_cheese):
+            return QueryAnalysis(1, filter_dict, 0.9, matched_terms)
+        if numeric and mentions_cheese:
+            return QueryAnalysis(1, filter_dict, 0.8, matched_terms)
+        if _GREETING_RE.match(text):
+            return QueryAnalysis(0, None, 0.85, matched_terms)
+        if matched_terms or mentions_cheese:
+            return QueryAnalysis(1, filter_dict, 0.5, matched_terms)
+        return QueryAnalysis(0, None, 0.0, matched_terms)
+
+    def extract_filter(self, text: str) -> Tuple[Optional[Dict[str, Any]], List[str], List[Dict[str, Any]]]:
+        """Pinecone filter for the catalog terms and price/weight bounds in text, with the matched terms and numeric conditions"""
+        conditions: List[Dict[str, Any]] = []
+        selected: Dict[str, List[set]] = {}
+        matched_terms = []
+
+        for match in self._matcher.finditer(text):
+            term = self._resolve(match.group(1))
+            if term is None:
+                continue
+            field_name, values = self._terms[term]
+            selected.setdefault(field_name, []).append(set(values))
+            matched_terms.append(term)
+
+        for field_name in ('brand', 'cheese_type', 'cheese_form'):
+            if field_name not in selected:
+                continue
+            if field_name == 'cheese_type':
+                # Every named attribute must appear in the product name, e.g. "sharp cheddar";
+                # disjoint names such as "ricotta or mascarpone" fall back to either
+                values = set.intersection(*selected[field_name]) or set.union(*selected[field_name])
+            else:
+                values = set.union(*selected[field_name])
+            if not values:
+                continue
+            values = sorted(values)
+            conditions.append({field_name: values[0]} if len(values) == 1 else {field_name: {"$in": values}})
+
+        numeric = self._numeric_conditions(text)
+        conditions.extend(numeric)
+
+        filter_dict = None
+        if len(conditions) == 1:
+            filter_dict = conditions[0]
+        elif conditions:
+            filter_dict = {"$and": conditions}
+        return filter_dict, matched_terms, numeric
+
+    def _resolve(self, matched: str) -> Optional[str]:
+        term = re.sub(r"\s+", " ", matched.lower())
+        if term in self._terms:
+            return term
+        if term.endswith('s') and term[:-1] in self._terms:
+            return term[:-1]
+        for stem, keyword in self._form_stems.items():
+            if term.startswith(stem):
+                return keyword
+        return None
+
+    @staticmethod
+    def _numeric_conditions(text: str) -> List[Dict[str, Any]]:
+        conditions = []
+
+        for match in _PRICE_BETWEEN_RE.finditer(text):
+            low = float(match.group(1) or match.group(2))
+            high = float(match.group(3) or match.group(4))
+            field_name = 'price_per_lb' if match.group(5) else 'price_each'
+            conditions.append({field_name: {"$gte": min(low, high), "$lte": max(low, high)}})
+        if conditions:
+            return conditions
+
+        for match in _PRICE_RE.finditer(text):
+            op = _COMPARATORS[match.group(1).lower()]
+            amount = float(match.group(2) or match.group(3))
+            field_name = 'price_per_lb' if match.group(4) else 'price_each'
+            conditions.append({field_name: {op: amount}})
+        for match in _PRICE_TRAILING_RE.finditer(text):
+            amount = float(match.group(1) or match.group(2))
+            field_name = 'price_per_lb' if match.group(3) else 'price_each'
+            conditions.append({field_name: {_TRAILING[match.group(4).lower()]: amount}})
+
+        for match in _WEIGHT_RE.finditer(text):
+            conditions.append({'lb_per_each': {_COMPARATORS[match.group(1).lower()]: float(match.group(2))}})
+        for match in _WEIGHT_TRAILING_RE.finditer(text):
+            conditions.append({'lb_per_each': {_TRAILING[match.group(2).lower()]: float(match.group(1))}})
+
+        return conditions
+
+
+def _is_type_token(token: str) -> bool:
+    """Keep descriptive words from product names, dropping sizes, codes and abbreviations like 'Wmlm'"""
+    if len(token) < 4 or any(c.isdigit() for c in token) or '(' in token:
+        return False
+    return all(re.search(r"[aeiouy]", word) for word in re.findall(r"[a-z]+", token))
+
+
+def _stem(keyword: str) -> str:
+    """Strip a past-tense suffix so inflections of a form keyword share one pattern"""
+    if len(keyword) > 4 and keyword.endswith('ed'):
+        # "sliced" -> "slic" and "shredded" -> "shred"; the suffix group restores the inflections
+        keyword = keyword[:-2]
+        if len(keyword) > 3 and keyword[-1] == keyword[-2]:
+            keyword = keyword[:-1]
+    return keyword
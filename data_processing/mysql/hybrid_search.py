@@ -4,20 +4,26 @@ from pathlib import Path
 import logging
 from typing import List, Dict, Any, Optional
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Add project root to Python path
 project_root = str(Path(__file__).parent.parent)
 sys.path.append(project_root)
 
-from rag.vector_store import VectorStore
+from chatbot.resources import get_vector_store, get_bm25_index, get_catalog
+from chatbot.retriver.hybrid import HybridRetriever, reciprocal_rank_fusion
 from db_handler import MySQLHandler
 from utils.config import Config
+from utils.tracing import count, in_current_context, span
 
 logger = logging.getLogger(__name__)
 
 class HybridSearch:
     def __init__(self):
-        self.vector_store = VectorStore()
+        self.vector_store = get_vector_store()
+        self.retriever = HybridRetriever(self.vector_store, get_bm25_index(), get_catalog())
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid-sql")
         self.mysql_handler = MySQLHandler(
             host=Config.MYSQL_HOST,
             user=Config.MYSQL_USER,
@@ -56,54 +62,77 @@ class HybridSearch:
         # Default to semantic search
         return {'type': 'semantic'}
 
-    def search(self, query: str) -> Dict[str, Any]:
+    def _structured_search(self, query_type: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The MySQL lookup suggested by the query analysis"""
+        if query_type['type'] == 'price':
+            if query_type['action'] == 'most_expensive':
+                return self.mysql_handler.get_most_expensive_cheese(limit=5)
+            return self.mysql_handler.get_cheese_by_price_range(
+                min_price=0,
+                max_price=query_type.get('max_price', float('inf'))
+            )
+        if query_type['type'] == 'location':
+            return self.mysql_handler.get_cheese_by_location(query_type['location'])
+        if query_type['type'] == 'cheese_type':
+            return self.mysql_handler.get_cheese_by_type(query_type['cheese_type'])
+        return []
+
+    def search(self, query: str, top_k: int = Config.TOP_K_RESULTS) -> Dict[str, Any]:
         """
         Perform hybrid search based on query analysis
+
+        The structured MySQL lookup (when the query suggests one), BM25 and the
+        vector query run concurrently, and their rankings are merged with
+        reciprocal rank fusion instead of falling back from one to the other.
         """
-        query_type = self._detect_query_type(query)
+        with span('hybrid_search') as search_span:
+            query_type = self._detect_query_type(query)
+            search_span.set(query_type=query_type['type'])
         
-        try:
-            if query_type['type'] == 'price':
-                if query_type['action'] == 'most_expensive':
-                    results = self.mysql_handler.get_most_expensive_cheese(limit=5)
-                else:
-                    results = self.mysql_handler.get_cheese_by_price_range(
-                        min_price=0,
-                        max_price=query_type.get('max_price', float('inf'))
-                    )
-            
-            elif query_type['type'] == 'location':
-                results = self.mysql_handler.get_cheese_by_location(query_type['location'])
-            
-            elif query_type['type'] == 'cheese_type':
-                results = self.mysql_handler.get_cheese_by_type(query_type['cheese_type'])
-            
-            else:  # semantic search
-                results = self.vector_store.get_relevant_products(query)
-                if isinstance(results, dict) and 'context' in results:
-                    results = results['context']
-            
-            # If no results from primary search, try the other method
-            if not results:
+            try:
+                structured_future = None
                 if query_type['type'] != 'semantic':
-                    semantic_results = self.vector_store.get_relevant_products(query)
-                    if isinstance(semantic_results, dict) and 'context' in semantic_results:
-                        results = semantic_results['context']
-                else:
-                    lexical_results = self.mysql_handler.search_cheese(query)
-                    results = lexical_results
+                    structured_future = self._executor.submit(in_current_context(self._timed_structured_search), query_type)
+
+                embedding_start = time.perf_counter()
+                embedding = self.vector_store.get_embedding(query)
+                embedding_ms = round((time.perf_counter() - embedding_start) * 1000, 2)
+                hybrid = self.retriever.search(query, embedding, top_k=top_k)
+                structured, structured_ms = structured_future.result() if structured_future else ([], 0.0)
+
+                by_id = {row['id']: row for row in structured}
+                by_id.update({product['id']: product for product in hybrid['products']})
+                fused = reciprocal_rank_fusion([
+                    [product['id'] for product in hybrid['products']],
+                    [row['id'] for row in structured]
+                ])
+                results = [{**by_id[doc_id], 'rrf_score': fused[doc_id]} for doc_id in sorted(fused, key=fused.get, reverse=True)[:top_k]]
+
+                metrics = dict(hybrid['metrics'])
+                metrics['embedding_ms'] = embedding_ms
+                metrics['structured_ms'] = structured_ms
+                metrics['structured_hits'] = len(structured)
             
-            return {
-                'results': results,
-                'query_type': query_type['type'],
-                'total_results': len(results) if results else 0
-            }
+                return {
+                    'results': results,
+                    'query_type': query_type['type'],
+                    'total_results': len(results),
+                    'metrics': metrics
+                }
             
-        except Exception as e:
-            logger.error(f"Error in hybrid search: {e}")
-            return {
-                'results': [],
-                'query_type': query_type['type'],
-                'total_results': 0,
-                'error': str(e)
-            } 
\ No newline at end of file
+            except Exception as e:
+                logger.error(f"Error in hybrid search: {e}")
+                return {
+                    'results': [],
+                    'query_type': query_type['type'],
+                    'total_results': 0,
+                    'error': str(e)
+                }
+
+    def _timed_structured_search(self, query_type: Dict[str, Any]):
+        start = time.perf_counter()
+        with span('mysql.query', lookup=query_type.get('action', query_type['type'])) as query_span:
+            results = self._structured_search(query_type)
+            query_span.set(rows=len(results))
+        count('retrieved_products_total', len(results), source='mysql')
+        return results, round((time.perf_counter() - start) * 1000, 2)
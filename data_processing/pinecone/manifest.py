@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.config import Config
+from chatbot.retriver.local_index import catalog_metadata, catalog_text
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+# Metadata that changes on every processing run without the product itself changing
+VOLATILE_FIELDS = frozenset({'processed_at'})
+
+
+def _digest(value: Any, size: int = 16) -> str:
+    return hashlib.blake2b(json.dumps(value, sort_keys=True, default=str).encode('utf-8'), digest_size=size).hexdigest()
+
+
+def manifest_entry(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Hashes of a product's embedded text (with the embedding model) and of each of its metadata fields"""
+    return {
+        'text': _digest([Config.EMBEDDING_MODEL, catalog_text(item)]),
+        'fields': {
+            name: _digest(value, 8)
+            for name, value in catalog_metadata(item).items()
+            if name not in VOLATILE_FIELDS
+        }
+    }
+
+
+def describe_plan(summary: Dict[str, Any]) -> str:
+    """One line of the counts in a ManifestDiff.summary()"""
+    return (
+        f"Plan: {summary['new']} new, {summary['changed']} changed, {summary['metadata_only']} metadata-only, "
+        f"{summary['removed']} removed, {summary['unchanged']} unchanged"
+    )
+
+
+@dataclass
+class ManifestDiff:
+    """What a sync has to send to bring the index in line with the catalog"""
+    new: List[Dict[str, Any]] = field(default_factory=list)
+    # Embedded text (or the embedding model) changed: re-embed and upsert
+    changed: List[Dict[str, Any]] = field(default_factory=list)
+    # Only metadata changed: (item, names of the changed fields)
+    updated: List[Tuple[Dict[str, Any], List[str]]] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    # Manifest entry of every catalog item, recorded once its write succeeds
+    entries: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    @property
+    def to_embed(self) -> List[Dict[str, Any]]:
+        return self.new + self.changed
+
+    def summary(self) -> Dict[str, Any]:
+        fields = Counter(name for _, names in self.updated for name in names)
+        return {
+            'new': len(self.new),
+            'changed': len(self.changed),
+            'metadata_only': len(self.updated),
+            'removed': len(self.removed),
+            'unchanged': self.unchanged,
+            'updated_fields': dict(fields.most_common())
+        }
+
+    def describe(self, limit: int = 10) -> str:
+        """The plan as text, listing up to limit product IDs per kind of change"""
+        def ids(values: List[str]) -> str:
+            more = f" (+{len(values) - limit} more)" if len(values) > limit else ""
+            return ", ".join(values[:limit]) + more
+
+        summary = self.summary()
+        lines = [describe_plan(summary)]
+        if self.new:
+            lines.append(f"  embed + upsert (new):     {ids([item['id'] for item in self.new])}")
+        if self.changed:
+            lines.append(f"  embed + upsert (changed): {ids([item['id'] for item in self.changed])}")
+        if self.updated:
+            described = [f"{item['id']} ({', '.join(names)})" for item, names in self.updated]
+            lines.append(f"  update metadata:          {ids(described)}")
+            lines.append(f"  fields updated:           {summary['updated_fields']}")
+        if self.removed:
+            lines.append(f"  delete:                   {ids(self.removed)}")
+        return "\n".join(lines)
+
+
+class IngestManifest:
+    """
+    Per-product hashes of what was last written to the vector index.
+
+    One JSON file maps each product ID to a hash of its embedded text and a
+    short hash per metadata field. diff() compares a catalog against it;
+    callers record each write that succeeded with set() or discard() and
+    save() at the end, so whatever failed shows up in the next diff again.
+    A missing or unreadable file is an empty manifest: everything is new.
+    """
+
+    def __init__(self, path: Optional[str] = Config.INGEST_MANIFEST_PATH):
+        self.path = path
+        self.items: Dict[str, Dict[str, Any]] = {}
+        if path and Path(path).exists():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    self.items = data.get('items', {})
+                else:
+                    logger.warning(f"Ignoring ingest manifest {path} with version {data.get('version')}")
+            except Exception as e:
+                logger.error(f"Error loading ingest manifest {path}: {str(e)}")
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def classify(self, item: Dict[str, Any], full: bool = False) -> Tuple[str, Dict[str, Any], List[str]]:
+        """
+        (kind, entry, changed field names) of one product against the
+        manifest, kind being 'new', 'changed', 'metadata_only' or 'unchanged'.
+        With full, a product already in the manifest counts as changed.
+        """
+        entry = manifest_entry(item)
+        previous = self.items.get(item['id'])
+        if previous is None:
+            return 'new', entry, []
+        if full or previous.get('text') != entry['text']:
+            return 'changed', entry, []
+        if previous.get('fields') != entry['fields']:
+            old_fields = previous.get('fields', {})
+            names = sorted(
+                name for name in set(old_fields) | set(entry['fields'])
+                if old_fields.get(name) != entry['fields'].get(name)
+            )
+            return 'metadata_only', entry, names
+        return 'unchanged', entry, []
+
+    def diff(self, products: Iterable[Dict[str, Any]], full: bool = False) -> ManifestDiff:
+        """
+        Compare a catalog against the manifest. With full, every product
+        already in the manifest counts as changed, so all are re-embedded.
+        """
+        # A later duplicate ID replaces an earlier one, as it would in the index
+        latest = {item['id']: item for item in products}
+        diff = ManifestDiff()
+        for vid, item in latest.items():
+            kind, diff.entries[vid], names = self.classify(item, full)
+            if kind == 'new':
+                diff.new.append(item)
+            elif kind == 'changed':
+                diff.changed.append(item)
+            elif kind == 'metadata_only':
+                diff.updated.append((item, names))
+            else:
+                diff.unchanged += 1
+        diff.removed = [vid for vid in self.items if vid not in latest]
+        return diff
+
+    def set(self, vid: str, entry: Dict[str, Any]):
+        self.items[vid] = entry
+
+    def discard(self, vid: str):
+        self.items.pop(vid, None)
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'items': self.items}, f)
+        os.replace(tmp, self.path)
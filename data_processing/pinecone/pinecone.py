@@ -1,6 +1,13 @@
+import argparse
 import json
 import logging
-from typing import List, Dict, Any
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Optional, Tuple
 from pinecone import Pinecone, ServerlessSpec
 from openai import OpenAI
 import sys
@@ -11,15 +18,87 @@ project_root = str(Path(__file__).parent.parent)
 sys.path.append(project_root)
 
 from utils.config import Config
+from utils.embedding_cache import get_embedding_cache
+from utils.job_journal import JobJournal
+from utils.jsonl import read_records
+from utils.resilience import get_upstream
+from utils.catalog_version import bump_catalog_version
+from utils.tokens import count_tokens
+from chatbot.retriver.local_index import LocalVectorIndex, catalog_metadata, catalog_text
+from chatbot.retriver.bm25_index import BM25Index, product_text
+from data_processing.pinecone.manifest import IngestManifest, describe_plan
 
 logger = logging.getLogger(__name__)
 
+# Tells a pipeline worker that its input is exhausted
+_DONE = object()
+# Pinecone accepts up to 1000 IDs per delete request
+_DELETE_BATCH = 1000
+
+
+@dataclass
+class IngestStats:
+    """Counters for one ingest_data run, updated from the pipeline's worker threads"""
+    items: int = 0
+    stored: int = 0
+    failed: int = 0
+    retried: int = 0
+    # Items a journal showed stored by an interrupted earlier run, and items it quarantined
+    resumed: int = 0
+    quarantined: int = 0
+    tokens: int = 0
+    embedding_requests: int = 0
+    upsert_requests: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts: int):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            'items': self.items,
+            'stored': self.stored,
+            'failed': self.failed,
+            'retried': self.retried,
+            'resumed': self.resumed,
+            'quarantined': self.quarantined,
+            'embedding_requests': self.embedding_requests,
+            'upsert_requests': self.upsert_requests,
+            'seconds': round(elapsed, 3),
+            'items_per_sec': round(self.stored / elapsed, 2) if elapsed else 0.0,
+            'tokens_per_sec': round(self.tokens / elapsed, 1) if elapsed else 0.0
+        }
+
+
 class PineconeIngestor:
     def __init__(self):
         # Initialize OpenAI client
         if not Config.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY is not set in config.py")
-        self.client = OpenAI(api_key=Config.OPENAI_API_KEY)
+        # Retries are left to the shared upstream policy, which also enforces per-stage deadlines
+        self.client = OpenAI(api_key=Config.OPENAI_API_KEY, base_url=Config.OPENAI_BASE_URL, max_retries=0)
+        self.openai = get_upstream('openai')
+        self.pinecone = get_upstream('pinecone')
+        self.embedding_cache = get_embedding_cache()
+        # Guards the BM25 index and the in-process vector index against concurrent pipeline workers
+        self._lock = threading.Lock()
+        # Lexical index for hybrid retrieval, extended in place on every ingest
+        if Path(Config.BM25_INDEX_PATH).exists():
+            self.bm25 = BM25Index.load(Config.BM25_INDEX_PATH)
+        else:
+            self.bm25 = BM25Index()
+
+        if Config.VECTOR_BACKEND == "local":
+            # Ingest into the in-process index; it is written to disk after ingest_data
+            if Path(Config.LOCAL_INDEX_PATH).exists():
+                self.index = LocalVectorIndex.load(Config.LOCAL_INDEX_PATH)
+            else:
+                self.index = LocalVectorIndex(Config.VECTOR_DIMENSION)
+            return
 
         # Initialize Pinecone
         if not Config.PINECONE_API_KEY:
@@ -27,7 +106,11 @@ class PineconeIngestor:
         
         # Initialize Pinecone client
         self.pc = Pinecone(api_key=Config.PINECONE_API_KEY)
-        
+
+        if Config.PINECONE_HOST:
+            self.index = self.pc.Index(host=Config.PINECONE_HOST)
+            return
+
         # Get or create index
         if Config.PINECONE_INDEX_NAME not in self.pc.list_indexes().names():
             self.pc.create_index(
@@ -44,58 +127,467 @@ class PineconeIngestor:
 
     def get_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using OpenAI's API"""
+        return self.get_embeddings([text])[0]
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for several texts, sending only cache misses in one request"""
         try:
-            response = self.client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=text
-            )
-            return response.data[0].embedding
+            return self.embedding_cache.get_many(Config.EMBEDDING_MODEL, texts, self._create_embeddings)
         except Exception as e:
             logger.error(f"Error generating embedding: {str(e)}")
-            return []
+            return [[] for _ in texts]
+
+    def _create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        response = self.openai.call(
+            'embedding', self.client.embeddings.create, model=Config.EMBEDDING_MODEL, input=texts, hedge=True
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def _upsert(self, vectors: List[Any]):
+        """index.upsert, under the Pinecone deadline and retry policy unless the index is in-process"""
+        if isinstance(self.index, LocalVectorIndex):
+            with self._lock:
+                self.index.upsert(vectors=vectors)
+        else:
+            self.pinecone.call('upsert', self.index.upsert, vectors=vectors)
+
+    def ingest_data(
+        self,
+        processed_data: Iterable[Dict[str, Any]],
+        on_stored: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+        persist: bool = True,
+        journal: Optional[JobJournal] = None
+    ) -> Dict[str, Any]:
+        """
+        Ingest processed cheese data through a pipelined embed and upsert.
 
-    def ingest_data(self, processed_data: List[Dict[str, Any]]):
-        """Ingest processed cheese data into Pinecone"""
+        The calling thread packs items into embedding requests of at most
+        INGEST_EMBED_BATCH texts and INGEST_EMBED_MAX_TOKENS tokens, or what
+        arrived within INGEST_BATCH_LINGER_SECONDS; INGEST_EMBED_WORKERS threads embed them and pack the vectors into upsert
+        requests of at most INGEST_UPSERT_BATCH vectors and
+        INGEST_UPSERT_MAX_BYTES, which INGEST_UPSERT_WORKERS threads send.
+        The queues between the stages hold INGEST_QUEUE_SIZE batches, so a slow
+        stage holds back the ones feeding it and processed_data may be a lazy
+        iterable of any length. Items of a failed request are retried one at a
+        time; those that still fail are logged and skipped. on_stored is called
+        (from a worker thread, one call at a time) with the items of every
+        successful upsert. Returns the throughput summary, which is also printed.
+
+        With a journal, items an interrupted earlier run already upserted are
+        not embedded again (on_stored still gets them), items that keep
+        failing are quarantined, and the caller finishes the journal once
+        on_stored's record is saved. The in-process index is only written at
+        the end of a run, so its runs are not journaled.
+        """
+        if journal is not None and isinstance(self.index, LocalVectorIndex):
+            journal = None
+        # Journal keys of the items begun and not yet stored
+        begun: Dict[str, str] = {}
+
+        def stored_callback(items: List[Dict[str, Any]]):
+            if journal is not None:
+                journal.done([begun.get(item['id']) or self._journal_key(item) for item in items])
+            if on_stored is not None:
+                on_stored(items)
+            # Only once recorded: items whose bookkeeping raised are left to the failed sweep below
+            for item in items:
+                begun.pop(item['id'], None)
+
+        stats = IngestStats()
+        embed_queue: queue.Queue = queue.Queue(maxsize=Config.INGEST_QUEUE_SIZE)
+        upsert_queue: queue.Queue = queue.Queue(maxsize=Config.INGEST_QUEUE_SIZE)
+        embedders = [
+            threading.Thread(target=self._embed_worker, args=(embed_queue, upsert_queue, stats), name=f"ingest-embed-{i}")
+            for i in range(Config.INGEST_EMBED_WORKERS)
+        ]
+        upserters = [
+            threading.Thread(target=self._upsert_worker, args=(upsert_queue, stats, stored_callback), name=f"ingest-upsert-{i}")
+            for i in range(Config.INGEST_UPSERT_WORKERS)
+        ]
+        for worker in embedders + upserters:
+            worker.start()
         try:
-            for item in processed_data:
-                # Combine name and description for embedding
-                text_to_embed = f"{item['description']}"
-                
-                # Generate embedding
-                embedding = self.get_embedding(text_to_embed)
-                if not embedding:
-                    logger.warning(f"Failed to generate embedding for item {item['id']}")
-                    continue
-                
-                # Prepare metadata
-                metadata = {
-                    **item['metadata'],
-                    'image_url': item['image_url'],
-                    'description': item['description'],
-                    'processed_at': item['processed_at']
-                }
-                
-                # Upsert to Pinecone
-                self.index.upsert(
-                    vectors=[(item['id'], embedding, metadata)]
-                )
-                print(item['id'])
-                logger.info(f"Stored item {item['id']} in Pinecone")
-            
-            logger.info(f"Successfully ingested {len(processed_data)} items into Pinecone")
+            for batch in self._embedding_batches(processed_data, stats):
+                if journal is not None:
+                    batch = self._begin_batch(batch, journal, begun, stored_callback, stats)
+                if batch:
+                    embed_queue.put(batch)
+        except Exception as e:
+            logger.error(f"Error reading items to ingest: {str(e)}")
+        finally:
+            for _ in embedders:
+                embed_queue.put(_DONE)
+            for worker in embedders:
+                worker.join()
+            for _ in upserters:
+                upsert_queue.put(_DONE)
+            for worker in upserters:
+                worker.join()
+            if journal is not None and begun:
+                # Whatever was begun and not stored failed; the log has the errors
+                stats.add(quarantined=len(journal.failed(list(begun.values()), "not stored; see the ingestion log")))
+
+        summary = stats.summary()
+        print(
+            f"Ingested {summary['stored']}/{summary['items']} items in {summary['seconds']:.1f}s: "
+            f"{summary['items_per_sec']:.1f} items/s, {summary['tokens_per_sec']:.0f} tokens/s "
+            f"({summary['embedding_requests']} embedding and {summary['upsert_requests']} upsert requests, "
+            f"{summary['retried']} items retried individually, {summary['failed']} failed"
+            + (f", {summary['resumed']} already stored, {summary['quarantined']} quarantined)" if journal is not None else ")")
+        )
+        try:
+            if persist:
+                self._persist()
+            logger.info(f"Successfully ingested {summary['stored']} items into {Config.VECTOR_BACKEND} index: {summary}")
+            logger.info(f"Embedding cache stats: {self.embedding_cache.stats()}")
         except Exception as e:
             logger.error(f"Error ingesting data into Pinecone: {str(e)}")
+        return summary
+
+    def _persist(self):
+        """Save the in-process indexes and invalidate cached answers built from the previous catalog"""
+        if isinstance(self.index, LocalVectorIndex):
+            self.index.save(Config.LOCAL_INDEX_PATH)
+        self.bm25.save(Config.BM25_INDEX_PATH)
+        bump_catalog_version()
+
+    def sync(
+        self,
+        products: Iterable[Dict[str, Any]],
+        manifest: Optional[IngestManifest] = None,
+        full: bool = False,
+        force: bool = False,
+        journal: Optional[JobJournal] = None
+    ) -> Dict[str, Any]:
+        """
+        Bring the index in line with products, sending only what changed since the last sync.
+
+        products may be a lazy stream: each product is compared against the
+        manifest as it arrives, and new products and products whose embedded
+        text changed go straight into ingest_data. Products whose metadata
+        alone changed get an update with just the changed fields once the
+        stream ends; products no longer in the catalog are then deleted. If
+        the stream fails part way, nothing is deleted, since the products
+        not seen yet cannot be told apart from removed ones. The manifest
+        records every write that succeeded and is saved at the end, so
+        failures come up again on the next run. Deleting more than
+        INGEST_MAX_DELETE_FRACTION of the manifest's products (a truncated
+        scrape, say) is refused unless force is set. With a journal, a sync
+        interrupted before saving the manifest resumes without re-sending
+        what it had stored (see ingest_data); summary['complete'] tells
+        whether the whole stream was read.
+        """
+        manifest = manifest if manifest is not None else IngestManifest()
+        known = list(manifest.items)
+        entries: Dict[str, Dict[str, Any]] = {}
+        updates: List[Tuple[Dict[str, Any], List[str]]] = []
+        kinds: Counter = Counter()
+        complete = False
+
+        def changed_items() -> Iterator[Dict[str, Any]]:
+            nonlocal complete
+            for item in products:
+                kind, entries[item['id']], names = manifest.classify(item, full)
+                kinds[kind] += 1
+                if kind in ('new', 'changed'):
+                    yield item
+                elif kind == 'metadata_only':
+                    updates.append((item, names))
+            complete = True
+
+        def record(items: List[Dict[str, Any]]):
+            for item in items:
+                manifest.set(item['id'], entries[item['id']])
+
+        summary: Dict[str, Any] = {
+            'ingest': self.ingest_data(changed_items(), on_stored=record, persist=False, journal=journal)
+        }
+        removed = [vid for vid in known if vid not in entries]
+        if not complete:
+            logger.error(f"The catalog stream ended early; not deleting the {len(removed)} products it did not reach")
+            removed = []
+        elif removed and not force and len(removed) > Config.INGEST_MAX_DELETE_FRACTION * len(known):
+            logger.error(
+                f"Refusing to delete {len(removed)} of {len(known)} products; "
+                f"check the catalog or pass force=True (--force)"
+            )
+            removed = []
+        summary['plan'] = {
+            'new': kinds['new'],
+            'changed': kinds['changed'],
+            'metadata_only': kinds['metadata_only'],
+            'removed': len(removed),
+            'unchanged': kinds['unchanged'],
+            'updated_fields': dict(Counter(name for _, names in updates for name in names).most_common())
+        }
+        print(describe_plan(summary['plan']))
+        summary['updated'] = self._update_metadata(updates, manifest, entries)
+        summary['deleted'] = self._delete(removed, manifest)
+        summary['complete'] = complete
+        try:
+            manifest.save()
+            if summary['ingest']['stored'] or summary['ingest']['resumed'] or summary['updated'] or summary['deleted']:
+                self._persist()
+            if journal is not None and complete:
+                journal.finish()
+        except Exception as e:
+            logger.error(f"Error saving ingestion state: {str(e)}")
+        logger.info(f"Synced catalog into {Config.VECTOR_BACKEND} index: {summary}")
+        return summary
+
+    def _update_metadata(
+        self,
+        updates: List[Tuple[Dict[str, Any], List[str]]],
+        manifest: IngestManifest,
+        entries: Dict[str, Dict[str, Any]]
+    ) -> int:
+        """Send the changed metadata fields of each product; returns how many were updated"""
+        def update(item: Dict[str, Any], names: List[str]):
+            metadata = catalog_metadata(item)
+            # Fields dropped from the catalog cannot be unset through an update and are left as they are
+            changes = {name: metadata[name] for name in names if name in metadata}
+            if isinstance(self.index, LocalVectorIndex):
+                with self._lock:
+                    self.index.update(id=item['id'], set_metadata=changes)
+            else:
+                self.pinecone.call('update', self.index.update, id=item['id'], set_metadata=changes)
+
+        updated = 0
+        if not updates:
+            return updated
+        with ThreadPoolExecutor(max_workers=Config.INGEST_UPSERT_WORKERS) as pool:
+            futures = {pool.submit(update, item, names): item for item, names in updates}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Failed to update metadata of item {item['id']}: {str(e)}")
+                    # Dropped from the manifest so the next run re-embeds and upserts it in full
+                    manifest.discard(item['id'])
+                    continue
+                manifest.set(item['id'], entries[item['id']])
+                with self._lock:
+                    self.bm25.add(item['id'], product_text(item))
+                updated += 1
+        return updated
+
+    def _delete(self, ids: List[str], manifest: IngestManifest) -> int:
+        """Delete vectors by ID in batches; returns how many were deleted"""
+        deleted = 0
+        for start in range(0, len(ids), _DELETE_BATCH):
+            batch = ids[start:start + _DELETE_BATCH]
+            try:
+                if isinstance(self.index, LocalVectorIndex):
+                    with self._lock:
+                        self.index.delete(ids=batch)
+                else:
+                    self.pinecone.call('delete', self.index.delete, ids=batch)
+            except Exception as e:
+                logger.error(f"Failed to delete {len(batch)} items: {str(e)}")
+                continue
+            with self._lock:
+                for vid in batch:
+                    self.bm25.remove(vid)
+                    manifest.discard(vid)
+            deleted += len(batch)
+        return deleted
+
+    def _embedding_batches(self, items: Iterable[Dict[str, Any]], stats: IngestStats) -> Iterator[List[Tuple[Dict[str, Any], str, int]]]:
+        """
+        (item, text, tokens) lists, one per embedding request. A batch is also
+        cut when an item arrives more than INGEST_BATCH_LINGER_SECONDS after
+        the batch started, so a slowly produced stream is embedded as it goes.
+        """
+        batch, batch_tokens, started = [], 0, 0.0
+        for item in items:
+            text = catalog_text(item)
+            tokens = count_tokens(text, Config.EMBEDDING_MODEL)
+            if batch and (
+                len(batch) >= Config.INGEST_EMBED_BATCH
+                or batch_tokens + tokens > Config.INGEST_EMBED_MAX_TOKENS
+                or time.monotonic() - started > Config.INGEST_BATCH_LINGER_SECONDS
+            ):
+                yield batch
+                batch, batch_tokens = [], 0
+            if not batch:
+                started = time.monotonic()
+            batch.append((item, text, tokens))
+            batch_tokens += tokens
+            stats.add(items=1)
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _journal_key(item: Dict[str, Any]) -> str:
+        return JobJournal.key([Config.EMBEDDING_MODEL, item])
+
+    def _begin_batch(
+        self,
+        batch: List[Tuple[Dict[str, Any], str, int]],
+        journal: JobJournal,
+        begun: Dict[str, str],
+        stored_callback: Callable[[List[Dict[str, Any]]], None],
+        stats: IngestStats
+    ) -> List[Tuple[Dict[str, Any], str, int]]:
+        """The part of a batch to embed: items already stored are passed on as stored, quarantined ones dropped"""
+        keys = [self._journal_key(item) for item, _, _ in batch]
+        entries = journal.lookup(keys)
+        stored = [item for (item, _, _), key in zip(batch, keys) if key in entries and entries[key].status == 'done']
+        if stored and self._record_stored(stored, stored_callback):
+            stats.add(resumed=len(stored))
+        allowed = set(journal.begin([key for key in keys if key not in entries or entries[key].status != 'done']))
+        remaining = []
+        for record, key in zip(batch, keys):
+            if key in allowed:
+                begun[record[0]['id']] = key
+                remaining.append(record)
+            elif not (key in entries and entries[key].status == 'done'):
+                stats.add(quarantined=1)
+        return remaining
+
+    def _embed_worker(self, embed_queue: queue.Queue, upsert_queue: queue.Queue, stats: IngestStats):
+        try:
+            while True:
+                batch = embed_queue.get()
+                if batch is _DONE:
+                    return
+                try:
+                    records = self._embed_batch(batch, stats)
+                except Exception as e:
+                    logger.error(f"Error embedding {len(batch)} items: {str(e)}")
+                    stats.add(failed=len(batch))
+                    continue
+                for upsert_batch in self._upsert_batches(records):
+                    upsert_queue.put(upsert_batch)
+        except Exception as e:
+            logger.error(f"Embedding worker stopped: {str(e)}")
+            _drain(embed_queue, stats)
+
+    def _embed_batch(self, batch: List[Tuple[Dict[str, Any], str, int]], stats: IngestStats) -> List[Tuple[Dict[str, Any], Tuple]]:
+        """(item, vector) pairs for a batch, retrying items whose embedding came back empty one at a time"""
+        embeddings = self.get_embeddings([text for _, text, _ in batch])
+        stats.add(embedding_requests=1)
+        records = []
+        for (item, text, tokens), embedding in zip(batch, embeddings):
+            if not embedding and len(batch) > 1:
+                embedding = self.get_embedding(text)
+                stats.add(retried=1, embedding_requests=1)
+            if not embedding:
+                logger.warning(f"Failed to generate embedding for item {item['id']}")
+                stats.add(failed=1)
+                continue
+            records.append((item, (item['id'], embedding, catalog_metadata(item))))
+            stats.add(tokens=tokens)
+        return records
+
+    @staticmethod
+    def _upsert_batches(records: List[Tuple[Dict[str, Any], Tuple]]) -> Iterator[List[Tuple[Dict[str, Any], Tuple]]]:
+        """Split records into upsert requests within the vector count and payload size limits"""
+        batch, batch_bytes = [], 0
+        for record in records:
+            vid, values, metadata = record[1]
+            size = len(json.dumps({'id': vid, 'values': values, 'metadata': metadata}, default=str))
+            if batch and (len(batch) >= Config.INGEST_UPSERT_BATCH or batch_bytes + size > Config.INGEST_UPSERT_MAX_BYTES):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(record)
+            batch_bytes += size
+        if batch:
+            yield batch
+
+    def _upsert_worker(
+        self,
+        upsert_queue: queue.Queue,
+        stats: IngestStats,
+        on_stored: Optional[Callable[[List[Dict[str, Any]]], None]]
+    ):
+        try:
+            while True:
+                batch = upsert_queue.get()
+                if batch is _DONE:
+                    return
+                stats.add(upsert_requests=1)
+                try:
+                    self._upsert([vector for _, vector in batch])
+                    stored = [item for item, _ in batch]
+                except Exception as e:
+                    if len(batch) == 1:
+                        logger.error(f"Failed to store item {batch[0][0]['id']}: {str(e)}")
+                        stats.add(failed=1)
+                        continue
+                    logger.warning(f"Upsert of {len(batch)} vectors failed, retrying one at a time: {str(e)}")
+                    stored = self._upsert_individually(batch, stats)
+                if not stored:
+                    continue
+                if self._record_stored(stored, on_stored):
+                    stats.add(stored=len(stored))
+                    logger.info(f"Stored {len(stored)} items in {Config.VECTOR_BACKEND} index")
+                else:
+                    stats.add(failed=len(stored))
+        except Exception as e:
+            logger.error(f"Upsert worker stopped: {str(e)}")
+            _drain(upsert_queue, stats)
+
+    def _record_stored(
+        self,
+        stored: List[Dict[str, Any]],
+        on_stored: Optional[Callable[[List[Dict[str, Any]]], None]]
+    ) -> bool:
+        """Index upserted items for BM25 and hand them to on_stored; False (logged) if that failed"""
+        try:
+            with self._lock:
+                for item in stored:
+                    self.bm25.add(item['id'], product_text(item))
+                if on_stored is not None:
+                    on_stored(stored)
+            return True
+        except Exception as e:
+            logger.error(f"Upserted {len(stored)} items but failed to record them: {str(e)}")
+            return False
+
+    def _upsert_individually(self, batch: List[Tuple[Dict[str, Any], Tuple]], stats: IngestStats) -> List[Dict[str, Any]]:
+        stored = []
+        for item, vector in batch:
+            try:
+                self._upsert([vector])
+                stored.append(item)
+            except Exception as e:
+                logger.error(f"Failed to store item {item['id']}: {str(e)}")
+                stats.add(failed=1)
+            stats.add(retried=1, upsert_requests=1)
+        return stored
+
+
+def _drain(work_queue: queue.Queue, stats: IngestStats):
+    """Consume a dead worker's queue up to its _DONE, so the stage feeding it never blocks on a full queue"""
+    while True:
+        batch = work_queue.get()
+        if batch is _DONE:
+            return
+        stats.add(failed=len(batch))
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Sync processed cheese products into the vector index")
+    parser.add_argument("--input", default=Config.CATALOG_PATH, help="processed products (.jsonl or .json)")
+    parser.add_argument("--manifest", default=Config.INGEST_MANIFEST_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="print the planned changes without sending anything")
+    parser.add_argument("--full", action="store_true", help="re-embed and upsert every product")
+    parser.add_argument("--force", action="store_true", help="allow deleting more than INGEST_MAX_DELETE_FRACTION of the products")
+    parser.add_argument("--journal", default=Config.JOB_JOURNAL_PATH, help="job journal to resume from ('' to run without one)")
+    args = parser.parse_args()
     try:
-        # Load processed data
-        with open('data/processed_cheese_products.json', 'r', encoding='utf-8') as f:
-            processed_data = json.load(f)
-        
-        # Initialize ingestor and ingest data
+        manifest = IngestManifest(args.manifest)
+        if args.dry_run:
+            print(manifest.diff(read_records(args.input), full=args.full).describe())
+            return
+
+        # Initialize ingestor and stream the processed data through, sending what changed since the last run
         ingestor = PineconeIngestor()
-        ingestor.ingest_data(processed_data)
-        
+        journal = JobJournal('ingest', args.journal) if args.journal else None
+        ingestor.sync(read_records(args.input), manifest, full=args.full, force=args.force, journal=journal)
+
     except Exception as e:
         logger.error(f"Error in main: {str(e)}")
         return
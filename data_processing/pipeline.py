@@ -0,0 +1,98 @@
+import argparse
+import logging
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+from utils.config import Config
+from utils.job_journal import JobJournal
+from utils.jsonl import buffered, read_records, tee_jsonl
+from data_processing.process_data import DataProcessor, iter_mapped
+from data_processing.pinecone.manifest import IngestManifest
+from data_processing.pinecone.pinecone import PineconeIngestor
+
+logger = logging.getLogger(__name__)
+
+
+def run_pipeline(
+    source: Iterable[Dict[str, Any]],
+    raw_out: Optional[str] = None,
+    processed_out: Optional[str] = None,
+    ingest: bool = True,
+    manifest: Optional[IngestManifest] = None,
+    full: bool = False,
+    force: bool = False,
+    journal_path: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Stream scraped products through field mapping, description generation,
+    embedding and upserting, each record moving on as soon as its stage is
+    done with it.
+
+    Every stage runs in its own thread(s) with a queue of at most
+    PIPELINE_QUEUE_SIZE records in front of the next, so a slow stage holds
+    back the ones feeding it instead of the records piling up in memory.
+    raw_out and processed_out keep a JSONL copy of what passed through each
+    point, from which the later stages can be re-run on their own. With a
+    journal_path, descriptions and upserts are journaled (the 'describe' and
+    'ingest' jobs), so an interrupted run picks up where it stopped. Returns
+    the sync summary, or just the processed count without ingest.
+    """
+    describe_journal = JobJournal('describe', journal_path) if journal_path else None
+    raw = buffered(source, name="scrape")
+    if raw_out:
+        raw = tee_jsonl(raw, raw_out)
+    processed = buffered(DataProcessor().iter_process(iter_mapped(raw), journal=describe_journal), name="describe")
+    if processed_out:
+        processed = tee_jsonl(processed, processed_out)
+    if not ingest:
+        summary = {'processed': sum(1 for _ in processed), 'complete': True}
+    else:
+        ingest_journal = JobJournal('ingest', journal_path) if journal_path else None
+        summary = PineconeIngestor().sync(processed, manifest, full=full, force=force, journal=ingest_journal)
+    # The descriptions are kept until everything downstream of them is saved
+    if describe_journal is not None and summary['complete']:
+        describe_journal.finish()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape, process and ingest cheese products as one streaming pipeline")
+    parser.add_argument("--input", help="read scraped products from this file (.jsonl or .json) instead of scraping")
+    parser.add_argument("--raw-out", help="keep the scraped products here (default SCRAPE_PATH when scraping)")
+    parser.add_argument("--processed-out", default=Config.CATALOG_PATH, help="keep the processed products here ('' for none)")
+    parser.add_argument("--manifest", default=Config.INGEST_MANIFEST_PATH)
+    parser.add_argument("--journal", default=Config.JOB_JOURNAL_PATH, help="job journal to resume from ('' to run without one)")
+    parser.add_argument("--no-ingest", action="store_true", help="stop after processing")
+    parser.add_argument("--full", action="store_true", help="re-embed and upsert every product")
+    parser.add_argument("--force", action="store_true", help="allow deleting more than INGEST_MAX_DELETE_FRACTION of the products")
+    args = parser.parse_args()
+    try:
+        if args.input:
+            source, raw_out = read_records(args.input), args.raw_out
+        else:
+            # Selenium is only needed when scraping
+            from data_processing.scrapying.cheese_scraper import iter_cheese_department
+            source, raw_out = iter_cheese_department(), args.raw_out or Config.SCRAPE_PATH
+
+        summary = run_pipeline(
+            source,
+            raw_out=raw_out,
+            processed_out=args.processed_out or None,
+            ingest=not args.no_ingest,
+            manifest=IngestManifest(args.manifest),
+            full=args.full,
+            force=args.force,
+            journal_path=args.journal or None
+        )
+        logger.info(f"Pipeline finished: {summary}")
+    except Exception as e:
+        logger.error(f"Error in main: {str(e)}")
+        return
+
+if __name__ == "__main__":
+    main()
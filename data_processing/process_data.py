@@ -1,9 +1,10 @@
-import json
+import argparse
 import hashlib
-from typing import List, Dict, Any
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 import logging
 from datetime import datetime
-import os
 import requests
 from openai import OpenAI
 import base64
@@ -18,16 +19,83 @@ project_root = str(Path(__file__).parent.parent)
 sys.path.append(project_root)
 
 from utils.config import Config
+from utils.job_journal import JobJournal
+from utils.jsonl import read_records, write_jsonl
+from utils.resilience import get_upstream
 
 logger = logging.getLogger(__name__)
 
+
+def parse_amount(text: Any) -> float:
+    """Number in a scraped price string such as "$12.50" or "$4.99/lb", 0.00 when there is none"""
+    if not text or text == 'N/A':
+        return 0.00
+    try:
+        cleaned = ''.join(c for c in str(text) if c.isdigit() or c == '.')
+        return round(float(cleaned) if cleaned else 0.00, 2)
+    except (ValueError, TypeError):
+        return 0.00
+
+
+def map_product(product: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Map a scraped product onto the processing input layout; None for entries without a cheese type"""
+    if product.get('cheese_type') == 'N/A':
+        return None
+    price_per_lb_value = parse_amount(product.get('price_per_lb', ''))
+    price_value = parse_amount(product.get('price', ''))
+
+    # Extract numerical each count of each case
+    case_count = 1  # Default value
+    if 'count' in product and isinstance(product['count'], dict):
+        if 'case' in product['count'] and isinstance(product['count']['case'], dict):
+            if 'count' in product['count']['case']:
+                try:
+                    count_str = ''.join(c for c in product['count']['case']['count'] if c.isdigit() or c == '.')
+                    case_count = int(count_str)
+                except (ValueError, TypeError):
+                    case_count = 1
+
+    # Extract numerical each product weight of each
+    lb_per_each = 0.00
+    if price_per_lb_value > 0:  # Avoid division by zero
+        lb_per_each = round(price_value / price_per_lb_value, 2)
+
+    return {
+        'image_url': product.get('image_url', ''),
+        'metadata': {
+            'cheese_type': product.get('cheese_type', ''),
+            'source_url': product.get('product_url', ''),
+            'brand': product.get('brand', ''),
+            'cheese_form': product.get('cheese_form', ''),
+            'sku': int(product.get('sku', 0)),
+            'upc': int(product.get('upc', 0)),
+            'price_per_lb': price_per_lb_value,
+            'price_each': price_value,
+            'lb_per_each': lb_per_each,
+            'case': case_count if case_count != 1 else 'No'
+        }
+    }
+
+
+def iter_mapped(products: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """map_product over a stream of scraped products, skipping entries that cannot be mapped"""
+    for product in products:
+        try:
+            mapped = map_product(product)
+        except Exception as e:
+            logger.error(f"Error mapping product {product.get('product_url', '')}: {str(e)}")
+            continue
+        if mapped is not None:
+            yield mapped
+
+
 class DataProcessor:
     def __init__(self):
         self.required_fields = ['name', 'description']
         # Use API key from config
         if not Config.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY is not set in config.py")
-        self.client = OpenAI(api_key=Config.OPENAI_API_KEY)  # Initialize OpenAI client with API key
+        self.client = OpenAI(api_key=Config.OPENAI_API_KEY, base_url=Config.OPENAI_BASE_URL, max_retries=0)  # Initialize OpenAI client with API key (retries are left to get_upstream)
 
     def clean_image_url(self, image_url: str) -> str:
         """Clean Kimelo shop image URL to get the actual image URL"""
@@ -51,63 +119,68 @@ class DataProcessor:
     def generate_smart_description(self, image_url: str, metadata: Dict[str, Any]) -> str:
         """Generate a smart description using OpenAI's GPT-4 Vision"""
         try:
-            # Check if API key is set
-            if not Config.OPENAI_API_KEY:
-                logger.error("OPENAI_API_KEY is not set in config.py")
-                return ""
+            return self.describe_image(image_url, metadata)
+        except Exception as e:
+            logger.error(f"Error generating smart description: {str(e)}")
+            return ""
 
-            # Clean the image URL
-            clean_url = self.clean_image_url(image_url)
-            print(clean_url)
-            if not clean_url:
-                logger.warning("No valid image URL provided")
-                return ""
+    def describe_image(self, image_url: str, metadata: Dict[str, Any]) -> str:
+        """generate_smart_description that raises when the description request fails"""
+        # Check if API key is set
+        if not Config.OPENAI_API_KEY:
+            logger.error("OPENAI_API_KEY is not set in config.py")
+            return ""
 
-            # Prepare metadata context
-            metadata_context = f"""
-            Product Details:
-            - cheese type: {metadata.get('cheese_type', 'Unknown')}
-            - cheese form: {metadata.get('cheese_form', 'Unknown')}
-            - sku: {metadata.get('sku', 'Unknown')}
-            - upc: {metadata.get('upc', 'Unknown')}
-            - brand: {metadata.get('brand', 'Unknown')}
-            - Price per one: ${metadata.get('price_each', 0):.2f}
-            - Price per lb: ${metadata.get('price_per_lb', 0):.2f}
-            - lb per one: ${metadata.get('lb_per_each', 0):.2f}
-            """
-
-            # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a cheese expert. Analyze the cheese image and provided metadata to create a detailed, professional description. Focus on the cheese's appearance, texture, and characteristics. Include information about its origin and typical uses."
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"Please analyze this cheese image and create a detailed description. Here's the product information: {metadata_context}"
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": clean_url
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=300
-            )
+        # Clean the image URL
+        clean_url = self.clean_image_url(image_url)
+        print(clean_url)
+        if not clean_url:
+            logger.warning("No valid image URL provided")
+            return ""
 
-            return response.choices[0].message.content
+        # Prepare metadata context
+        metadata_context = f"""
+        Product Details:
+        - cheese type: {metadata.get('cheese_type', 'Unknown')}
+        - cheese form: {metadata.get('cheese_form', 'Unknown')}
+        - sku: {metadata.get('sku', 'Unknown')}
+        - upc: {metadata.get('upc', 'Unknown')}
+        - brand: {metadata.get('brand', 'Unknown')}
+        - Price per one: ${metadata.get('price_each', 0):.2f}
+        - Price per lb: ${metadata.get('price_per_lb', 0):.2f}
+        - lb per one: ${metadata.get('lb_per_each', 0):.2f}
+        """
 
-        except Exception as e:
-            logger.error(f"Error generating smart description: {str(e)}")
-            return ""
+        # Call OpenAI API
+        response = get_upstream('openai').call(
+            'description',
+            self.client.chat.completions.create,
+            model="gpt-4.1-mini",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You are a cheese expert. Analyze the cheese image and provided metadata to create a detailed, professional description. Focus on the cheese's appearance, texture, and characteristics. Include information about its origin and typical uses."
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": f"Please analyze this cheese image and create a detailed description. Here's the product information: {metadata_context}"
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": clean_url
+                            }
+                        }
+                    ]
+                }
+            ],
+            max_tokens=300
+        )
+
+        return response.choices[0].message.content
 
     def generate_id(self, item: Dict[str, Any]) -> str:
         """Generate a unique ID for a product based on its key attributes"""
@@ -122,8 +195,8 @@ class DataProcessor:
         # Remove extra whitespace and normalize
         return " ".join(text.split())
 
-    def process_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
-        """Process a single product item"""
+    def process_item(self, item: Dict[str, Any], raise_errors: bool = False) -> Dict[str, Any]:
+        """Process a single product item; with raise_errors a failure, a failed description included, raises"""
         try:
             # Ensure item is a dictionary
             if not isinstance(item, dict):
@@ -162,7 +235,8 @@ class DataProcessor:
             
             # Generate smart description
             if processed_item['image_url'] and processed_item['image_url'] != 'N/A':
-                processed_item['description'] = self.generate_smart_description(
+                describe = self.describe_image if raise_errors else self.generate_smart_description
+                processed_item['description'] = describe(
                     processed_item['image_url'],
                     processed_item['metadata']
                 )
@@ -171,134 +245,110 @@ class DataProcessor:
             processed_item['processed_at'] = datetime.utcnow().isoformat()
             
             return processed_item
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error(f"Error processing item: {str(e)}")
+            return None
+
+    def iter_process(
+        self,
+        items: Iterable[Dict[str, Any]],
+        workers: int = Config.DESCRIPTION_WORKERS,
+        journal: Optional[JobJournal] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        process_item over a stream, generating up to `workers` descriptions at
+        once. Items are yielded in input order; at most 2 x workers are in
+        flight, so a slow consumer holds back reading. Failed items are skipped.
+
+        With a journal, each item's result is recorded as soon as it is
+        processed and replayed on a re-run instead of being described again;
+        items that keep failing are quarantined. The caller finishes the
+        journal once the results are saved.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='describe') as pool:
+            pending = deque()
+            for item in items:
+                pending.append(self._submit(pool, item, journal))
+                if len(pending) >= 2 * max(1, workers):
+                    processed_item = pending.popleft().result()
+                    if processed_item:
+                        yield processed_item
+            while pending:
+                processed_item = pending.popleft().result()
+                if processed_item:
+                    yield processed_item
+
+    def _submit(self, pool: ThreadPoolExecutor, item: Dict[str, Any], journal: Optional[JobJournal]) -> Future:
+        if journal is None:
+            return pool.submit(self.process_item, item)
+        key = journal.key(item)
+        entry = journal.lookup([key]).get(key)
+        replayed: Future = Future()
+        if entry is not None and entry.status == 'done':
+            replayed.set_result(entry.result)
+            return replayed
+        if not journal.begin([key]):
+            logger.warning(f"Skipping quarantined item {item.get('metadata', {}).get('source_url', key)}")
+            replayed.set_result(None)
+            return replayed
+        return pool.submit(self._process_journaled, item, key, journal)
+
+    def _process_journaled(self, item: Dict[str, Any], key: str, journal: JobJournal) -> Optional[Dict[str, Any]]:
+        try:
+            processed_item = self.process_item(item, raise_errors=True)
+            if not processed_item:
+                raise ValueError("item is not a product record")
         except Exception as e:
             logger.error(f"Error processing item: {str(e)}")
+            journal.failed([key], str(e))
             return None
+        journal.done([key], [processed_item])
+        return processed_item
 
-    def process_data(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def process_data(self, data: List[Dict[str, Any]], journal: Optional[JobJournal] = None) -> List[Dict[str, Any]]:
         """Process a list of product items"""
-        processed_items = []
-        
         # Ensure data is a list
         if not isinstance(data, list):
             logger.error(f"Input data is not a list: {type(data)}")
-            return processed_items
-        
-        for item in data:
-            processed_item = self.process_item(item)
-            if processed_item:
-                processed_items.append(processed_item)
-        
+            return []
+
+        processed_items = list(self.iter_process(data, journal=journal))
         logger.info(f"Processed {len(processed_items)} items successfully")
         return processed_items
 
-    def save_processed_data(self, data: List[Dict[str, Any]], output_file: str):
-        """Save processed data to JSON file"""
+    def save_processed_data(self, data: Iterable[Dict[str, Any]], output_file: str) -> bool:
+        """Save processed data as JSONL, or as a JSON list for a .json path; returns whether it was saved"""
         try:
-            # Create data directory if it doesn't exist
-            os.makedirs(os.path.dirname(output_file), exist_ok=True)
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            logger.info(f"Saved processed data to {output_file}")
+            count = write_jsonl(data, output_file)
+            logger.info(f"Saved {count} processed items to {output_file}")
+            return True
         except Exception as e:
             logger.error(f"Error saving processed data: {str(e)}")
+            return False
 
 def main():
+    parser = argparse.ArgumentParser(description="Map scraped products and generate their descriptions")
+    parser.add_argument("--input", default=Config.SCRAPE_PATH, help="scraped products (.jsonl or .json)")
+    parser.add_argument("--output", default=Config.CATALOG_PATH, help="processed products, the catalog ingestion and the app read")
+    parser.add_argument("--journal", default=Config.JOB_JOURNAL_PATH, help="job journal to resume from ('' to run without one)")
+    args = parser.parse_args()
     try:
         # Check for OpenAI API key before proceeding
         if not Config.OPENAI_API_KEY:
             logger.error("OPENAI_API_KEY is not set in config.py")
             return
 
-        # Example usage
+        # Records are streamed from the input through mapping and description generation into the output
         processor = DataProcessor()
-        
-        # Load scraped data
-        try:
-            with open('data/cheese_products.json', 'r', encoding='utf-8') as f:
-                raw_data = json.load(f)
-                
-            # Extract the products array from the wrapper structure
-            if isinstance(raw_data, dict) and 'products' in raw_data:
-                products = raw_data['products']
-                logger.info(f"Found {len(products)} products in raw data")
-            else:
-                logger.error("Invalid data structure: missing 'products' array")
-                return
-                
-            # Map the fields to match the expected structure
-            mapped_products = []
-            for product in products:
-                if product.get('cheese_type') != 'N/A':  # Skip N/A entries
-                    # Extract numerical price per lb value
-                    price_per_lb_str = product.get('price_per_lb', '')
-                    price_per_lb_value = 0.00
-                    if price_per_lb_str != 'N/A':
-                        try:
-                            # Remove currency symbol and /lb, then convert to float
-                            cleaned = ''.join(c for c in price_per_lb_str if c.isdigit() or c == '.')
-                            price_per_lb_value = round(float(cleaned) if cleaned else 0.00, 2)
-                        except (ValueError, TypeError):
-                            price_per_lb_value = 0.00
-
-                    # Extract numerical price value
-                    price_str = product.get('price', '')
-                    price_value = 0.00
-                    if price_str != 'N/A':
-                        try:
-                            # Remove currency symbol and convert to float
-                            cleaned = ''.join(c for c in price_str if c.isdigit() or c == '.')
-                            price_value = round(float(cleaned) if cleaned else 0.00, 2)
-                        except (ValueError, TypeError):
-                            price_value = 0.00
-
-                    # Extract numerical each count of each case
-                    case_count = 1  # Default value
-                    if 'count' in product and isinstance(product['count'], dict):
-                        if 'case' in product['count'] and isinstance(product['count']['case'], dict):
-                            if 'count' in product['count']['case']:
-                                try:
-                                    count_str = ''.join(c for c in product['count']['case']['count'] if c.isdigit() or c == '.')
-                                    case_count = int(count_str)
-                                except (ValueError, TypeError):
-                                    case_count = 1
-
-                    # Extract numerical each product weight of each
-                    lb_per_each = 0.00
-                    if price_per_lb_value > 0:  # Avoid division by zero
-                        lb_per_each = round(price_value / price_per_lb_value, 2)
-
-                    mapped_product = {
-                        'image_url': product.get('image_url', ''),
-                        'metadata': {
-                            'cheese_type': product.get('cheese_type', ''),
-                            'source_url': product.get('product_url', ''),
-                            'brand': product.get('brand', ''),
-                            'cheese_form': product.get('cheese_form', ''),
-                            'sku': int(product.get('sku', 0)),
-                            'upc': int(product.get('upc', 0)),
-                            'price_per_lb': price_per_lb_value,
-                            'price_each': price_value,
-                            'lb_per_each': lb_per_each,
-                            'case': case_count if case_count != 1 else 'No'
-                        }
-                    }
-                    mapped_products.append(mapped_product)
-            
-            logger.info(f"Mapped {len(mapped_products)} valid products")
-        except Exception as e:
-            logger.error(f"Error loading raw data: {str(e)}")
-            return
-        
-        # Process data
-        processed_data = processor.process_data(mapped_products)
-        
-        # Save processed data
-        processor.save_processed_data(processed_data, 'data/processed_cheese_products1.json')
+        journal = JobJournal('describe', args.journal) if args.journal else None
+        processed = processor.iter_process(iter_mapped(read_records(args.input)), journal=journal)
+        if processor.save_processed_data(processed, args.output) and journal is not None:
+            journal.finish()
     except Exception as e:
         logger.error(f"Error in main: {str(e)}")
         return
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,9 +1,11 @@
 import requests
 from bs4 import BeautifulSoup
-import json
 from datetime import datetime
 import time
 import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -11,6 +13,13 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 
+# Add project root to Python path
+project_root = str(Path(__file__).parent.parent.parent)
+sys.path.append(project_root)
+
+from utils.config import Config
+from utils.jsonl import read_records, write_jsonl
+
 def scrape_product_details(product_url):
     # Set up Chrome options
     chrome_options = Options()
@@ -97,10 +106,10 @@ def scrape_product_details(product_url):
     finally:
         driver.quit()
 
-def scrape_cheese_department():
+def iter_cheese_department() -> Iterator[Dict[str, Any]]:
+    """Yield each cheese product as soon as its card and detail page are scraped"""
     base_url = "https://shop.kimelo.com/department/cheese/3365"
     current_page = 1
-    all_cheese_products = []
     
     # Set up Chrome options
     chrome_options = Options()
@@ -160,9 +169,10 @@ def scrape_cheese_department():
                                 details = scrape_product_details(product_url)
                                 product_data.update(details)
                                 time.sleep(1)  # Be nice to the server between product detail requests
+                            product_data['scraped_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                             print(product_data)
-                            all_cheese_products.append(product_data)
                             cnt += 1
+                            yield product_data
                         
                     except Exception as e:
                         print(f"Error processing card on page {current_page}: {e}")
@@ -185,29 +195,19 @@ def scrape_cheese_department():
     
     finally:
         driver.quit()
-    
-    output_data = {
-        'scraped_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'total_products': len(all_cheese_products),
-        'total_pages': current_page - 1,
-        'products': all_cheese_products
-    }
-    
-    with open('cheese_products.json', 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, indent=4, ensure_ascii=False)
-        
-    print(f"\nSuccessfully scraped {len(all_cheese_products)} products from {current_page - 1} pages and saved to cheese_products.json")
-    return output_data
 
-def download_product_images(products_data):
-    if not products_data or 'products' not in products_data:
-        return
-    
+def scrape_cheese_department(output_file: str = Config.SCRAPE_PATH) -> int:
+    """Scrape the cheese department into a JSONL file (a JSON list for a .json path); returns the product count"""
+    count = write_jsonl(iter_cheese_department(), output_file)
+    print(f"\nSuccessfully scraped {count} products and saved to {output_file}")
+    return count
+
+def download_product_images(products: Iterable[Dict[str, Any]]):
     if not os.path.exists('images'):
         os.makedirs('images')
     
-    for idx, product in enumerate(products_data['products']):
-        if product['image_url'] != 'N/A':
+    for product in products:
+        if product.get('image_url', 'N/A') != 'N/A':
             try:
                 response = requests.get(product['image_url'])
                 if response.status_code == 200:
@@ -226,6 +226,7 @@ def download_product_images(products_data):
                 print(f"Error downloading image for {product['cheese_type']}: {e}")
 
 if __name__ == "__main__":
-    products_data = scrape_cheese_department()
-    if products_data:
-        download_product_images(products_data) 
\ No newline at end of file
+    output_file = Config.SCRAPE_PATH
+    if scrape_cheese_department(output_file):
+        download_product_images(read_records(output_file))
+ 
\ No newline at end of file
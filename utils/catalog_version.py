@@ -0,0 +1,39 @@
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_cached: Optional[Tuple[float, str]] = None
+
+
+def get_catalog_version(path: str = Config.CATALOG_VERSION_PATH) -> str:
+    """Current catalog version stamp; re-read only when the stamp file changes"""
+    global _cached
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return "unversioned"
+    with _lock:
+        if _cached is None or _cached[0] != mtime:
+            with open(path, 'r', encoding='utf-8') as f:
+                _cached = (mtime, f.read().strip())
+        return _cached[1]
+
+
+def bump_catalog_version(path: str = Config.CATALOG_VERSION_PATH) -> str:
+    """Write a new version stamp; called after ingestion changes the index"""
+    version = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    logger.info(f"Catalog version bumped to {version}")
+    return version
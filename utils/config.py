@@ -1,19 +1,26 @@
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 from typing import Dict, Any
 
 # Load environment variables from .env file
 load_dotenv()
 
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
 class Config:
     # OpenAI Configuration
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+    # Alternative API endpoint, e.g. the stand-in started by benchmarks/fake_services.py (None uses api.openai.com)
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
 
     # Pinecone Configuration
     PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
     PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT", "gcp-starter")
     PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "cheese-knowledge")
+    # Data-plane host of the index; when set the control-plane lookup by name is skipped
+    PINECONE_HOST = os.getenv("PINECONE_HOST") or None
 
     # Scraping Configuration
     SCRAPING_URL = "https://shop.kimelo.com/department/cheese/3365"
@@ -22,11 +29,129 @@ class Config:
     # Vector Database Configuration
     VECTOR_DIMENSION = 1536  # OpenAI embedding dimension
     VECTOR_METRIC = "cosine"
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    # "pinecone" queries the hosted index, "local" serves an in-process NumPy index
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+    LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", str(PROJECT_ROOT / "data_processing" / "database" / "local_index.npz"))
+    # Embedding cache (an empty path keeps it in memory only)
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", str(PROJECT_ROOT / ".cache" / "embeddings.sqlite3"))
+    EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "4096"))
+    EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    CATALOG_VERSION_PATH = os.getenv("CATALOG_VERSION_PATH", str(PROJECT_ROOT / ".cache" / "catalog_version"))
+    BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", str(PROJECT_ROOT / "data_processing" / "database" / "bm25_index.npz"))
+    CATALOG_PATH = os.getenv("CATALOG_PATH", str(PROJECT_ROOT / "data_processing" / "database" / "processed_cheese_products.json"))
+    # Scraped products, the input of processing; processing writes CATALOG_PATH, which ingestion and the app read
+    SCRAPE_PATH = os.getenv("SCRAPE_PATH", str(PROJECT_ROOT / "data_processing" / "database" / "cheese_products.json"))
 
     # RAG Configuration
     TOP_K_RESULTS = int(os.getenv('TOP_K_RESULTS', '20'))
     CHUNK_SIZE = 1000  # size of text chunks for embedding
     CHUNK_OVERLAP = 200  # overlap between chunks
+    # Queries per embedding request and search batch in VectorStore.query_products_batch
+    BATCH_QUERY_SIZE = int(os.getenv("BATCH_QUERY_SIZE", "256"))
+    # Ingestion pipeline: texts (and tokens) per embedding request, vectors and bytes per upsert request
+    INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "256"))
+    INGEST_EMBED_MAX_TOKENS = int(os.getenv("INGEST_EMBED_MAX_TOKENS", "250000"))
+    INGEST_UPSERT_BATCH = int(os.getenv("INGEST_UPSERT_BATCH", "100"))
+    INGEST_UPSERT_MAX_BYTES = int(os.getenv("INGEST_UPSERT_MAX_BYTES", str(2 * 1024 * 1024)))  # Pinecone request limit
+    INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+    INGEST_UPSERT_WORKERS = int(os.getenv("INGEST_UPSERT_WORKERS", "4"))
+    # Batches waiting between pipeline stages before the stage feeding them blocks
+    INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+    # A partial embedding batch is sent once it is this old, so a slow producer's items do not wait for a full batch
+    INGEST_BATCH_LINGER_SECONDS = float(os.getenv("INGEST_BATCH_LINGER_SECONDS", "1.0"))
+    # Records buffered between stages of the streaming scrape -> process -> ingest pipeline
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "64"))
+    # Product descriptions generated concurrently while processing
+    DESCRIPTION_WORKERS = int(os.getenv("DESCRIPTION_WORKERS", "4"))
+    # Hashes of what was last ingested per product, so re-runs only send the differences (one per backend)
+    INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", str(PROJECT_ROOT / ".cache" / f"ingest_manifest_{VECTOR_BACKEND}.json"))
+    # A sync refuses to delete more than this share of the manifest's products unless forced
+    INGEST_MAX_DELETE_FRACTION = float(os.getenv("INGEST_MAX_DELETE_FRACTION", "0.5"))
+    # Per-item progress of processing and ingestion jobs, so an interrupted run resumes ('' disables it)
+    JOB_JOURNAL_PATH = os.getenv("JOB_JOURNAL_PATH", str(PROJECT_ROOT / ".cache" / "jobs.sqlite3"))
+    # Attempts at an item (a run dying during one included) before it is quarantined
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    # Run classification, filter generation and query embedding concurrently
+    CONCURRENT_STAGES = os.getenv("CONCURRENT_STAGES", "false").lower() == "true"
+    # Upper bound on in-flight OpenAI/Pinecone calls per AsyncVectorStore (also its HTTP pool size)
+    ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "32"))
+    # Seconds between lazy health checks of the shared VectorStore
+    RESOURCE_HEALTH_CHECK_SECONDS = float(os.getenv("RESOURCE_HEALTH_CHECK_SECONDS", "300"))
+    # Seconds a replaced shared resource stays open for the sessions still using it
+    RESOURCE_CLOSE_GRACE_SECONDS = float(os.getenv("RESOURCE_CLOSE_GRACE_SECONDS", "120"))
+    # Concurrent identical classification, filter, embedding and vector query calls share one upstream request
+    SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+    # Skip the classification and filter LLM calls when the catalog analyzer is at least this confident (>1 disables)
+    QUERY_ANALYZER_MIN_CONFIDENCE = float(os.getenv("QUERY_ANALYZER_MIN_CONFIDENCE", "0.8"))
+
+    # Hybrid retrieval: BM25 over product text fused with the vector query by reciprocal rank fusion
+    HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "false").lower() == "true"
+    HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+
+    # Maximal marginal relevance: keep a diverse MMR_TOP_N of the TOP_K_RESULTS matches
+    MMR_ENABLED = os.getenv("MMR_ENABLED", "false").lower() == "true"
+    MMR_TOP_N = int(os.getenv("MMR_TOP_N", "8"))
+    MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1 = pure relevance, 0 = pure diversity
+    # Log token and coverage comparison of every MMR selection against the plain top-k
+    MMR_EVAL = os.getenv("MMR_EVAL", "false").lower() == "true"
+
+    # Answer superlative, aggregate and bare numeric questions exactly from the columnar catalog
+    CATALOG_ENGINE_ENABLED = os.getenv("CATALOG_ENGINE_ENABLED", "true").lower() == "true"
+
+    # Answer context: score cutoff (ada-002 cosine), knee detection, dedupe and a token budget
+    CONTEXT_MIN_SCORE = float(os.getenv("CONTEXT_MIN_SCORE", "0.7"))
+    CONTEXT_KNEE_SENSITIVITY = float(os.getenv("CONTEXT_KNEE_SENSITIVITY", "0.3"))  # >1 disables the knee cut
+    CONTEXT_MIN_PRODUCTS = int(os.getenv("CONTEXT_MIN_PRODUCTS", "3"))
+    CONTEXT_DEDUPE_SIMILARITY = float(os.getenv("CONTEXT_DEDUPE_SIMILARITY", "0.9"))  # Jaccard on name/brand/form words
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1200"))
+    CONTEXT_DESCRIPTION_TOKENS = int(os.getenv("CONTEXT_DESCRIPTION_TOKENS", "60"))
+
+    # Conversation memory: verbatim recent turns within a token budget, older turns summarized
+    MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "1500"))
+    MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "4"))  # user/assistant pairs kept verbatim
+    MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "300"))
+
+    # Semantic answer cache
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # cosine similarity
+    ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+    # Logging: records are queued to a background listener and written as JSON lines to LOG_DIR/app.log,
+    # rotated at LOG_ROTATE_WHEN or LOG_MAX_BYTES (an empty LOG_DIR logs to stdout only)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_DIR = os.getenv("LOG_DIR", str(PROJECT_ROOT / "logs"))
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+    LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "14"))
+    # Keep one in N DEBUG records per call site (1 keeps all)
+    LOG_DEBUG_SAMPLE_EVERY = int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", "10"))
+
+    # Tracing: nested spans around upstream calls and counters, exported to Prometheus and a rotating JSONL file
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACE_PATH = os.getenv("TRACE_PATH", str(PROJECT_ROOT / "logs" / "traces.jsonl"))  # empty disables the file
+    TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+    TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", "5"))
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 disables the /metrics endpoint
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+    # Outbound OpenAI/Pinecone calls: a deadline per stage (seconds, "stage=seconds,..."), covering all of its retries
+    UPSTREAM_DEADLINES = os.getenv(
+        "UPSTREAM_DEADLINES",
+        "classification=8,filter_generation=8,rewrite=8,summary=15,embedding=5,vector_query=3,"
+        "generation=30,answer=30,description=60,upsert=30"
+    )
+    UPSTREAM_DEFAULT_DEADLINE = float(os.getenv("UPSTREAM_DEFAULT_DEADLINE", "30"))
+    UPSTREAM_MAX_ATTEMPTS = int(os.getenv("UPSTREAM_MAX_ATTEMPTS", "3"))
+    # Full-jitter exponential backoff between attempts, unless the server sent Retry-After
+    UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.2"))
+    UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "4"))
+    # Send a second copy of an idempotent call (embeddings, vector queries) still pending after this long (0 disables)
+    UPSTREAM_HEDGE_MS = float(os.getenv("UPSTREAM_HEDGE_MS", "0"))
+    # Consecutive timeouts, connection errors, 429s or 5xx that open an upstream's circuit, and how long it stays open
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
 
     # Streamlit Configuration
     STREAMLIT_THEME = {
@@ -36,6 +161,19 @@ class Config:
         "textColor": "#FAFAFA",
         "font": "sans serif"
     }
+    # Streamlit history: the last HISTORY_FULL_TURNS turns render in full, older ones as one-line summaries (0 renders all)
+    HISTORY_FULL_TURNS = int(os.getenv("HISTORY_FULL_TURNS", "3"))
+    # Older turns listed as summaries before a "show earlier" button (0 lists all)
+    HISTORY_SUMMARY_PAGE = int(os.getenv("HISTORY_SUMMARY_PAGE", "10"))
+    PRODUCT_CARDS_PER_PAGE = int(os.getenv("PRODUCT_CARDS_PER_PAGE", "5"))
+    # Product image cache for the Streamlit cards: originals and display-size thumbnails on disk
+    IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", str(PROJECT_ROOT / ".cache" / "images"))
+    IMAGE_THUMBNAIL_WIDTH = int(os.getenv("IMAGE_THUMBNAIL_WIDTH", "400"))
+    IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "5"))
+    IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+    IMAGE_PREFETCH_WORKERS = int(os.getenv("IMAGE_PREFETCH_WORKERS", "8"))
+    # Seconds before an image that failed to download is tried again
+    IMAGE_RETRY_SECONDS = float(os.getenv("IMAGE_RETRY_SECONDS", "300"))
 
     # MySQL settings
     MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
@@ -52,7 +190,7 @@ class Config:
         if not cls.OPENAI_API_KEY:
             missing["OPENAI_API_KEY"] = "Required for OpenAI API access"
 
-        if not cls.PINECONE_API_KEY:
+        if cls.VECTOR_BACKEND == "pinecone" and not cls.PINECONE_API_KEY:
             missing["PINECONE_API_KEY"] = "Required for Pinecone vector database"
 
         # MySQL validation
@@ -73,7 +211,8 @@ class Config:
             "environment": cls.PINECONE_ENVIRONMENT,
             "index_name": cls.PINECONE_INDEX_NAME,
             "dimension": cls.VECTOR_DIMENSION,
-            "metric": cls.VECTOR_METRIC
+            "metric": cls.VECTOR_METRIC,
+            "backend": cls.VECTOR_BACKEND
         }
 
     @classmethod
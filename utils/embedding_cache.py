@@ -0,0 +1,251 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Sequence
+
+from utils.config import Config
+from utils.tracing import count
+
+logger = logging.getLogger(__name__)
+
+# Disk hits note their last_used time in memory; it is written with the next put, or after this many hits
+_TOUCH_FLUSH_ITEMS = 256
+
+
+class EmbeddingCache:
+    """
+    Two-tier content-addressed cache for embeddings.
+
+    Entries are keyed by sha256(model, text). The first tier is an in-memory
+    LRU bounded by entry count; the second is a SQLite table of float32 blobs
+    bounded by total bytes, evicting least-recently-used rows. Pass an empty
+    path to run memory-only. A disk hit is a read only: its last_used time is
+    written in a batch with the next put or eviction, so lookups never wait
+    on a write transaction.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = Config.EMBEDDING_CACHE_PATH,
+        memory_items: int = Config.EMBEDDING_CACHE_MEMORY_ITEMS,
+        max_disk_bytes: int = Config.EMBEDDING_CACHE_MAX_BYTES
+    ):
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = None
+        self._disk_bytes = 0
+        self._touched: Dict[str, float] = {}
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._conn.commit()
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Return a cached embedding or None"""
+        key = self.make_key(model, text)
+        with self._lock:
+            return self._lookup(key)
+
+    def peek(self, model: str, text: str) -> Optional[List[float]]:
+        """Memory-tier lookup only, cheap enough for an event loop; misses are not counted"""
+        key = self.make_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                count('cache_lookups_total', cache='embedding', result='memory_hit')
+            return vector
+
+    def put(self, model: str, text: str, vector: Sequence[float]):
+        """Store an embedding in both tiers"""
+        key = self.make_key(model, text)
+        with self._lock:
+            self._store(key, model, list(vector))
+            self._commit()
+
+    def get_many(
+        self,
+        model: str,
+        texts: Sequence[str],
+        fetch: Callable[[List[str]], List[List[float]]]
+    ) -> List[List[float]]:
+        """
+        Return embeddings for all texts, calling fetch once with the distinct misses.
+
+        fetch receives the uncached texts in order and must return one vector
+        per text; empty vectors are returned to the caller but not cached.
+        """
+        keys = [self.make_key(model, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: "OrderedDict[str, str]" = OrderedDict()
+
+        with self._lock:
+            for pos, key in enumerate(keys):
+                vector = self._lookup(key)
+                if vector is not None:
+                    results[pos] = vector
+                elif key not in missing:
+                    missing[key] = texts[pos]
+
+        if missing:
+            fetched = fetch(list(missing.values()))
+            by_key = dict(zip(missing.keys(), fetched))
+            with self._lock:
+                for key, vector in by_key.items():
+                    if vector:
+                        self._store(key, model, list(vector))
+                self._commit()
+            for pos, key in enumerate(keys):
+                if results[pos] is None:
+                    results[pos] = by_key.get(key) or []
+
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current tier sizes"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_items': len(self._memory),
+                'disk_bytes': self._disk_bytes
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM embeddings")
+                self._conn.commit()
+            self._disk_bytes = 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._flush_touched()
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            count('cache_lookups_total', cache='embedding', result='memory_hit')
+            return vector
+
+        if self._conn is not None:
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._touched[key] = time.time()
+                if len(self._touched) >= _TOUCH_FLUSH_ITEMS:
+                    self._flush_touched()
+                    self._conn.commit()
+                vector = array('f', row[0]).tolist()
+                self._remember(key, vector)
+                self.disk_hits += 1
+                count('cache_lookups_total', cache='embedding', result='disk_hit')
+                return vector
+
+        self.misses += 1
+        count('cache_lookups_total', cache='embedding', result='miss')
+        return None
+
+    def _store(self, key: str, model: str, vector: List[float]):
+        self._remember(key, vector)
+        if self._conn is None:
+            return
+        blob = array('f', vector).tobytes()
+        previous = self._conn.execute("SELECT size FROM embeddings WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, model, blob, len(blob), time.time())
+        )
+        self._disk_bytes += len(blob) - (previous[0] if previous else 0)
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        """Write the pending last_used times of disk hits, in the caller's transaction"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(used, key) for key, used in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _commit(self):
+        if self._conn is None:
+            return
+        # Before eviction, so recently read rows are not taken for unused ones
+        self._flush_touched()
+        if self.max_disk_bytes and self._disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+        self._conn.commit()
+
+    def _evict_disk(self):
+        """Drop least-recently-used rows until the table is back under 90% of its byte budget"""
+        target = int(self.max_disk_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+        logger.info(f"Evicted {len(evicted)} embeddings from disk cache")
+
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide cache shared by retrieval and ingestion"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
@@ -0,0 +1,217 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+from utils.config import Config
+from utils.single_flight import get_single_flight
+from utils.tracing import count, span
+
+logger = logging.getLogger(__name__)
+
+
+class ImageCache:
+    """
+    Content-addressed disk cache of product images and their display-size thumbnails.
+
+    Downloaded originals are stored under originals/ by sha256 of their bytes,
+    so the same picture behind several URLs is kept once, and each one gets a
+    JPEG thumbnail at most `thumbnail_width` pixels wide under thumbs/. A small
+    file per URL under urls/ maps sha256(url) to the content digest. Looking up
+    a cached URL reads only local files; misses are downloaded through one
+    pooled requests.Session, and prefetch() warms the cache from a thread pool.
+    """
+
+    def __init__(
+        self,
+        root: str = Config.IMAGE_CACHE_DIR,
+        thumbnail_width: int = Config.IMAGE_THUMBNAIL_WIDTH,
+        timeout: float = Config.IMAGE_FETCH_TIMEOUT,
+        max_bytes: int = Config.IMAGE_MAX_BYTES,
+        workers: int = Config.IMAGE_PREFETCH_WORKERS,
+        retry_seconds: float = Config.IMAGE_RETRY_SECONDS
+    ):
+        self.root = Path(root)
+        self.thumbnail_width = thumbnail_width
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.retry_seconds = retry_seconds
+        for sub in ('originals', 'thumbs', 'urls'):
+            (self.root / sub).mkdir(parents=True, exist_ok=True)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-prefetch')
+        self.flights = get_single_flight()
+
+        self._lock = threading.Lock()
+        self._thumbnails: Dict[str, str] = {}
+        self._failed: Dict[str, float] = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def url_key(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def cached_thumbnail(self, url: str) -> Optional[str]:
+        """Path of the thumbnail for url if it is already cached, without any network I/O"""
+        with self._lock:
+            path = self._thumbnails.get(url)
+            if path is not None:
+                self.memory_hits += 1
+                count('cache_lookups_total', cache='image', result='memory_hit')
+                return path
+
+        pointer = self.root / 'urls' / self.url_key(url)
+        try:
+            digest = pointer.read_text(encoding='utf-8').strip()
+        except OSError:
+            return None
+        thumb = self._thumbnail_path(digest)
+        if not thumb.exists():
+            original = self.root / 'originals' / digest
+            if not original.exists():
+                return None
+            try:
+                self._write_thumbnail(original.read_bytes(), thumb)
+            except Exception as e:
+                logger.warning(f"Could not rebuild thumbnail for {url}: {str(e)}")
+                return None
+        with self._lock:
+            self._thumbnails[url] = str(thumb)
+            self.disk_hits += 1
+        count('cache_lookups_total', cache='image', result='disk_hit')
+        return str(thumb)
+
+    def thumbnail(self, url: str) -> Optional[str]:
+        """
+        Path of the thumbnail for url, downloading the image on a miss.
+
+        Returns None for empty or "N/A" URLs and for images that could not be
+        fetched or decoded; a failed URL is not tried again for retry_seconds.
+        A miss already being fetched by prefetch() waits for that download.
+        """
+        if not url or url == 'N/A':
+            return None
+        path = self.cached_thumbnail(url)
+        if path is not None:
+            return path
+        with self._lock:
+            failed_at = self._failed.get(url)
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_seconds:
+                return None
+        return self.flights.do('image', url, self._fetch, url)
+
+    def prefetch(self, urls: Iterable[str]) -> List[Future]:
+        """Start downloading the thumbnails for urls in the background"""
+        futures = []
+        for url in dict.fromkeys(urls):
+            if not url or url == 'N/A':
+                continue
+            with self._lock:
+                if url in self._thumbnails:
+                    continue
+            futures.append(self._executor.submit(self.thumbnail, url))
+        return futures
+
+    def prefetch_products(self, products: Iterable[Dict[str, Any]]) -> List[Future]:
+        return self.prefetch(product.get('image_url') for product in products)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'failed': len(self._failed)
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def _fetch(self, url: str) -> Optional[str]:
+        with self._lock:
+            self.misses += 1
+        count('cache_lookups_total', cache='image', result='miss')
+        with span('image.fetch') as fetch_span:
+            try:
+                content = self._download(url)
+                digest = hashlib.sha256(content).hexdigest()
+                original = self.root / 'originals' / digest
+                if not original.exists():
+                    self._atomic_write(original, content)
+                thumb = self._thumbnail_path(digest)
+                if not thumb.exists():
+                    self._write_thumbnail(content, thumb)
+                self._atomic_write(self.root / 'urls' / self.url_key(url), digest.encode('utf-8'))
+                fetch_span.set(bytes=len(content))
+            except Exception as e:
+                logger.warning(f"Error loading image {url}: {str(e)}")
+                with self._lock:
+                    self._failed[url] = time.monotonic()
+                return None
+        with self._lock:
+            self._thumbnails[url] = str(thumb)
+            self._failed.pop(url, None)
+        return str(thumb)
+
+    def _download(self, url: str) -> bytes:
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            chunks, size = [], 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise ValueError(f"image larger than {self.max_bytes} bytes")
+                chunks.append(chunk)
+        return b''.join(chunks)
+
+    def _thumbnail_path(self, digest: str) -> Path:
+        return self.root / 'thumbs' / f"{digest}-{self.thumbnail_width}.jpg"
+
+    def _write_thumbnail(self, content: bytes, path: Path):
+        with Image.open(BytesIO(content)) as image:
+            image.thumbnail((self.thumbnail_width, self.thumbnail_width * 4))
+            if image.mode != 'RGB':
+                # Flatten transparency onto white rather than the black JPEG would give it
+                rgba = image.convert('RGBA')
+                image = Image.new('RGB', rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel('A'))
+            buffer = BytesIO()
+            image.save(buffer, format='JPEG', quality=85, optimize=True)
+        self._atomic_write(path, buffer.getvalue())
+
+    @staticmethod
+    def _atomic_write(path: Path, data: bytes):
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+
+_shared_cache: Optional[ImageCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """Process-wide image cache shared by every Streamlit session"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ImageCache()
+        return _shared_cache
@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job TEXT PRIMARY KEY,
+        runs INTEGER NOT NULL,
+        started_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        finished_at REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS job_items (
+        job TEXT NOT NULL,
+        key TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL,
+        result TEXT,
+        error TEXT,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (job, key)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS job_items_status ON job_items (job, status)",
+)
+STATUSES = ('running', 'done', 'failed', 'quarantined')
+
+
+@dataclass
+class JournalEntry:
+    status: str
+    attempts: int
+    result: Any = None
+    error: Optional[str] = None
+
+
+class JobJournal:
+    """
+    Durable per-item progress of one batch job (say 'describe' or 'ingest') in SQLite.
+
+    Items are identified by a key, normally key() of the item's content.
+    begin() is called before working on items and counts an attempt;
+    done() and failed() record the outcome, each committed at once, so after
+    a crash a re-run replays the results of done items instead of paying for
+    them again. An item whose attempts reach max_attempts is quarantined and
+    skipped until release(); an attempt the process died during counts too,
+    so an item that crashes the run cannot do so forever. finish() is called
+    once the job's output is safely stored: it drops the done items, so the
+    next run starts over, while failed and quarantined items keep their
+    attempts. The journal is in WAL mode, so progress() can be read from
+    another process (python -m utils.job_journal) while a run is going.
+    """
+
+    def __init__(self, job: str, path: str = Config.JOB_JOURNAL_PATH, max_attempts: int = Config.JOB_MAX_ATTEMPTS):
+        self.job = job
+        self.path = path
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Every status change is committed on its own; NORMAL keeps that to a WAL append without an fsync each time
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+
+        now = time.time()
+        row = self._conn.execute("SELECT finished_at FROM jobs WHERE job = ?", (job,)).fetchone()
+        if row is not None and row[0] is None:
+            logger.info(f"Resuming job {job}: {self.progress()}")
+        elif row is None:
+            self._conn.execute("INSERT INTO jobs VALUES (?, 1, ?, ?, NULL)", (job, now, now))
+        else:
+            self._conn.execute(
+                "UPDATE jobs SET runs = runs + 1, started_at = ?, updated_at = ?, finished_at = NULL WHERE job = ?",
+                (now, now, job)
+            )
+        self._conn.commit()
+
+    @staticmethod
+    def key(record: Any) -> str:
+        """Content hash identifying a record across runs"""
+        return hashlib.blake2b(json.dumps(record, sort_keys=True, default=str).encode('utf-8'), digest_size=16).hexdigest()
+
+    def lookup(self, keys: Sequence[str]) -> Dict[str, JournalEntry]:
+        """Entries of the keys the journal knows about"""
+        entries = {}
+        with self._lock:
+            # SQLite limits bound parameters per statement
+            for start in range(0, len(keys), 500):
+                chunk = list(keys[start:start + 500])
+                rows = self._conn.execute(
+                    f"SELECT key, status, attempts, result, error FROM job_items "
+                    f"WHERE job = ? AND key IN ({','.join('?' * len(chunk))})",
+                    [self.job, *chunk]
+                )
+                for key, status, attempts, result, error in rows:
+                    entries[key] = JournalEntry(status, attempts, json.loads(result) if result else None, error)
+        return entries
+
+    def begin(self, keys: Sequence[str]) -> List[str]:
+        """
+        Count an attempt at each key and return the ones to work on: those
+        not done or quarantined. A key whose attempts ran out in an earlier
+        run without a recorded outcome (the process died) is quarantined.
+        """
+        entries = self.lookup(keys)
+        now = time.time()
+        allowed, exhausted = [], []
+        for key in dict.fromkeys(keys):
+            entry = entries.get(key)
+            if entry is not None and entry.status in ('done', 'quarantined'):
+                continue
+            if entry is not None and entry.attempts >= self.max_attempts:
+                exhausted.append(key)
+                continue
+            allowed.append(key)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO job_items (job, key, status, attempts, updated_at) VALUES (?, ?, 'running', 1, ?) "
+                "ON CONFLICT (job, key) DO UPDATE SET status = 'running', attempts = attempts + 1, "
+                "updated_at = excluded.updated_at",
+                [(self.job, key, now) for key in allowed]
+            )
+            self._conn.executemany(
+                "UPDATE job_items SET status = 'quarantined', updated_at = ? WHERE job = ? AND key = ?",
+                [(now, self.job, key) for key in exhausted]
+            )
+            self._touch(now)
+        for key in exhausted:
+            logger.error(f"Quarantined item {key} of job {self.job}: a run ended during each of its attempts")
+        return allowed
+
+    def done(self, keys: Sequence[str], results: Optional[Sequence[Any]] = None):
+        """Record items as done, with the result to replay for each if given"""
+        now = time.time()
+        results = results if results is not None else [None] * len(keys)
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE job_items SET status = 'done', result = ?, error = NULL, updated_at = ? WHERE job = ? AND key = ?",
+                [
+                    (json.dumps(result, default=str) if result is not None else None, now, self.job, key)
+                    for key, result in zip(keys, results)
+                ]
+            )
+            self._touch(now)
+
+    def failed(self, keys: Sequence[str], error: str) -> List[str]:
+        """Record a failed attempt at each key; returns the keys now quarantined"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE job_items SET status = CASE WHEN attempts >= ? THEN 'quarantined' ELSE 'failed' END, "
+                "error = ?, updated_at = ? WHERE job = ? AND key = ?",
+                [(self.max_attempts, error[:1000], now, self.job, key) for key in keys]
+            )
+            self._touch(now)
+        quarantined = [key for key, entry in self.lookup(keys).items() if entry.status == 'quarantined']
+        for key in quarantined:
+            logger.error(f"Quarantined item {key} of job {self.job} after {self.max_attempts} attempts: {error}")
+        return quarantined
+
+    def finish(self):
+        """Mark the run complete: done items are dropped, failed and quarantined ones kept"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM job_items WHERE job = ? AND status = 'done'", (self.job,))
+            self._conn.execute("UPDATE jobs SET updated_at = ?, finished_at = ? WHERE job = ?", (now, now, self.job))
+            self._conn.commit()
+
+    def release(self, keys: Optional[Sequence[str]] = None) -> int:
+        """Let quarantined items (all of them, or the given keys) be tried again; returns how many"""
+        with self._lock:
+            return release_quarantined(self._conn, self.job, keys)
+
+    def quarantined(self) -> Dict[str, str]:
+        """Quarantined keys with the last error of each"""
+        with self._lock:
+            return quarantined_items(self._conn, self.job)
+
+    def progress(self) -> Dict[str, Any]:
+        with self._lock:
+            return job_progress(self._conn, self.job)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _touch(self, now: float):
+        self._conn.execute("UPDATE jobs SET updated_at = ? WHERE job = ?", (now, self.job))
+        self._conn.commit()
+
+
+def job_progress(conn: sqlite3.Connection, job: str) -> Dict[str, Any]:
+    """Item counts per status, attempts and timings of a job"""
+    row = conn.execute("SELECT runs, started_at, updated_at, finished_at FROM jobs WHERE job = ?", (job,)).fetchone()
+    counts = {status: 0 for status in STATUSES}
+    attempts = 0
+    for status, items, tries in conn.execute(
+        "SELECT status, COUNT(*), SUM(attempts) FROM job_items WHERE job = ? GROUP BY status", (job,)
+    ):
+        counts[status] = items
+        attempts += tries or 0
+    progress: Dict[str, Any] = {'job': job, **counts, 'attempts': attempts}
+    if row is not None:
+        runs, started_at, updated_at, finished_at = row
+        elapsed = (finished_at or time.time()) - started_at
+        progress.update({
+            'runs': runs,
+            'state': 'finished' if finished_at else 'in progress',
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started_at)),
+            'idle_seconds': round(time.time() - updated_at, 1),
+            'done_per_sec': round(counts['done'] / elapsed, 2) if elapsed > 0 and not finished_at else None
+        })
+    return progress
+
+
+def quarantined_items(conn: sqlite3.Connection, job: str) -> Dict[str, str]:
+    rows = conn.execute(
+        "SELECT key, error FROM job_items WHERE job = ? AND status = 'quarantined' ORDER BY updated_at", (job,)
+    )
+    return dict(rows.fetchall())
+
+
+def release_quarantined(conn: sqlite3.Connection, job: str, keys: Optional[Sequence[str]] = None) -> int:
+    if keys is None:
+        released = conn.execute(
+            "UPDATE job_items SET status = 'failed', attempts = 0 WHERE job = ? AND status = 'quarantined'", (job,)
+        ).rowcount
+    else:
+        released = sum(
+            conn.execute(
+                "UPDATE job_items SET status = 'failed', attempts = 0 WHERE job = ? AND key = ? AND status = 'quarantined'",
+                (job, key)
+            ).rowcount
+            for key in keys
+        )
+    conn.commit()
+    return released
+
+
+def _job_names(conn: sqlite3.Connection) -> List[str]:
+    return [row[0] for row in conn.execute("SELECT job FROM jobs ORDER BY job")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the progress of processing and ingestion jobs, also while they run")
+    parser.add_argument("jobs", nargs="*", help="job names (default: all)")
+    parser.add_argument("--path", default=Config.JOB_JOURNAL_PATH)
+    parser.add_argument("--quarantined", action="store_true", help="list quarantined items with their last error")
+    parser.add_argument("--release", action="store_true", help="let the quarantined items of the jobs be tried again")
+    args = parser.parse_args()
+    if not Path(args.path).exists():
+        print(f"No job journal at {args.path}")
+        return
+
+    if args.release:
+        conn = sqlite3.connect(args.path)
+        for job in args.jobs or _job_names(conn):
+            print(f"{job}: released {release_quarantined(conn, job)} quarantined items")
+        conn.close()
+        return
+
+    # Read-only, so it never holds up a run writing to the journal
+    conn = sqlite3.connect(f"file:{args.path}?mode=ro", uri=True)
+    jobs = args.jobs or _job_names(conn)
+    for job in jobs:
+        print(json.dumps(job_progress(conn, job)))
+        if args.quarantined:
+            for key, error in quarantined_items(conn, job).items():
+                print(f"  {key}: {error}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Any, Dict, Iterable, Iterator
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a buffered stream
+_END = object()
+
+
+class _Failure:
+    __slots__ = ('error',)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Records of a JSONL file, one per non-blank line; malformed lines are logged and skipped"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Skipping malformed line {number} of {path}: {str(e)}")
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Records of a .jsonl file, streamed, or of a legacy JSON document (a list
+    or a {'products': [...]} wrapper), which has to be loaded whole.
+    """
+    if path.endswith('.jsonl'):
+        yield from read_jsonl(path)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict) and 'products' in data:
+        data = data['products']
+    if not isinstance(data, list):
+        raise ValueError(f"{path} holds neither a list of records nor a {{'products': [...]}} wrapper")
+    yield from data
+
+
+def tee_jsonl(records: Iterable[Dict[str, Any]], path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Pass records through while appending each to a JSONL file, or to a JSON
+    list for a .json path, the layout read_records expects of each. The file
+    is written under a temporary name and only renamed to path once the
+    records are exhausted, so an interrupted run never leaves a truncated
+    file that looks complete.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    as_list = path.endswith('.json')
+    tmp = f"{path}.partial"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        if as_list:
+            f.write("[")
+        for written, record in enumerate(records):
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            f.write((",\n" if written else "\n") + line if as_list else line + "\n")
+            yield record
+        if as_list:
+            f.write("\n]\n")
+    os.replace(tmp, path)
+
+
+def write_jsonl(records: Iterable[Dict[str, Any]], path: str) -> int:
+    """Stream records into a JSONL file; returns how many were written"""
+    written = 0
+    for _ in tee_jsonl(records, path):
+        written += 1
+    return written
+
+
+def buffered(records: Iterable[Any], maxsize: int = Config.PIPELINE_QUEUE_SIZE, name: str = "stage") -> Iterator[Any]:
+    """
+    Run an iterator in a background thread, handing its items over through a
+    queue of at most maxsize, so a pipeline stage keeps producing while the
+    next one works and blocks once it is maxsize items ahead. An exception
+    in the producer is raised in the consumer; closing the consumer stops
+    the producer at its next item.
+    """
+    handoff: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def offer(value: Any) -> bool:
+        while not stop.is_set():
+            try:
+                handoff.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for record in records:
+                if not offer(record):
+                    return
+            offer(_END)
+        except BaseException as e:
+            offer(_Failure(e))
+
+    thread = threading.Thread(target=produce, name=f"pipeline-{name}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            value = handoff.get()
+            if value is _END:
+                return
+            if isinstance(value, _Failure):
+                raise value.error
+            yield value
+    finally:
+        stop.set()
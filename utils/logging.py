@@ -1,48 +1,208 @@
+import atexit
+import contextvars
+import json
 import logging
-import sys
-from datetime import datetime
 import os
+import queue
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from typing import Any, Dict, Optional, Union
+
+from utils.config import Config
+from utils.tracing import current_span
+
+# request_id / session_id of the work running in this thread or task
+_log_context: "contextvars.ContextVar[Dict[str, str]]" = contextvars.ContextVar("log_context", default={})
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is emitted as a JSON field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id', 'session_id', 'trace_id', 'sampled_every'}
+# Log arguments of these types cannot change after the call, so formatting them can wait for the listener
+_IMMUTABLE_ARGS = (str, int, float, bool, type(None), bytes)
+
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def log_context(**ids: str):
+    """Stamp request_id, session_id, ... on every record logged inside the block (and in tasks or bound threads it starts)"""
+    token = _log_context.set({**_log_context.get(), **{k: v for k, v in ids.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the caller's log context and trace id onto the record; must run on the logging thread"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _log_context.get().items():
+            setattr(record, key, value)
+        trace_id = getattr(current_span(), 'trace_id', None)
+        if trace_id is not None:
+            record.trace_id = trace_id
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """
+    Keeps the first and then every Nth DEBUG record per call site; other levels always pass.
+
+    Kept records carry sampled_every=N so counts can be scaled back up.
+    """
+
+    def __init__(self, every: int = Config.LOG_DEBUG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(1, every)
+        self._seen: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.DEBUG or self.every == 1:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+        if seen % self.every:
+            return False
+        record.sampled_every = self.every
+        return True
+
 
-def setup_logging(log_level=logging.INFO):
-    """Set up logging configuration"""
-    # Create logs directory if it doesn't exist
-    os.makedirs('logs', exist_ok=True)
-    
-    # Create formatters
-    file_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    console_formatter = logging.Formatter(
-        '%(levelname)s: %(message)s'
-    )
-    
-    # Create handlers
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(console_formatter)
-    
-    # Create file handler
-    log_file = f'logs/app_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'
-    file_handler = logging.FileHandler(log_file)
-    file_handler.setFormatter(file_formatter)
-    
-    # Configure root logger
+class DeferredQueueHandler(QueueHandler):
+    """
+    Enqueues records without formatting them, so the message is rendered on the listener thread.
+
+    Records whose arguments are mutable (dicts, lists, objects) are rendered
+    here instead, since the caller may change them before the listener runs.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, context ids and any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        for key in ('request_id', 'session_id', 'trace_id', 'sampled_every'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SizedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """TimedRotatingFileHandler that also rolls over once the file reaches max_bytes"""
+
+    def __init__(self, filename: str, max_bytes: int = 0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes <= 0:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+
+    def rotation_filename(self, default_name: str) -> str:
+        # Several size rollovers within one interval share the interval's date suffix; number them
+        name = super().rotation_filename(default_name)
+        candidate, n = name, 0
+        while os.path.exists(candidate):
+            n += 1
+            candidate = f"{name}.{n:03d}"
+        return candidate
+
+
+def setup_logging(
+    log_level: Union[int, str] = Config.LOG_LEVEL,
+    log_dir: Optional[str] = Config.LOG_DIR
+) -> logging.Logger:
+    """
+    Route all logging through a queue to a background listener.
+
+    The request thread only runs the context and sampling filters and
+    enqueues the record; the listener formats it as JSON to a log file that
+    rotates by size and at midnight (log_dir empty disables the file) and as
+    plain text to stdout. Safe to call repeatedly, e.g. from Streamlit reruns.
+    """
+    global _listener
     root_logger = logging.getLogger()
-    root_logger.setLevel(log_level)
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
-    
-    # Configure specific loggers
-    loggers = [
-        'data_processing.process_data',
-        'ingestion.ingest_to_pinecone',
-        'retrieval.retriever',
-        'chatbot.rag_chain'
-    ]
-    
-    for logger_name in loggers:
-        logger = logging.getLogger(logger_name)
-        logger.setLevel(log_level)
-        logger.addHandler(console_handler)
-        logger.addHandler(file_handler)
-    
-    return root_logger 
\ No newline at end of file
+    with _setup_lock:
+        root_logger.setLevel(log_level)
+        if _listener is not None:
+            return root_logger
+
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        handlers = [console_handler]
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+            file_handler = SizedTimedRotatingFileHandler(
+                os.path.join(log_dir, 'app.log'),
+                max_bytes=Config.LOG_MAX_BYTES,
+                when=Config.LOG_ROTATE_WHEN,
+                backupCount=Config.LOG_BACKUP_COUNT,
+                encoding='utf-8'
+            )
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        queue_handler = DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(DebugSampler())
+        queue_handler.addFilter(ContextFilter())
+
+        # Only the root logger has a handler; package loggers propagate to it, so each record is written once
+        for handler in list(root_logger.handlers):
+            root_logger.removeHandler(handler)
+        root_logger.addHandler(queue_handler)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return root_logger
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,332 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import openai
+
+from utils.config import Config
+from utils.tracing import count, current_span, in_current_context
+
+try:
+    from pinecone.errors import PineconeConnectionError
+except ImportError:
+    # Older clients raise urllib3 errors, which are not retried here
+    PineconeConnectionError = ConnectionError
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth another attempt; any other HTTP error means the upstream answered and the request itself is wrong
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+_TRANSPORT_ERRORS = (TimeoutError, ConnectionError, openai.APIConnectionError, PineconeConnectionError)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The stage's deadline passed before an attempt could succeed"""
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream's circuit is open; the call was rejected without being sent"""
+
+
+def parse_deadlines(spec: str) -> Dict[str, float]:
+    """"classification=8,embedding=5" -> {'classification': 8.0, 'embedding': 5.0}"""
+    deadlines = {}
+    for pair in spec.split(','):
+        if '=' in pair:
+            stage, seconds = pair.split('=', 1)
+            deadlines[stage.strip()] = float(seconds)
+    return deadlines
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status of an OpenAI or Pinecone API error, else None"""
+    status = getattr(exc, 'status_code', None) or getattr(exc, 'status', None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, connection failures, throttling and server errors; these also count against the circuit"""
+    return isinstance(exc, _TRANSPORT_ERRORS) or status_code(exc) in RETRYABLE_STATUS
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait (Retry-After-Ms or Retry-After, in seconds or as an HTTP date)"""
+    headers = getattr(getattr(exc, 'response', None), 'headers', None) or getattr(exc, 'headers', None)
+    if not headers:
+        return None
+    headers = {str(k).lower(): v for k, v in headers.items()}
+    try:
+        if headers.get('retry-after-ms'):
+            return max(0.0, float(headers['retry-after-ms']) / 1000)
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one upstream.
+
+    After failure_threshold retryable failures in a row the circuit opens and
+    calls are rejected at once. Once reset_timeout has passed a single probe
+    call is let through (half-open): success closes the circuit, failure
+    opens it for another reset_timeout.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = Config.BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = Config.BREAKER_RESET_SECONDS
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now; in the half-open state only one caller gets True"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def release(self):
+        """The probe was abandoned (e.g. cancelled) without an outcome; let the next caller probe"""
+        with self._lock:
+            self._probing = False
+
+    def _transition(self, state: str):
+        self.state = state
+        count('circuit_breaker_transitions_total', upstream=self.name, state=state)
+        if state == self.OPEN:
+            logger.warning("Circuit for %s opened after %d failures; failing fast for %.0f s", self.name, self.failures, self.reset_timeout)
+        else:
+            logger.info("Circuit for %s is %s", self.name, state)
+
+
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=Config.ASYNC_MAX_CONCURRENCY, thread_name_prefix="hedge")
+        return _hedge_executor
+
+
+class Upstream:
+    """
+    Deadline, retry, hedging and circuit-breaker policy for calls to one upstream service.
+
+    Every attempt is handed the time left until the stage deadline as its
+    timeout= keyword, which the OpenAI and Pinecone clients enforce per
+    request. Retryable failures are retried with full-jitter exponential
+    backoff (or after the server's Retry-After) while the deadline allows.
+    With hedge=True, for idempotent calls only, a second copy is sent when
+    the first is still pending after hedge_after seconds and the first
+    success wins.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        deadlines: Optional[Dict[str, float]] = None,
+        default_deadline: float = Config.UPSTREAM_DEFAULT_DEADLINE,
+        max_attempts: int = Config.UPSTREAM_MAX_ATTEMPTS,
+        backoff_base: float = Config.UPSTREAM_BACKOFF_BASE,
+        backoff_max: float = Config.UPSTREAM_BACKOFF_MAX,
+        hedge_after: float = Config.UPSTREAM_HEDGE_MS / 1000,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.name = name
+        self.deadlines = parse_deadlines(Config.UPSTREAM_DEADLINES) if deadlines is None else deadlines
+        self.default_deadline = default_deadline
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker(name)
+
+    def deadline_for(self, stage: str) -> float:
+        return self.deadlines.get(stage, self.default_deadline)
+
+    def call(self, stage: str, fn: Callable[..., Any], *args, hedge: bool = False, **kwargs) -> Any:
+        """fn(*args, timeout=<seconds left>, **kwargs) under this upstream's policy"""
+        deadline = time.monotonic() + self.deadline_for(stage)
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._admit(stage, deadline)
+            try:
+                if hedge and self.hedge_after > 0:
+                    result = self._hedged(stage, fn, args, kwargs, deadline)
+                else:
+                    result = fn(*args, timeout=timeout, **kwargs)
+            except Exception as e:
+                delay = self._failed(stage, e, attempt, deadline)
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self._succeeded(attempt)
+            return result
+
+    async def acall(self, stage: str, fn: Callable[..., Awaitable], *args, hedge: bool = False, **kwargs) -> Any:
+        """Async call(); fn is a coroutine function, and each attempt is also cancelled at the deadline"""
+        deadline = time.monotonic() + self.deadline_for(stage)
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._admit(stage, deadline)
+            try:
+                if hedge and self.hedge_after > 0:
+                    result = await self._ahedged(stage, fn, args, kwargs, deadline)
+                else:
+                    result = await asyncio.wait_for(fn(*args, timeout=timeout, **kwargs), timeout)
+            except Exception as e:
+                delay = self._failed(stage, e, attempt, deadline)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self._succeeded(attempt)
+            return result
+
+    def _admit(self, stage: str, deadline: float) -> float:
+        """Seconds left for the next attempt; raises when the circuit is open or the deadline has passed"""
+        if not self.breaker.allow():
+            count('circuit_breaker_rejections_total', upstream=self.name, stage=stage)
+            raise CircuitOpenError(f"{self.name} circuit is open; {stage} call rejected")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.breaker.release()
+            raise DeadlineExceeded(f"{self.name} {stage} deadline of {self.deadline_for(stage):g} s exceeded")
+        return remaining
+
+    def _failed(self, stage: str, exc: Exception, attempt: int, deadline: float) -> float:
+        """Record a failed attempt and return the delay before the next one, or re-raise when there is none"""
+        if not is_retryable(exc):
+            # The upstream answered; the request itself was rejected
+            self.breaker.record_success()
+            raise exc
+        self.breaker.record_failure()
+        if attempt >= self.max_attempts:
+            raise exc
+        delay = retry_after(exc)
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        if time.monotonic() + delay >= deadline:
+            raise exc
+        count('upstream_retries_total', upstream=self.name, stage=stage, error=type(exc).__name__)
+        logger.warning("%s %s attempt %d failed (%s); retrying in %.2f s", self.name, stage, attempt, exc, delay)
+        return delay
+
+    def _succeeded(self, attempt: int):
+        self.breaker.record_success()
+        if attempt > 1:
+            current_span().set(attempts=attempt)
+
+    def _hedged(self, stage: str, fn: Callable, args, kwargs, deadline: float) -> Any:
+        executor = _get_hedge_executor()
+
+        def submit() -> Future:
+            return executor.submit(in_current_context(fn), *args, timeout=max(0.001, deadline - time.monotonic()), **kwargs)
+
+        futures = [submit()]
+        done, _ = wait(futures, timeout=min(self.hedge_after, max(0.0, deadline - time.monotonic())))
+        if not done and time.monotonic() < deadline:
+            count('upstream_hedges_total', upstream=self.name, stage=stage)
+            futures.append(submit())
+        # The losing request is left to finish in the background; its result is dropped
+        return _first_success(futures, deadline, stage)
+
+    async def _ahedged(self, stage: str, fn: Callable, args, kwargs, deadline: float) -> Any:
+        def start() -> asyncio.Task:
+            timeout = max(0.001, deadline - time.monotonic())
+            return asyncio.ensure_future(asyncio.wait_for(fn(*args, timeout=timeout, **kwargs), timeout))
+
+        tasks = [start()]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=min(self.hedge_after, max(0.0, deadline - time.monotonic())))
+            if not done and time.monotonic() < deadline:
+                count('upstream_hedges_total', upstream=self.name, stage=stage)
+                tasks.append(start())
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def _first_success(futures: List[Future], deadline: float, stage: str) -> Any:
+    pending, error = set(futures), None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded(f"{stage} deadline exceeded while hedging")
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+_upstreams: Dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name: str) -> Upstream:
+    """Process-wide policy (and circuit) for one upstream, e.g. 'openai' or 'pinecone'"""
+    with _upstreams_lock:
+        upstream = _upstreams.get(name)
+        if upstream is None:
+            upstream = _upstreams[name] = Upstream(name)
+        return upstream
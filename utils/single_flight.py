@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+from utils.config import Config
+from utils.tracing import count, current_span
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form of a question, for keying LLM calls on it"""
+    return ' '.join(text.lower().split())
+
+
+def vector_key(vector: Sequence[float], *parts: Any) -> Tuple[bytes, str]:
+    """Compact key for a query vector plus its query options (top_k, filter, ...)"""
+    digest = hashlib.blake2b(array('f', vector).tobytes(), digest_size=16).digest()
+    return digest, json.dumps(parts, sort_keys=True, default=str)
+
+
+def copy_records(records: Sequence[Dict[str, Any]]) -> list:
+    """share= for results that are lists of dicts: each follower gets its own dicts"""
+    return [dict(record) for record in records]
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class _AsyncFlight:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one upstream request.
+
+    The first caller for a (call, key) pair runs the function; callers that
+    arrive while it is in flight wait for it and get its result (or its
+    exception) instead of sending their own. The entry is dropped as soon as
+    the call finishes, so nothing is cached. do() serves threads, ado()
+    coroutines on any event loop; the two do not share in-flight calls.
+
+    Followers receive share(result) when share is given, so callers that
+    mutate what they get back (product dicts, say) do not see each other's
+    changes. Shared calls are counted per call type in
+    single_flight_calls_total{call, role="leader"|"shared"}; every shared
+    call is an upstream request saved.
+    """
+
+    def __init__(self, enabled: bool = Config.SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._async_flights: Dict[Hashable, _AsyncFlight] = {}
+        self.leaders: Counter = Counter()
+        self.shared: Counter = Counter()
+
+    def do(self, call: str, key: Hashable, fn: Callable[..., Any], *args, share: Optional[Callable] = None, **kwargs) -> Any:
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        flight_key = (call, key)
+        with self._lock:
+            flight = self._flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[flight_key] = _Flight()
+            (self.leaders if leader else self.shared)[call] += 1
+        self._record(call, leader)
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return share(flight.result) if share is not None else flight.result
+
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[flight_key]
+            flight.done.set()
+
+    async def ado(self, call: str, key: Hashable, fn: Callable[..., Awaitable], *args, share: Optional[Callable] = None, **kwargs) -> Any:
+        """
+        do() for coroutines. The call runs as its own task, so one caller being
+        cancelled does not cancel it for the others; it is cancelled only when
+        every caller waiting on it has been.
+        """
+        if not self.enabled:
+            return await fn(*args, **kwargs)
+        flight_key = (asyncio.get_running_loop(), call, key)
+        with self._lock:
+            flight = self._async_flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._async_flights[flight_key] = _AsyncFlight(asyncio.ensure_future(fn(*args, **kwargs)))
+                flight.task.add_done_callback(lambda task: self._forget(flight_key, task))
+            flight.waiters += 1
+            (self.leaders if leader else self.shared)[call] += 1
+        self._record(call, leader)
+
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            with self._lock:
+                flight.waiters -= 1
+                abandoned = flight.waiters == 0
+            if abandoned:
+                flight.task.cancel()
+            raise
+        return share(result) if share is not None and not leader else result
+
+    def _forget(self, flight_key: Hashable, task: asyncio.Future):
+        with self._lock:
+            if self._async_flights.get(flight_key) is not None and self._async_flights[flight_key].task is task:
+                del self._async_flights[flight_key]
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieved here so a call whose callers were all cancelled does not log "never retrieved"
+            logger.debug("Coalesced call failed: %s", task.exception())
+
+    @staticmethod
+    def _record(call: str, leader: bool):
+        if not leader:
+            current_span().set(coalesced=True)
+        count('single_flight_calls_total', call=call, role='leader' if leader else 'shared')
+
+    def stats(self) -> Dict[str, Any]:
+        """Upstream calls made and saved per call type"""
+        with self._lock:
+            return {
+                call: {'calls': self.leaders[call], 'saved': self.shared[call]}
+                for call in sorted(set(self.leaders) | set(self.shared))
+            }
+
+
+_single_flight: Optional[SingleFlight] = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Process-wide coalescer shared by every session's VectorStore and AsyncVectorStore"""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight
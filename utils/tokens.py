@@ -0,0 +1,44 @@
+import logging
+from functools import lru_cache
+
+import tiktoken
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio for English, used when the tiktoken encoding cannot be loaded
+_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads encodings on first use; estimate from length when that is not possible
+        logger.warning(f"tiktoken encoding unavailable, estimating token counts: {str(e)}")
+        return None
+
+
+def count_tokens(text: str, model: str = Config.OPENAI_MODEL) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return -(-len(text) // _CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = Config.OPENAI_MODEL, keep: str = "tail") -> str:
+    """Cut text to at most max_tokens, keeping its head or its tail"""
+    encoding = _encoding(model)
+    if encoding is None:
+        limit = max_tokens * _CHARS_PER_TOKEN
+        return text if len(text) <= limit else (text[-limit:] if keep == "tail" else text[:limit])
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    tokens = tokens[-max_tokens:] if keep == "tail" else tokens[:max_tokens]
+    return encoding.decode(tokens)
@@ -0,0 +1,329 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "cheese_rag_"
+# Span duration histogram buckets in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed operation in a request trace; use as a context manager.
+
+    Entering makes it the parent of spans opened in the same thread or task
+    (and in tasks created from it). On exit its duration feeds the
+    span_duration_seconds histogram and, when a trace file is configured, one
+    JSON line is written with its ids, timing, status and attributes.
+    """
+
+    __slots__ = ('tracer', 'name', 'attributes', 'trace_id', 'span_id', 'parent_id', 'start_time', '_start', '_token',
+                 'duration_ms')
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.duration_ms = None
+
+    def set(self, **attributes):
+        """Attach attributes (result counts, token usage, ...) to the span"""
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = os.urandom(8).hex()
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited from a different context than it was entered in (e.g. a generator resumed elsewhere)
+            pass
+        self.tracer.finish(self, exc)
+        return False
+
+
+class _NoopSpan:
+    """Shared stand-in returned while tracing is disabled"""
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class MetricsRegistry:
+    """Thread-safe counters and span-duration histograms, rendered in the Prometheus text format"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        # span name -> [count per bucket..., count above the last bucket, sum, count]
+        self._durations: Dict[str, List[float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe_duration(self, span_name: str, seconds: float):
+        with self._lock:
+            series = self._durations.get(span_name)
+            if series is None:
+                series = self._durations[span_name] = [0.0] * (len(self.buckets) + 3)
+            # Bucket counts are stored per bucket and accumulated at render time
+            series[bisect_left(self.buckets, seconds)] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters keyed by name{labels} and per-span count and mean duration in ms"""
+        with self._lock:
+            counters = {_series_name(name, labels): value for (name, labels), value in self._counters.items()}
+            spans = {name: {'count': int(s[-1]), 'mean_ms': round(s[-2] / s[-1] * 1000, 2)} for name, s in self._durations.items()}
+        return {'counters': counters, 'spans': spans}
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            durations = sorted((name, list(series)) for name, series in self._durations.items())
+
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}{name}"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f"{_series_name(metric, labels)} {_format_value(value)}")
+
+        if durations:
+            metric = f"{METRIC_PREFIX}span_duration_seconds"
+            lines.append(f"# HELP {metric} Wall time of traced pipeline spans")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, series in durations:
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, series):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{span="{_escape(name)}",le="{bound}"}} {int(cumulative)}')
+                lines.append(f'{metric}_bucket{{span="{_escape(name)}",le="+Inf"}} {int(series[-1])}')
+                lines.append(f'{metric}_sum{{span="{_escape(name)}"}} {series[-2]:.6f}')
+                lines.append(f'{metric}_count{{span="{_escape(name)}"}} {int(series[-1])}')
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._durations.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _series_name(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Tracer:
+    """
+    Nested spans around upstream calls plus counters, exported to Prometheus and a JSONL trace file.
+
+    While disabled, span() returns one shared no-op object and count() returns
+    immediately, so instrumented code pays a flag check per call.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = Config.TRACING_ENABLED,
+        trace_path: Optional[str] = Config.TRACE_PATH,
+        max_bytes: int = Config.TRACE_MAX_BYTES,
+        backup_count: int = Config.TRACE_BACKUP_COUNT
+    ):
+        self.enabled = enabled
+        self.metrics = MetricsRegistry()
+        self._trace_log = None
+        if enabled and trace_path:
+            os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+            handler = RotatingFileHandler(trace_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._trace_log = logging.getLogger(f"{__name__}.spans")
+            self._trace_log.handlers = [handler]
+            self._trace_log.setLevel(logging.INFO)
+            self._trace_log.propagate = False
+
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def finish(self, span: Span, exc: Optional[BaseException]):
+        self.metrics.observe_duration(span.name, span.duration_ms / 1000)
+        if exc is not None:
+            self.metrics.inc('span_errors_total', span=span.name, error=type(exc).__name__)
+        if self._trace_log is not None:
+            record = {
+                'trace_id': span.trace_id,
+                'span_id': span.span_id,
+                'parent_id': span.parent_id,
+                'name': span.name,
+                'start': round(span.start_time, 6),
+                'duration_ms': round(span.duration_ms, 3),
+                'status': 'error' if exc is not None else 'ok',
+                'attributes': span.attributes
+            }
+            if exc is not None:
+                record['error'] = f"{type(exc).__name__}: {exc}"
+            self._trace_log.info(json.dumps(record, default=str))
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer built from Config; also starts the /metrics endpoint when METRICS_PORT is set"""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                tracer = Tracer()
+                if tracer.enabled and Config.METRICS_PORT:
+                    start_metrics_server(tracer, Config.METRICS_PORT)
+                _tracer = tracer
+    return _tracer
+
+
+def span(name: str, **attributes):
+    """Context manager timing one operation as a child of the current span"""
+    tracer = _tracer or get_tracer()
+    if not tracer.enabled:
+        return _NOOP_SPAN
+    return Span(tracer, name, attributes)
+
+
+def count(name: str, value: float = 1, **labels):
+    """Add to a Prometheus counter (exported as cheese_rag_<name>)"""
+    tracer = _tracer or get_tracer()
+    if tracer.enabled:
+        tracer.metrics.inc(name, value, **labels)
+
+
+def current_span():
+    """The innermost open span, or the no-op span when there is none or tracing is off"""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def record_usage(operation: str, response: Any):
+    """Count OpenAI token usage of a completion or embedding response and attach it to the current span"""
+    tracer = _tracer or get_tracer()
+    usage = getattr(response, 'usage', None)
+    if not tracer.enabled or usage is None:
+        return
+    tokens_in = getattr(usage, 'prompt_tokens', 0) or 0
+    tokens_out = getattr(usage, 'completion_tokens', 0) or 0
+    tracer.metrics.inc('llm_tokens_total', tokens_in, operation=operation, direction='in')
+    if tokens_out:
+        tracer.metrics.inc('llm_tokens_total', tokens_out, operation=operation, direction='out')
+    current_span().set(tokens_in=tokens_in, tokens_out=tokens_out)
+
+
+def in_current_context(fn: Callable) -> Callable:
+    """
+    Bind fn to a copy of the caller's context so spans it opens on a worker
+    thread nest under the caller's span (and its log records keep the caller's
+    request ids). Bind once per submitted call.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def with_current_context(coro: Awaitable) -> Awaitable:
+    """
+    Wrap a coroutine handed to another thread's event loop so it sees the caller's
+    context variables: its spans nest under the caller's span and its log records
+    carry the caller's request and session ids.
+    """
+    context = contextvars.copy_context()
+
+    async def run():
+        # The task running this wrapper has its own context, so the values stay local to it
+        for var, value in context.items():
+            var.set(value)
+        return await coro
+    return run()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    tracer: Tracer = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.tracer.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(tracer: Optional[Tracer] = None, port: int = Config.METRICS_PORT, host: str = Config.METRICS_HOST):
+    """Serve GET /metrics in the Prometheus text format from a daemon thread; returns the server or None"""
+    global _metrics_server
+    if _metrics_server is not None:
+        return _metrics_server
+    handler = type('MetricsHandler', (_MetricsHandler,), {'tracer': tracer or get_tracer()})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        logger.error(f"Could not start the metrics endpoint on {host}:{port}: {str(e)}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True).start()
+    logger.info(f"Serving Prometheus metrics on http://{host}:{server.server_address[1]}/metrics")
+    _metrics_server = server
+    return server